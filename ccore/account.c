@@ -5,6 +5,8 @@
 #include "amount.h"
 #include "util.h"
 
+static unsigned int g_keys_version = 0;
+
 /* Account public */
 void
 account_init(
@@ -108,6 +110,18 @@ account_name_set(Account *account, const char *name)
     g_free(s);
 }
 
+void
+account_keys_changed(void)
+{
+    g_keys_version++;
+}
+
+unsigned int
+account_keys_version(void)
+{
+    return g_keys_version;
+}
+
 void
 account_normalize_amount(Account *account, Amount *dst)
 {
@@ -68,6 +68,21 @@ account_is_income_statement(Account *account);
 void
 account_name_set(Account *account, const char *name);
 
+/* Signals that the name, reference or account number of an account changed.
+ *
+ * AccountList keeps lookup indexes that it updates itself on create, rename,
+ * remove and undelete. When those fields are changed directly on an account
+ * that is already in a list, this has to be called so that lists know their
+ * indexes are stale.
+ */
+void
+account_keys_changed(void);
+
+/* Returns a number that changes whenever account_keys_changed() is called.
+ */
+unsigned int
+account_keys_version(void);
+
 void
 account_normalize_amount(Account *account, Amount *dst);
 
@@ -9,11 +9,96 @@ static void
 _add(AccountList *accounts, Account *account)
 {
     accounts->count++;
-    accounts->accounts = realloc(
-        accounts->accounts, sizeof(Account*) * accounts->count);
+    vec_resize(
+        (void **)&accounts->accounts,
+        sizeof(Account*),
+        accounts->count,
+        &accounts->capacity);
     accounts->accounts[accounts->count-1] = account;
 }
 
+static const char*
+_name_key_of(const Account *account)
+{
+    return account->name_key;
+}
+
+static const char*
+_number_of(const Account *account)
+{
+    return account->account_number;
+}
+
+static const char*
+_reference_of(const Account *account)
+{
+    // Empty references never match anything.
+    if (account->reference == NULL || account->reference[0] == '\0') {
+        return NULL;
+    }
+    return account->reference;
+}
+
+static void
+_index_insert(GHashTable *index, const char *key, Account *account)
+{
+    // The first account having a key wins, like it would in a linear search.
+    if (key != NULL && !g_hash_table_contains(index, key)) {
+        g_hash_table_insert(index, g_strdup(key), account);
+    }
+}
+
+/* Removes `account` from `index`.
+ *
+ * If another account in the list has the same key, it takes its place in the
+ * index.
+ */
+static void
+_index_remove(
+    AccountList *accounts,
+    GHashTable *index,
+    const char* (*key_of)(const Account *),
+    Account *account)
+{
+    const char *key = key_of(account);
+    if (key == NULL || g_hash_table_lookup(index, key) != account) {
+        return;
+    }
+    g_hash_table_remove(index, key);
+    for (int i=0; i<accounts->indexed; i++) {
+        Account *a = accounts->accounts[i];
+        const char *other = key_of(a);
+        if (a != account && other != NULL && strcmp(key, other) == 0) {
+            g_hash_table_insert(index, g_strdup(key), a);
+            break;
+        }
+    }
+}
+
+/* Brings our indexes up to date.
+ *
+ * Indexes are rebuilt from scratch if account keys were changed behind our
+ * back. Otherwise, we only index accounts added since the last sync.
+ */
+static void
+_index_sync(AccountList *accounts)
+{
+    unsigned int version = account_keys_version();
+    if (accounts->keys_version != version) {
+        g_hash_table_remove_all(accounts->name_index);
+        g_hash_table_remove_all(accounts->number_index);
+        g_hash_table_remove_all(accounts->reference_index);
+        accounts->indexed = 0;
+        accounts->keys_version = version;
+    }
+    for (; accounts->indexed<accounts->count; accounts->indexed++) {
+        Account *a = accounts->accounts[accounts->indexed];
+        _index_insert(accounts->name_index, _name_key_of(a), a);
+        _index_insert(accounts->number_index, _number_of(a), a);
+        _index_insert(accounts->reference_index, _reference_of(a), a);
+    }
+}
+
 void
 _trashcan_free(gpointer data, gpointer user_data)
 {
@@ -29,10 +114,19 @@ accounts_init(AccountList *accounts, Currency *default_currency)
     accounts->default_currency = default_currency;
     accounts->accounts = NULL;
     accounts->count = 0;
+    accounts->capacity = 0;
     accounts->a2entries = g_hash_table_new(g_str_hash, g_str_equal);
     // don't set a free func: unlike what the doc says, it's called on more
     // occasions than free(): it's called on remove() too. we don't want that.
     accounts->trashcan = g_ptr_array_new();
+    accounts->name_index = g_hash_table_new_full(
+        g_str_hash, g_str_equal, g_free, NULL);
+    accounts->number_index = g_hash_table_new_full(
+        g_str_hash, g_str_equal, g_free, NULL);
+    accounts->reference_index = g_hash_table_new_full(
+        g_str_hash, g_str_equal, g_free, NULL);
+    accounts->indexed = 0;
+    accounts->keys_version = account_keys_version();
 }
 
 void
@@ -42,6 +136,7 @@ accounts_deinit(AccountList *accounts)
     g_hash_table_iter_init(&iter, accounts->a2entries);
     gpointer _, entries;
     while (g_hash_table_iter_next(&iter, &_, &entries)) {
+        entries_deinit(entries);
         free(entries);
     }
     g_hash_table_destroy(accounts->a2entries);
@@ -53,6 +148,9 @@ accounts_deinit(AccountList *accounts)
     free(accounts->accounts);
     g_ptr_array_foreach(accounts->trashcan, _trashcan_free, NULL);
     g_ptr_array_free(accounts->trashcan, true);
+    g_hash_table_destroy(accounts->name_index);
+    g_hash_table_destroy(accounts->number_index);
+    g_hash_table_destroy(accounts->reference_index);
 }
 
 bool
@@ -92,6 +190,7 @@ accounts_entries_for_account(AccountList *accounts, Account *account)
 bool
 accounts_remove(AccountList *accounts, Account *target)
 {
+    _index_sync(accounts);
     int index = -1;
     for (int i=0; i<accounts->count; i++) {
         if (accounts->accounts[i] == target) {
@@ -109,9 +208,22 @@ accounts_remove(AccountList *accounts, Account *target)
         &accounts->accounts[index+1],
         sizeof(Account*) * (accounts->count - index - 1));
     accounts->count--;
-    accounts->accounts = realloc(
-        accounts->accounts, sizeof(Account*) * accounts->count);
+    vec_resize(
+        (void **)&accounts->accounts,
+        sizeof(Account*),
+        accounts->count,
+        &accounts->capacity);
+    accounts->indexed = accounts->count;
+    _index_remove(accounts, accounts->name_index, _name_key_of, target);
+    _index_remove(accounts, accounts->number_index, _number_of, target);
+    _index_remove(accounts, accounts->reference_index, _reference_of, target);
     g_ptr_array_add(accounts->trashcan, target);
+    // The oven won't clear these entries anymore, but the txns they refer to
+    // can go away. Spawns do on the next cook.
+    EntryList *entries = g_hash_table_lookup(accounts->a2entries, target->name);
+    if (entries != NULL) {
+        entries_clear(entries, 0);
+    }
     return true;
 }
 
@@ -126,7 +238,13 @@ accounts_rename(AccountList *accounts, Account *target, const char *newname)
     if (entries != NULL) {
         g_hash_table_remove(accounts->a2entries, target->name);
     }
+    bool indexed = target->name_key != NULL &&
+        g_hash_table_lookup(accounts->name_index, target->name_key) == target;
+    _index_remove(accounts, accounts->name_index, _name_key_of, target);
     account_name_set(target, newname);
+    if (indexed) {
+        _index_insert(accounts->name_index, _name_key_of(target), target);
+    }
     if (entries != NULL) {
         g_hash_table_insert(accounts->a2entries, target->name, entries);
     }
@@ -144,12 +262,12 @@ accounts_undelete(AccountList *accounts, Account *target)
 }
 
 Account *
-accounts_find_by_name(const AccountList *accounts, const char *name)
+accounts_find_by_name(AccountList *accounts, const char *name)
 {
     if (name == NULL) {
         return NULL;
     }
-    Account *res = NULL;
+    _index_sync(accounts);
     char *dst = NULL;
     const char *trimmed;
     if (strstrip(&dst, name)) {
@@ -160,15 +278,22 @@ accounts_find_by_name(const AccountList *accounts, const char *name)
     gchar *casefold = g_utf8_casefold(trimmed, -1);
     gchar *key = g_utf8_collate_key(casefold, -1);
     g_free(casefold);
-    for (int i=0; i<accounts->count; i++) {
-        Account *a = accounts->accounts[i];
-        if (strcmp(key, a->name_key) == 0) {
-            res = a;
-            break;
-        }
-        if (a->account_number != NULL && strcmp(trimmed, a->account_number) == 0) {
-            res = a;
-            break;
+    Account *res = g_hash_table_lookup(accounts->name_index, key);
+    Account *by_number = g_hash_table_lookup(accounts->number_index, trimmed);
+    if (res == NULL) {
+        res = by_number;
+    } else if (by_number != NULL && by_number != res) {
+        // The name of one account matches the number of another. Return the
+        // first one in the list.
+        for (int i=0; i<accounts->count; i++) {
+            Account *a = accounts->accounts[i];
+            if (a == res) {
+                break;
+            }
+            if (a == by_number) {
+                res = by_number;
+                break;
+            }
         }
     }
     if (dst != NULL) {
@@ -179,16 +304,11 @@ accounts_find_by_name(const AccountList *accounts, const char *name)
 }
 
 Account*
-accounts_find_by_reference(const AccountList *accounts, const char *reference)
+accounts_find_by_reference(AccountList *accounts, const char *reference)
 {
     if ((reference == NULL) || (strlen(reference) == 0)) {
         return NULL;
     }
-    for (int i=0; i<accounts->count; i++) {
-        Account *a = accounts->accounts[i];
-        if (strcmp(reference, a->reference) == 0) {
-            return a;
-        }
-    }
-    return NULL;
+    _index_sync(accounts);
+    return g_hash_table_lookup(accounts->reference_index, reference);
 }
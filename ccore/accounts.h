@@ -7,10 +7,23 @@
 typedef struct {
     Currency *default_currency;
     int count;
+    // Allocated size of `accounts`. See vec_capacity().
+    unsigned int capacity;
     Account **accounts;
     GHashTable *a2entries;
     // Where we put our deleted accounts so that we can undelete them
     GPtrArray *trashcan;
+    // Lookup indexes for the accounts_find_*() functions. They map a
+    // `name_key`, `account_number` or `reference` to the first account in
+    // `accounts` having it. Only the first `indexed` accounts are in there:
+    // accounts_create() returns an account that isn't initialized yet, so new
+    // accounts are indexed on the next lookup.
+    GHashTable *name_index;
+    GHashTable *number_index;
+    GHashTable *reference_index;
+    int indexed;
+    // account_keys_version() at the time we built our indexes.
+    unsigned int keys_version;
 } AccountList;
 
 void
@@ -45,9 +58,9 @@ accounts_undelete(AccountList *accounts, Account *torestore);
  * NOTE: can return a deleted account
  */
 Account*
-accounts_find_by_name(const AccountList *accounts, const char *name);
+accounts_find_by_name(AccountList *accounts, const char *name);
 
 // Doesn't search in deleted accounts
 Account*
-accounts_find_by_reference(const AccountList *accounts, const char *reference);
+accounts_find_by_reference(AccountList *accounts, const char *reference);
 
@@ -0,0 +1,49 @@
+#pragma once
+
+/* Binary moneyGuru documents
+ *
+ * This is a compact alternative to the XML format of save_native(). It holds
+ * the same data, but its strings are stored once and it stores dates and
+ * amounts as integers. A file is made of:
+ *
+ * - BINARY_MAGIC, without its terminating NUL
+ * - the format version, BINARY_VERSION
+ * - the string table: its string count, then each string as its byte length,
+ *   its UTF-8 bytes and a NUL byte
+ * - the document id (string)
+ * - properties: default currency code (string), first_weekday, ahead_months,
+ *   year_start_month (signed)
+ * - accounts: their count, then for each of them: name (string), currency
+ *   code (string), type, group, reference, account_number (strings),
+ *   inactive (0 or 1), notes (string)
+ * - transactions: their count, then each transaction (see below)
+ * - schedules: their count, then for each of them: repeat type, repeat every,
+ *   stop date (optional date), reference transaction, the count of deleted
+ *   spawn dates followed by these dates (day numbers), the count of global
+ *   changes followed by, for each of them, its date (day number) and its
+ *   transaction.
+ *
+ * A transaction is: its date (signed, in days from the date of the previous
+ * transaction of the same schedule or, for top-level transactions, of the
+ * previous top-level transaction, starting from day 0), mtime (signed),
+ * description, payee, checkno, notes
+ * (strings), its split count and its splits. A split is: account name
+ * (string), amount currency code (string), amount value (signed, in the
+ * fixed-point representation of Amount), memo, reference (strings) and
+ * reconciliation date (optional, as a signed offset from the transaction's
+ * date).
+ *
+ * All integers are varints: 7 bits per byte, least significant bits first,
+ * the high bit set on all bytes but the last. Signed integers are zigzag
+ * encoded first. A string is its index in the string table plus one. 0 means
+ * NULL. Day numbers are Julian days (1 is January 1st of year 1). An optional
+ * date is 0 when there's no date, otherwise it's its value (zigzag encoded if
+ * signed) plus one.
+ *
+ * Transactions are stored in the order of their list, like in save_native(),
+ * so that their position is kept through a save and load.
+ */
+
+#define BINARY_MAGIC "MGBINDOC"
+#define BINARY_MAGIC_LEN 8
+#define BINARY_VERSION 1
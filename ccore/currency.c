@@ -11,15 +11,35 @@
 
 #define CURRENCY_REGISTRY_BLOCK 100
 #define DATE_LEN 8
-#define MAX_SQL_LEN 512
-#define SQL_RES_LEN 512
+
+typedef enum {
+    STMT_LOAD = 0,
+    STMT_SET,
+    STMT_RANGE,
+    STMT_BEGIN,
+    STMT_COMMIT,
+    STMT_ROLLBACK,
+    STMT_COUNT
+} StmtID;
 
 static sqlite3 *g_db = NULL;
+// Statements are compiled on first use and kept until g_db is closed.
+static const char *g_stmt_sql[STMT_COUNT] = {
+    "select date, rate from rates where currency = ? order by date",
+    "replace into rates(date, currency, rate) values(?, ?, ?)",
+    "select min(date), max(date) from rates where currency = ?",
+    "begin",
+    "commit",
+    "rollback",
+};
+static sqlite3_stmt *g_stmts[STMT_COUNT] = {0};
 // Currencies are allocated in block. Whether a "slot" is registered is
 // determined by whether its code starts with '\0'
 static Currency *g_currencies = NULL;
 static unsigned int g_currencies_count = 0;
 static unsigned int g_currencies_max = 0;
+// Bumped every time a currency's rates are invalidated.
+static unsigned int g_rates_version = 0;
 
 // Private
 
@@ -39,65 +59,133 @@ str2date(const char *s)
     return mktime(&date);
 }
 
+// Returns prepared statement `id`, reset and ready to be bound, or NULL if
+// it can't be compiled. Callers reset it when they're done stepping so that
+// it doesn't hold a read transaction open.
+static sqlite3_stmt*
+db_stmt(StmtID id)
+{
+    sqlite3_stmt *stmt = g_stmts[id];
+
+    if (stmt == NULL) {
+        if (sqlite3_prepare_v2(g_db, g_stmt_sql[id], -1, &stmt, NULL) != SQLITE_OK) {
+            return NULL;
+        }
+        g_stmts[id] = stmt;
+    } else {
+        sqlite3_reset(stmt);
+        sqlite3_clear_bindings(stmt);
+    }
+    return stmt;
+}
+
+// Runs a prepared statement that takes no argument and returns no row.
 static bool
-sqlite_getsingle_double(const char *sql, double *result)
+db_exec(StmtID id)
 {
-    sqlite3_stmt *stmt;
+    sqlite3_stmt *stmt = db_stmt(id);
     int rc;
 
-    rc = sqlite3_prepare_v2(g_db, sql, -1, &stmt, NULL);
-    if (rc != SQLITE_OK) {
+    if (stmt == NULL) {
         return false;
     }
     rc = sqlite3_step(stmt);
-    if (rc != SQLITE_ROW) {
-        sqlite3_finalize(stmt);
-        return false;
+    sqlite3_reset(stmt);
+    return rc == SQLITE_DONE;
+}
+
+static void
+db_close(void)
+{
+    for (int i=0; i<STMT_COUNT; i++) {
+        sqlite3_finalize(g_stmts[i]);
+        g_stmts[i] = NULL;
     }
-    if (sqlite3_column_type(stmt, 0) != SQLITE_FLOAT) {
-        sqlite3_finalize(stmt);
-        return false;
+    sqlite3_close(g_db);
+    g_db = NULL;
+}
+
+static int
+date2key(const time_t date)
+{
+    struct tm *t = gmtime(&date);
+    return (t->tm_year + 1900) * 10000 + (t->tm_mon + 1) * 100 + t->tm_mday;
+}
+
+static void
+rates_invalidate(Currency *currency)
+{
+    free(currency->rates);
+    currency->rates = NULL;
+    currency->ratecount = 0;
+    currency->rates_loaded = false;
+    g_rates_version++;
+}
+
+static void
+rates_invalidate_all(void)
+{
+    for (unsigned int i=0; i<g_currencies_count; i++) {
+        rates_invalidate(&g_currencies[i]);
     }
-    *result = sqlite3_column_double(stmt, 0);
-    sqlite3_finalize(stmt);
-    return true;
 }
 
+// Loads all rates of `currency` from the DB, sorted by date.
 static bool
-sqlite_getsingle_text(const char *sql, char *result)
+rates_load(Currency *currency)
 {
     sqlite3_stmt *stmt;
+    CurrencyRate *rates = NULL;
+    unsigned int count = 0;
+    unsigned int capacity = 0;
     int rc;
-    const unsigned char *buf;
 
-    rc = sqlite3_prepare_v2(g_db, sql, -1, &stmt, NULL);
-    if (rc != SQLITE_OK) {
+    stmt = db_stmt(STMT_LOAD);
+    if (stmt == NULL) {
         return false;
     }
-    rc = sqlite3_step(stmt);
-    if (rc != SQLITE_ROW) {
-        sqlite3_finalize(stmt);
-        return false;
+    sqlite3_bind_text(stmt, 1, currency->code, -1, SQLITE_TRANSIENT);
+    while ((rc = sqlite3_step(stmt)) == SQLITE_ROW) {
+        const char *strdate = (const char *)sqlite3_column_text(stmt, 0);
+        if (strdate == NULL) {
+            continue;
+        }
+        if (sqlite3_column_type(stmt, 1) != SQLITE_FLOAT) {
+            continue;
+        }
+        if (count == capacity) {
+            capacity = capacity ? capacity * 2 : 64;
+            CurrencyRate *tmp = realloc(rates, capacity * sizeof(CurrencyRate));
+            if (tmp == NULL) {
+                free(rates);
+                sqlite3_reset(stmt);
+                return false;
+            }
+            rates = tmp;
+        }
+        rates[count].key = atoi(strdate);
+        rates[count].rate = sqlite3_column_double(stmt, 1);
+        count++;
     }
-    buf = sqlite3_column_text(stmt, 0);
-    if (buf == NULL) {
-        sqlite3_finalize(stmt);
+    sqlite3_reset(stmt);
+    if (rc != SQLITE_DONE) {
+        free(rates);
         return false;
     }
-    strncpy(result, (const char *)buf, SQL_RES_LEN);
-    sqlite3_finalize(stmt);
+    // Loading doesn't change rates, it only caches them. We don't go through
+    // rates_invalidate() because it would bump g_rates_version.
+    free(currency->rates);
+    currency->rates = rates;
+    currency->ratecount = count;
+    currency->rates_loaded = true;
     return true;
 }
 
 static CurrencyResult
 seek_value_in_CAD(time_t date, Currency *currency, double *result)
 {
-    char strdate[DATE_LEN + 1];
-    char sql[MAX_SQL_LEN + 1];
-    char *sqlfmt = "select rate from rates "
-        "where date %s '%s' and currency = '%s' "
-        "order by date %s limit 1";
-    double rate;
+    unsigned int lo, hi;
+    int key;
 
     if (strncmp(currency->code, "CAD", CURRENCY_CODE_MAXLEN) == 0) {
         *result = 1;
@@ -111,19 +199,27 @@ seek_value_in_CAD(time_t date, Currency *currency, double *result)
         *result = currency->latest_rate;
         return CURRENCY_OK;
     }
-    date2str(strdate, date);
-    snprintf(
-        sql, MAX_SQL_LEN, sqlfmt,
-        "<=", strdate, currency->code, "desc");
-    if (!sqlite_getsingle_double(sql, &rate)) {
-        snprintf(
-            sql, MAX_SQL_LEN, sqlfmt,
-            ">=", strdate, currency->code, "");
-        if (!sqlite_getsingle_double(sql, &rate)) {
-            return CURRENCY_NORESULT;
+    if (!currency->rates_loaded && !rates_load(currency)) {
+        return CURRENCY_NORESULT;
+    }
+    if (!currency->ratecount) {
+        return CURRENCY_NORESULT;
+    }
+    // Find the first rate with a date higher than `date`. The one before is
+    // the nearest earlier rate. If there's none, we take the nearest later
+    // rate.
+    key = date2key(date);
+    lo = 0;
+    hi = currency->ratecount;
+    while (lo < hi) {
+        unsigned int mid = (lo + hi) / 2;
+        if (currency->rates[mid].key <= key) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
         }
     }
-    *result = rate;
+    *result = currency->rates[lo > 0 ? lo - 1 : 0].rate;
     return CURRENCY_OK;
 }
 
@@ -141,9 +237,10 @@ currency_global_init(char *dbpath)
     }
     if (g_db != NULL) {
         // We already have an opened DB. close it first.
-        sqlite3_close(g_db);
-        g_db = NULL;
+        db_close();
     }
+    // Whatever we had in memory came from another DB.
+    rates_invalidate_all();
     res = sqlite3_open(dbpath, &g_db);
     if (res) {
         sqlite3_close(g_db);
@@ -161,6 +258,9 @@ currency_global_init(char *dbpath)
             "create unique index idx_rate on rates (date, currency)",
             NULL, NULL, NULL);
     }
+    // Rates are written in batches by the fetching process. In WAL mode, a
+    // batch costs a single sync.
+    sqlite3_exec(g_db, "pragma journal_mode=wal", NULL, NULL, NULL);
     return CURRENCY_OK;
 }
 
@@ -172,6 +272,7 @@ currency_global_reset_currencies(void)
         // want to keep our 3 main currency instances. Flush the rest of the
         // list
         for (unsigned int i=3; i<g_currencies_count; i++) {
+            rates_invalidate(&g_currencies[i]);
             g_currencies[i].code[0] = '\0';
         }
         g_currencies_count = 3;
@@ -211,10 +312,10 @@ void
 currency_global_deinit(void)
 {
     if (g_db != NULL) {
-        sqlite3_close(g_db);
-        g_db = NULL;
+        db_close();
     }
     if (g_currencies != NULL) {
+        rates_invalidate_all();
         free(g_currencies);
     }
 }
@@ -256,6 +357,9 @@ currency_register(
     cur->start_rate = start_rate;
     cur->stop_date = stop_date;
     cur->latest_rate = latest_rate;
+    cur->rates = NULL;
+    cur->ratecount = 0;
+    cur->rates_loaded = false;
     g_currencies_count++;
     return cur;
 }
@@ -309,45 +413,76 @@ currency_getrate(time_t date, Currency *c1, Currency *c2, double *result)
 void
 currency_set_CAD_value(time_t date, Currency *currency, double value)
 {
-    char strdate[DATE_LEN + 1];
-    char sql[MAX_SQL_LEN + 1];
-
-    date2str(strdate, date);
-    snprintf(
-        sql, MAX_SQL_LEN,
-        "replace into rates(date, currency, rate) values('%s', '%s', %0.6f)",
-        strdate, currency->code, value);
-    sqlite3_exec(g_db, sql, NULL, NULL, NULL);
-    sqlite3_exec(g_db, "commit", NULL, NULL, NULL);
+    currency_set_CAD_values(currency, &date, &value, 1);
 }
 
 bool
-currency_daterange(Currency *currency, time_t *start, time_t *stop)
+currency_set_CAD_values(
+    Currency *currency,
+    const time_t *dates,
+    const double *values,
+    unsigned int count)
 {
-    char sql[MAX_SQL_LEN + 1];
-    char buf[SQL_RES_LEN + 1] = {0};
-
-    snprintf(
-        sql, MAX_SQL_LEN,
-        "select min(date) from rates where currency = '%s'",
-        currency->code);
-    if (!sqlite_getsingle_text(sql, buf)) {
-        return false;
+    sqlite3_stmt *stmt;
+    char strdate[DATE_LEN + 1];
+
+    if (!count) {
+        return true;
     }
-    *start = str2date(buf);
-    if (!*start) {
+    // Whatever happens below, our in-memory copy can't be trusted anymore.
+    rates_invalidate(currency);
+    if (!db_exec(STMT_BEGIN)) {
         return false;
     }
-    snprintf(
-        sql, MAX_SQL_LEN,
-        "select max(date) from rates where currency = '%s'",
-        currency->code);
-    if (!sqlite_getsingle_text(sql, buf)) {
+    stmt = db_stmt(STMT_SET);
+    if (stmt == NULL) {
+        db_exec(STMT_ROLLBACK);
         return false;
     }
-    *stop = str2date(buf);
-    if (!*stop) {
+    for (unsigned int i=0; i<count; i++) {
+        date2str(strdate, dates[i]);
+        sqlite3_bind_text(stmt, 1, strdate, -1, SQLITE_TRANSIENT);
+        sqlite3_bind_text(stmt, 2, currency->code, -1, SQLITE_TRANSIENT);
+        sqlite3_bind_double(stmt, 3, values[i]);
+        if (sqlite3_step(stmt) != SQLITE_DONE) {
+            sqlite3_reset(stmt);
+            db_exec(STMT_ROLLBACK);
+            return false;
+        }
+        sqlite3_reset(stmt);
+    }
+    return db_exec(STMT_COMMIT);
+}
+
+bool
+currency_daterange(Currency *currency, time_t *start, time_t *stop)
+{
+    sqlite3_stmt *stmt;
+    const char *buf1 = NULL;
+    const char *buf2 = NULL;
+    bool res = false;
+
+    stmt = db_stmt(STMT_RANGE);
+    if (stmt == NULL) {
         return false;
     }
-    return true;
+    sqlite3_bind_text(stmt, 1, currency->code, -1, SQLITE_TRANSIENT);
+    if (sqlite3_step(stmt) == SQLITE_ROW) {
+        // min() and max() are NULL when the currency has no rate.
+        buf1 = (const char *)sqlite3_column_text(stmt, 0);
+        buf2 = (const char *)sqlite3_column_text(stmt, 1);
+    }
+    if (buf1 != NULL && buf2 != NULL) {
+        *start = str2date(buf1);
+        *stop = str2date(buf2);
+        res = *start && *stop;
+    }
+    sqlite3_reset(stmt);
+    return res;
+}
+
+unsigned int
+currency_rates_version(void)
+{
+    return g_rates_version;
 }
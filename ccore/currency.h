@@ -5,6 +5,14 @@
 #define CURRENCY_CODE_MAXLEN 4
 #define CURRENCY_MAX_EXPONENT 10
 
+/* A row of the rates DB, in memory. `key` is the date as YYYYMMDD, the same
+ * way it's stored in the DB.
+ */
+typedef struct {
+    int key;
+    double rate;
+} CurrencyRate;
+
 typedef struct {
     char code[CURRENCY_CODE_MAXLEN+1];
     unsigned int exponent;
@@ -12,6 +20,11 @@ typedef struct {
     double start_rate;
     time_t stop_date;
     double latest_rate;
+    // In-memory copy of the rates DB rows for this currency, sorted by date.
+    // Loaded on first lookup and dropped whenever the DB changes.
+    CurrencyRate *rates;
+    unsigned int ratecount;
+    bool rates_loaded;
 } Currency;
 
 typedef enum {
@@ -47,5 +60,25 @@ currency_getrate(time_t date, Currency *c1, Currency *c2, double *result);
 void
 currency_set_CAD_value(time_t date, Currency *currency, double value);
 
+/* Sets `count` daily values in CAD for `currency` in a single DB transaction.
+ *
+ * If any of the writes fails, the whole batch is rolled back and false is
+ * returned.
+ */
+bool
+currency_set_CAD_values(
+    Currency *currency,
+    const time_t *dates,
+    const double *values,
+    unsigned int count);
+
 bool
 currency_daterange(Currency *currency, time_t *start, time_t *stop);
+
+/* Returns a number that changes whenever rates change.
+ *
+ * Callers caching converted amounts compare it to the value they had when
+ * they converted to know whether their cache is stale.
+ */
+unsigned int
+currency_rates_version(void);
@@ -1,5 +1,7 @@
 #include <stdlib.h>
+#include <string.h>
 #include "entry.h"
+#include "util.h"
 
 void
 entry_init(Entry *entry, Split *split, Transaction *txn)
@@ -96,14 +98,15 @@ _entry_qsort_cmp(const void *a, const void *b)
 }
 
 static void
-_entries_maybe_set_last_reconciled(EntryList *entries, Entry *entry)
+_entries_maybe_set_last_reconciled(EntryList *entries, int index)
 {
+    Entry *entry = &entries->entries[index];
     if (entry->split->reconciliation_date != 0) {
-        if (entries->last_reconciled == NULL) {
-            entries->last_reconciled = entry;
+        if (entries->last_reconciled < 0) {
+            entries->last_reconciled = index;
         } else {
             bool replace = false;
-            Entry *old = entries->last_reconciled;
+            Entry *old = &entries->entries[entries->last_reconciled];
             if (entry->split->reconciliation_date != old->split->reconciliation_date) {
                 if (entry->split->reconciliation_date > old->split->reconciliation_date) {
                     replace = true;
@@ -120,21 +123,67 @@ _entries_maybe_set_last_reconciled(EntryList *entries, Entry *entry)
                 replace = true;
             }
             if (replace) {
-                entries->last_reconciled = entry;
+                entries->last_reconciled = index;
             }
         }
     }
 }
 
+static void
+_flow_reset(EntryFlow *flow, Currency *currency)
+{
+    flow->currency = currency;
+    flow->rates_version = currency_rates_version();
+    flow->count = 0;
+}
+
+// Adds the running sums of the entries that `flow` doesn't cover yet. If rates
+// changed since we last converted, we start over.
+static bool
+_flow_update(EntryFlow *flow, const EntryList *entries)
+{
+    if (flow->rates_version != currency_rates_version()) {
+        _flow_reset(flow, flow->currency);
+    }
+    if (flow->count >= entries->count) {
+        return true;
+    }
+    // Like entries, sums only grow. vec_resize() would shrink them after
+    // entries_clear().
+    if (entries->count + 1 > flow->capacity && !vec_resize(
+            (void **)&flow->sums,
+            sizeof(int64_t),
+            entries->count + 1,
+            &flow->capacity)) {
+        return false;
+    }
+    if (flow->count == 0) {
+        flow->sums[0] = 0;
+    }
+    Amount a;
+    for (int i=flow->count; i<entries->count; i++) {
+        Entry *entry = &entries->entries[i];
+        a.currency = flow->currency;
+        if (!amount_convert(&a, &entry->split->amount, entry->txn->date)) {
+            return false;
+        }
+        flow->sums[i+1] = flow->sums[i] + a.val;
+        flow->count = i + 1;
+    }
+    return true;
+}
+
 /* EntryList Public*/
 void
 entries_init(EntryList *entries, Account *account)
 {
     entries->count = 0;
+    entries->capacity = 0;
     entries->cooked_until = 0;
     entries->entries = NULL;
-    entries->last_reconciled = NULL;
+    entries->last_reconciled = -1;
     entries->account = account;
+    memset(entries->flows, 0, sizeof(entries->flows));
 }
 
 void
@@ -143,19 +192,26 @@ entries_deinit(EntryList *entries)
     entries_clear(entries, 0);
     entries->count = 0;
     entries->cooked_until = 0;
-    entries->last_reconciled = NULL;
+    entries->last_reconciled = -1;
     entries->account = NULL;
     free(entries->entries);
+    entries->entries = NULL;
+    entries->capacity = 0;
+    for (int i=0; i<2; i++) {
+        free(entries->flows[i].sums);
+    }
+    memset(entries->flows, 0, sizeof(entries->flows));
 }
 
 bool
 entries_balance_of_reconciled(const EntryList *entries, Amount *dst)
 {
-    if (entries->last_reconciled == NULL) {
+    if (entries->last_reconciled < 0) {
         dst->val = 0;
         return false;
     } else {
-        amount_copy(dst, &entries->last_reconciled->reconciled_balance);
+        Entry *entry = &entries->entries[entries->last_reconciled];
+        amount_copy(dst, &entry->reconciled_balance);
         return true;
     }
 }
@@ -180,7 +236,7 @@ entries_balance(const EntryList *entries, Amount *dst, time_t date)
         return false;
     }
     if (index >= 0) {
-        Entry *entry = entries->entries[index];
+        Entry *entry = &entries->entries[index];
         Amount *src = &entry->balance;
         if (date > 0) {
             if (amount_convert(dst, src, date)) {
@@ -199,25 +255,62 @@ entries_balance(const EntryList *entries, Amount *dst, time_t date)
 }
 
 bool
-entries_cash_flow(
+entries_balance_series(
     const EntryList *entries,
+    Currency *currency,
+    const time_t *dates,
+    unsigned int count,
+    int64_t *dst)
+{
+    if (entries->cooked_until == 0) {
+        memset(dst, 0, sizeof(int64_t) * count);
+        return true;
+    }
+    int index = 0;
+    Amount a;
+    for (unsigned int i=0; i<count; i++) {
+        while (index < entries->count && entries->entries[index].txn->date <= dates[i]) {
+            index++;
+        }
+        if (index == 0) {
+            dst[i] = 0;
+            continue;
+        }
+        if (index > entries->cooked_until) {
+            // Something's wrong
+            return false;
+        }
+        a.currency = currency;
+        if (!amount_convert(&a, &entries->entries[index-1].balance, dates[i])) {
+            return false;
+        }
+        dst[i] = a.val;
+    }
+    return true;
+}
+
+bool
+entries_cash_flow(
+    EntryList *entries,
     Amount *dst,
     time_t from,
     time_t to)
 {
     dst->val = 0;
-    for (int i=0; i<entries->count; i++) {
-        Entry *entry = entries->entries[i];
-        Transaction *txn = entry->txn;
-        if (txn->date >= from && txn->date <= to) {
-            Amount a;
-            a.currency = dst->currency;
-            Amount *src = &entry->split->amount;
-            if (!amount_convert(&a, src, entry->txn->date)) {
-                return false;
-            }
-            dst->val += a.val;
-        }
+    EntryFlow *flow = &entries->flows[0];
+    if (dst->currency != entries->account->currency) {
+        flow = &entries->flows[1];
+    }
+    if (flow->currency != dst->currency) {
+        _flow_reset(flow, dst->currency);
+    }
+    if (!_flow_update(flow, entries)) {
+        return false;
+    }
+    int start = entries_find_date(entries, from, false);
+    int end = entries_find_date(entries, to, true);
+    if (end > start) {
+        dst->val = flow->sums[end] - flow->sums[start];
     }
     return true;
 }
@@ -239,17 +332,36 @@ entries_clear(EntryList *entries, time_t fromdate)
             return;
         }
     }
-    for (int i=index; i<entries->count; i++) {
-        free(entries->entries[i]);
-    }
+    // Entries are stored by value, there's nothing to free. We keep our
+    // allocated space for the upcoming entries_create() calls: it's only
+    // released by entries_deinit().
     entries->count = index;
     entries->cooked_until = index;
-    entries->entries = realloc(
-        entries->entries,
-        sizeof(Entry*) * entries->count);
-    entries->last_reconciled = NULL;
+    for (int i=0; i<2; i++) {
+        if (entries->flows[i].count > index) {
+            entries->flows[i].count = index;
+        }
+    }
+    entries->last_reconciled = -1;
     for (int i=0; i<index; i++) {
-        _entries_maybe_set_last_reconciled(entries, entries->entries[i]);
+        _entries_maybe_set_last_reconciled(entries, i);
+    }
+}
+
+static void
+_entries_set_cooked(EntryList *entries)
+{
+    entries->cooked_until = entries->count;
+
+    // Keep our cash flow indexes in sync. If a conversion fails here,
+    // entries_cash_flow() will try again and report it.
+    if (entries->flows[0].currency != entries->account->currency) {
+        _flow_reset(&entries->flows[0], entries->account->currency);
+    }
+    for (int i=0; i<2; i++) {
+        if (entries->flows[i].currency != NULL) {
+            _flow_update(&entries->flows[i], entries);
+        }
     }
 }
 
@@ -277,7 +389,7 @@ entries_cook(EntryList *entries)
     Entry** rel;
     rel = malloc(sizeof(Entry *) * cookcount);
     for (int i=0; i<cookcount; i++) {
-        Entry *entry = entries->entries[entries->cooked_until+i];
+        Entry *entry = &entries->entries[entries->cooked_until+i];
         Split *split = entry->split;
         if (!amount_convert(&amount, &split->amount, entry->txn->date)) {
             return false;
@@ -294,12 +406,37 @@ entries_cook(EntryList *entries)
         Entry *entry = rel[i];
         if (entry->split->reconciliation_date != 0) {
             reconciled_balance.val += entry->split->amount.val;
-            entries->last_reconciled = entry;
+            entries->last_reconciled = entry - entries->entries;
         }
         amount_copy(&entry->reconciled_balance, &reconciled_balance);
     }
     free(rel);
-    entries->cooked_until = entries->count;
+    _entries_set_cooked(entries);
+    return true;
+}
+
+bool
+entries_restore(EntryList *entries, const int64_t *balances, int count)
+{
+    if (count != entries->count) {
+        return false;
+    }
+    Currency *currency = entries->account->currency;
+    for (int i=entries->cooked_until; i<count; i++) {
+        Amount *amount = &entries->entries[i].split->amount;
+        if (amount->val && amount->currency != currency) {
+            return false;
+        }
+    }
+    for (int i=entries->cooked_until; i<count; i++) {
+        Entry *entry = &entries->entries[i];
+        entry->balance.val = balances[i*2];
+        entry->balance.currency = currency;
+        entry->reconciled_balance.val = balances[i*2+1];
+        entry->reconciled_balance.currency = currency;
+        _entries_maybe_set_last_reconciled(entries, i);
+    }
+    _entries_set_cooked(entries);
     return true;
 }
 
@@ -307,12 +444,16 @@ Entry*
 entries_create(EntryList *entries, Split *split, Transaction *txn)
 {
     entries->count++;
-    entries->entries = realloc(
-        entries->entries,
-        sizeof(Entry*) * entries->count);
-    Entry *res = malloc(sizeof(Entry));
+    if (entries->count > entries->capacity) {
+        // We never shrink here: entries_clear() keeps our space for recooks.
+        vec_resize(
+            (void **)&entries->entries,
+            sizeof(Entry),
+            entries->count,
+            &entries->capacity);
+    }
+    Entry *res = &entries->entries[entries->count-1];
     entry_init(res, split, txn);
-    entries->entries[entries->count-1] = res;
     return res;
 }
 
@@ -331,7 +472,7 @@ entries_find_date(const EntryList *entries, time_t date, bool equal)
     bool matched_once = false;
     while ((high > low) || ((high == low) && !matched_once)) {
         int mid = ((high - low) / 2) + low;
-        Entry *entry = entries->entries[mid];
+        Entry *entry = &entries->entries[mid];
         time_t tdate = entry->txn->date;
         // operator *look* like they're inverted, but they're not.
         bool match = equal ? tdate > date : tdate >= date;
@@ -367,7 +508,7 @@ entries_last_entry(const EntryList *entries, time_t date)
     // We want the entry *before* the threshold
     index--;
     if (index >= 0) {
-        return entries->entries[index];
+        return &entries->entries[index];
     } else {
         return NULL;
     }
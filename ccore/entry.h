@@ -16,12 +16,45 @@ typedef struct {
     Amount reconciled_balance;
 } Entry;
 
+/* Running sums of an EntryList's amounts, converted in `currency`.
+ *
+ * `sums[i]` is the sum of the amounts of the `i` first entries, each of them
+ * converted at its own date. This makes the cash flow of entries `i` to `j-1`
+ * `sums[j] - sums[i]`.
+ */
+typedef struct {
+    // NULL when unused.
+    Currency *currency;
+    // currency_rates_version() at the time we converted our amounts.
+    unsigned int rates_version;
+    // Number of entries covered by `sums`, which holds `count + 1` items.
+    int count;
+    // Allocated size of `sums`. See vec_capacity().
+    unsigned int capacity;
+    int64_t *sums;
+} EntryFlow;
+
+/* Entries of an account, in (date, position) order.
+ *
+ * Entries are stored by value, contiguously, in `entries`. This array acts
+ * as an arena: clearing entries doesn't free anything, it just resets `count`
+ * and subsequent entries_create() calls re-use the already allocated space.
+ * Because of this, pointers to entries are only valid until the next
+ * entries_create() call.
+ */
 typedef struct {
     int count;
+    // Allocated size of `entries`. See vec_capacity().
+    unsigned int capacity;
     int cooked_until;
-    Entry **entries;
-    Entry *last_reconciled;
+    Entry *entries;
+    // Index of the last entry in reconciliation order. -1 if none.
+    int last_reconciled;
     Account *account;
+    // Cash flow indexes. The first one is in the account's currency, the
+    // second one is in whatever other currency we were last asked about,
+    // usually the document's default currency.
+    EntryFlow flows[2];
 } EntryList;
 
 void
@@ -50,12 +83,32 @@ entries_deinit(EntryList *entries);
 bool
 entries_balance(const EntryList *entries, Amount *dst, time_t date);
 
+/* Sets `dst[i]` to the balance at `dates[i]`, converted to `currency` at that
+ * date.
+ *
+ * This is the same as calling entries_balance() for each date, but `dates`
+ * have to be sorted and entries are only walked once.
+ */
+bool
+entries_balance_series(
+    const EntryList *entries,
+    Currency *currency,
+    const time_t *dates,
+    unsigned int count,
+    int64_t *dst);
+
 bool
 entries_balance_of_reconciled(const EntryList *entries, Amount *dst);
 
+/* Sets `dst` to the sum of the amounts of all entries between `from` and `to`
+ * (inclusive), converted to `dst->currency` at the date of each entry.
+ *
+ * Sums are kept in `entries->flows` so that subsequent calls in the same
+ * currency are only a matter of two bisections.
+ */
 bool
 entries_cash_flow(
-    const EntryList *entries,
+    EntryList *entries,
     Amount *dst,
     time_t from,
     time_t to);
@@ -66,6 +119,19 @@ entries_clear(EntryList *entries, time_t fromdate);
 bool
 entries_cook(EntryList *entries);
 
+/* Sets the balances of the entries that aren't cooked yet from `balances`
+ * instead of computing them.
+ *
+ * `balances` holds a (balance, reconciled_balance) pair of values, in the
+ * account's currency, for each of the `count` entries of the list, as they
+ * were when these entries were last cooked. Returns false, without changing
+ * anything, if `count` isn't our entry count or if one of the entries to
+ * restore is in a foreign currency (its balance depends on exchange rates,
+ * which might have changed since).
+ */
+bool
+entries_restore(EntryList *entries, const int64_t *balances, int count);
+
 Entry*
 entries_create(EntryList *entries, Split *split, Transaction *txn);
 
@@ -0,0 +1,56 @@
+#pragma once
+
+#include <glib.h>
+#include "accounts.h"
+#include "transactions.h"
+#include "schedule.h"
+
+typedef enum {
+    LOAD_OK = 0,
+    // The file is a well-formed moneyGuru document, but it uses a currency
+    // that isn't registered.
+    LOAD_UNSUPPORTED_CURRENCY = 1,
+    // The file can't be read, isn't well-formed, isn't a moneyGuru document or
+    // contains values we can't make sense of.
+    LOAD_INVALID = 2,
+} LoadResult;
+
+/* Loads the moneyGuru document at `filename`.
+ *
+ * This is the counterpart of save_native(). The file is parsed in chunks and
+ * its content is created as soon as it's read: accounts are created in
+ * `accounts` and schedules are newly allocated and appended to `schedules`
+ * (they belong to the caller). Transactions are added to `transactions` in
+ * bulk once the whole file is read.
+ *
+ * `document_id` is set to a newly allocated string (to free with g_free()) or
+ * to NULL if the document doesn't have one. The attributes of the
+ * <properties> element are inserted in `properties`, which has to free its
+ * keys and values with g_free().
+ *
+ * When the result isn't LOAD_OK, `accounts`, `transactions` and `schedules`
+ * might have been partially filled.
+ */
+LoadResult
+load_native(
+    const char *filename,
+    char **document_id,
+    GHashTable *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    GPtrArray *schedules);
+
+/* Loads the binary moneyGuru document at `filename`.
+ *
+ * See binary.h for the format. This works like load_native(): arguments and
+ * results are the same, and so are the accounts, transactions and schedules
+ * we create, except that the whole file is read at once.
+ */
+LoadResult
+load_binary(
+    const char *filename,
+    char **document_id,
+    GHashTable *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    GPtrArray *schedules);
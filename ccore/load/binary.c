@@ -0,0 +1,421 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <time.h>
+#include <glib.h>
+#include "../load.h"
+#include "../util.h"
+#include "../binary.h"
+
+typedef struct {
+    const guint8 *p;
+    const guint8 *end;
+    // First error we've encountered. Once it's set, we stop reading.
+    LoadResult error;
+    // The string table. Strings point inside the file's content.
+    const char **strings;
+    unsigned int stringcount;
+    // Account of each string reference, resolved as splits refer to them.
+    Account **ref2account;
+    AccountList *accounts;
+    // Day number of the last transaction read.
+    int64_t last_day;
+} BinaryReader;
+
+/* Private */
+static uint64_t
+get_uvarint(BinaryReader *r)
+{
+    uint64_t val = 0;
+    for (int shift=0; shift<64 && r->p < r->end; shift+=7) {
+        guint8 b = *r->p++;
+        val |= (uint64_t)(b & 0x7f) << shift;
+        if (!(b & 0x80)) {
+            return val;
+        }
+    }
+    r->error = LOAD_INVALID;
+    return 0;
+}
+
+static int64_t
+get_varint(BinaryReader *r)
+{
+    uint64_t val = get_uvarint(r);
+    return (int64_t)(val >> 1) ^ -(int64_t)(val & 1);
+}
+
+// Reads a count of items that are at least one byte each.
+static uint64_t
+get_count(BinaryReader *r)
+{
+    uint64_t count = get_uvarint(r);
+    if (count > (uint64_t)(r->end - r->p)) {
+        r->error = LOAD_INVALID;
+        return 0;
+    }
+    return count;
+}
+
+// Returns the reference of the string we read. 0 is NULL.
+static unsigned int
+get_ref(BinaryReader *r)
+{
+    uint64_t ref = get_uvarint(r);
+    if (ref > r->stringcount) {
+        r->error = LOAD_INVALID;
+        return 0;
+    }
+    return ref;
+}
+
+static const char*
+get_str(BinaryReader *r)
+{
+    unsigned int ref = get_ref(r);
+    return ref ? r->strings[ref-1] : NULL;
+}
+
+static time_t
+days2date(int64_t days)
+{
+    if (days < 1 || days > G_MAXUINT32 || !g_date_valid_julian(days)) {
+        return 0;
+    }
+    GDate d;
+    g_date_clear(&d, 1);
+    g_date_set_julian(&d, days);
+    struct tm res = {0};
+    res.tm_year = g_date_get_year(&d) - 1900;
+    res.tm_mon = g_date_get_month(&d) - 1;
+    res.tm_mday = g_date_get_day(&d);
+    return mktime(&res);
+}
+
+static time_t
+get_date(BinaryReader *r, int64_t days)
+{
+    time_t res = days2date(days);
+    if (res == 0) {
+        r->error = LOAD_INVALID;
+    }
+    return res;
+}
+
+static Currency*
+get_currency(BinaryReader *r)
+{
+    const char *code = get_str(r);
+    if (code == NULL) {
+        return NULL;
+    }
+    Currency *res = currency_get(code);
+    if (res == NULL && r->error == LOAD_OK) {
+        r->error = LOAD_UNSUPPORTED_CURRENCY;
+    }
+    return res;
+}
+
+static Account*
+find_account(BinaryReader *r, unsigned int ref, AccountType auto_create_type)
+{
+    Account *res = r->ref2account[ref-1];
+    if (res != NULL) {
+        return res;
+    }
+    const char *name = r->strings[ref-1];
+    res = accounts_find_by_name(r->accounts, name);
+    if (res == NULL) {
+        res = accounts_create(r->accounts);
+        account_init(
+            res, name, r->accounts->default_currency, auto_create_type);
+    }
+    r->ref2account[ref-1] = res;
+    return res;
+}
+
+static void
+free_txn(Transaction *txn)
+{
+    for (unsigned int i=0; i<txn->splitcount; i++) {
+        split_deinit(&txn->splits[i]);
+    }
+    transaction_deinit(txn);
+    free(txn);
+}
+
+static void
+read_account(BinaryReader *r)
+{
+    const char *name = get_str(r);
+    const char *code = get_str(r);
+    uint64_t type = get_uvarint(r);
+    const char *groupname = get_str(r);
+    const char *reference = get_str(r);
+    const char *account_number = get_str(r);
+    bool inactive = get_uvarint(r) != 0;
+    const char *notes = get_str(r);
+    if (r->error != LOAD_OK || name == NULL || name[0] == '\0') {
+        return;
+    }
+    if (accounts_find_by_name(r->accounts, name) != NULL) {
+        return;
+    }
+    Currency *currency = code != NULL ? currency_get(code) : NULL;
+    if (currency == NULL) {
+        currency = r->accounts->default_currency;
+    }
+    if (type < ACCOUNT_ASSET || type > ACCOUNT_EXPENSE) {
+        type = ACCOUNT_ASSET;
+    }
+    Account *a = accounts_create(r->accounts);
+    account_init(a, name, currency, type);
+    strset(&a->groupname, groupname);
+    strset(&a->reference, reference);
+    strset(&a->account_number, account_number != NULL ? account_number : "");
+    a->inactive = inactive;
+    strset(&a->notes, notes != NULL ? notes : "");
+}
+
+static bool
+read_split(BinaryReader *r, Transaction *txn, int64_t day)
+{
+    unsigned int account_ref = get_ref(r);
+    Amount amount;
+    amount.currency = get_currency(r);
+    amount.val = get_varint(r);
+    const char *memo = get_str(r);
+    const char *reference = get_str(r);
+    uint64_t recdate = get_uvarint(r);
+    if (r->error != LOAD_OK) {
+        return false;
+    }
+    Account *account = NULL;
+    if (account_ref && r->strings[account_ref-1][0] != '\0') {
+        AccountType auto_create_type = amount.val >= 0 ?
+            ACCOUNT_INCOME : ACCOUNT_EXPENSE;
+        account = find_account(r, account_ref, auto_create_type);
+    }
+    Split *split = transaction_add_split(txn);
+    split_account_set(split, account);
+    split_amount_set(split, &amount);
+    strset(&split->memo, memo != NULL ? memo : "");
+    strset(&split->reference, reference);
+    if (recdate) {
+        recdate--;
+        int64_t offset = (int64_t)(recdate >> 1) ^ -(int64_t)(recdate & 1);
+        split->reconciliation_date = get_date(r, day + offset);
+    }
+    return r->error == LOAD_OK;
+}
+
+static Transaction*
+read_txn(BinaryReader *r)
+{
+    int64_t day = r->last_day + get_varint(r);
+    r->last_day = day;
+    time_t date = get_date(r, day);
+    time_t mtime = get_varint(r);
+    const char *description = get_str(r);
+    const char *payee = get_str(r);
+    const char *checkno = get_str(r);
+    const char *notes = get_str(r);
+    uint64_t splitcount = get_count(r);
+    if (r->error != LOAD_OK) {
+        return NULL;
+    }
+    Transaction *txn = malloc(sizeof(Transaction));
+    transaction_init(txn, TXN_TYPE_NORMAL, date);
+    if (description != NULL) {
+        strset(&txn->description, description);
+    }
+    if (payee != NULL) {
+        strset(&txn->payee, payee);
+    }
+    if (checkno != NULL) {
+        strset(&txn->checkno, checkno);
+    }
+    if (notes != NULL) {
+        strset(&txn->notes, notes);
+    }
+    txn->mtime = mtime;
+    for (uint64_t i=0; i<splitcount; i++) {
+        if (!read_split(r, txn, day)) {
+            free_txn(txn);
+            return NULL;
+        }
+    }
+    while (txn->splitcount < 2) {
+        transaction_add_split(txn);
+    }
+    return txn;
+}
+
+static Schedule*
+read_schedule(BinaryReader *r)
+{
+    uint64_t type = get_uvarint(r);
+    uint64_t every = get_uvarint(r);
+    uint64_t stop = get_uvarint(r);
+    Transaction *ref = read_txn(r);
+    if (ref == NULL) {
+        return NULL;
+    }
+    if (type < REPEAT_DAILY || type > REPEAT_WEEKDAY_LAST) {
+        type = REPEAT_MONTHLY;
+    }
+    Schedule *sched = calloc(1, sizeof(Schedule));
+    schedule_init(sched, ref, type, (unsigned int)every);
+    free_txn(ref);
+    if (stop) {
+        sched->stop = get_date(r, stop - 1);
+    }
+    uint64_t count = get_count(r);
+    for (uint64_t i=0; i<count && r->error == LOAD_OK; i++) {
+        time_t date = get_date(r, get_uvarint(r));
+        if (r->error == LOAD_OK) {
+            schedule_delete_at(sched, date);
+        }
+    }
+    count = get_count(r);
+    for (uint64_t i=0; i<count && r->error == LOAD_OK; i++) {
+        time_t date = get_date(r, get_uvarint(r));
+        Transaction *change = read_txn(r);
+        if (change != NULL) {
+            schedule_add_global_change(sched, date, change);
+            free_txn(change);
+        }
+    }
+    if (r->error != LOAD_OK) {
+        schedule_deinit(sched);
+        free(sched);
+        return NULL;
+    }
+    return sched;
+}
+
+static void
+read_properties(BinaryReader *r, GHashTable *properties)
+{
+    const char *default_currency = get_str(r);
+    int64_t first_weekday = get_varint(r);
+    int64_t ahead_months = get_varint(r);
+    int64_t year_start_month = get_varint(r);
+    if (r->error != LOAD_OK) {
+        return;
+    }
+    // Same as the attributes of the <properties> element of native documents.
+    if (default_currency != NULL) {
+        g_hash_table_insert(
+            properties, g_strdup("default_currency"),
+            g_strdup(default_currency));
+    }
+    g_hash_table_insert(
+        properties, g_strdup("first_weekday"),
+        g_strdup_printf("%" G_GINT64_FORMAT, first_weekday));
+    g_hash_table_insert(
+        properties, g_strdup("ahead_months"),
+        g_strdup_printf("%" G_GINT64_FORMAT, ahead_months));
+    g_hash_table_insert(
+        properties, g_strdup("year_start_month"),
+        g_strdup_printf("%" G_GINT64_FORMAT, year_start_month));
+}
+
+static void
+read_strings(BinaryReader *r)
+{
+    uint64_t count = get_count(r);
+    r->strings = malloc(sizeof(char *) * (count + 1));
+    r->stringcount = 0;
+    for (uint64_t i=0; i<count; i++) {
+        uint64_t len = get_uvarint(r);
+        if (r->error != LOAD_OK || len >= (uint64_t)(r->end - r->p)
+                || r->p[len] != '\0') {
+            r->error = LOAD_INVALID;
+            return;
+        }
+        r->strings[r->stringcount++] = (const char *)r->p;
+        r->p += len + 1;
+    }
+}
+
+static void
+read_document(
+    BinaryReader *r,
+    char **document_id,
+    GHashTable *properties,
+    GPtrArray *txns,
+    GPtrArray *schedules)
+{
+    if (get_uvarint(r) != BINARY_VERSION) {
+        r->error = LOAD_INVALID;
+        return;
+    }
+    read_strings(r);
+    if (r->error != LOAD_OK) {
+        return;
+    }
+    r->ref2account = calloc(r->stringcount + 1, sizeof(Account *));
+    *document_id = g_strdup(get_str(r));
+    read_properties(r, properties);
+
+    uint64_t count = get_count(r);
+    for (uint64_t i=0; i<count && r->error == LOAD_OK; i++) {
+        read_account(r);
+    }
+    count = get_count(r);
+    for (uint64_t i=0; i<count && r->error == LOAD_OK; i++) {
+        Transaction *txn = read_txn(r);
+        if (txn != NULL) {
+            g_ptr_array_add(txns, txn);
+        }
+    }
+    count = get_count(r);
+    for (uint64_t i=0; i<count && r->error == LOAD_OK; i++) {
+        // Schedule reference txns don't follow top-level ones.
+        r->last_day = 0;
+        Schedule *sched = read_schedule(r);
+        if (sched != NULL) {
+            g_ptr_array_add(schedules, sched);
+        }
+    }
+}
+
+/* Public */
+LoadResult
+load_binary(
+    const char *filename,
+    char **document_id,
+    GHashTable *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    GPtrArray *schedules)
+{
+    *document_id = NULL;
+    gchar *contents;
+    gsize len;
+    if (!g_file_get_contents(filename, &contents, &len, NULL)) {
+        return LOAD_INVALID;
+    }
+    if (len < BINARY_MAGIC_LEN ||
+            memcmp(contents, BINARY_MAGIC, BINARY_MAGIC_LEN) != 0) {
+        g_free(contents);
+        return LOAD_INVALID;
+    }
+
+    BinaryReader r = {0};
+    r.p = (guint8 *)contents + BINARY_MAGIC_LEN;
+    r.end = (guint8 *)contents + len;
+    r.error = LOAD_OK;
+    r.accounts = accounts;
+    GPtrArray *txns = g_ptr_array_new();
+    read_document(&r, document_id, properties, txns, schedules);
+    transactions_add_many(
+        transactions, (Transaction **)txns->pdata, txns->len, false);
+    g_ptr_array_free(txns, true);
+    free(r.strings);
+    free(r.ref2account);
+    g_free(contents);
+    return r.error;
+}
@@ -0,0 +1,638 @@
+#ifndef _XOPEN_SOURCE
+#define _XOPEN_SOURCE
+#endif
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <glib.h>
+#include "../load.h"
+#include "../util.h"
+
+#define READ_CHUNK_SIZE (64 * 1024)
+
+typedef enum {
+    TXN_TOPLEVEL = 1,
+    TXN_SCHEDULE_REF = 2,
+    TXN_GLOBAL_CHANGE = 3,
+} TxnTarget;
+
+/* Attributes of a <split> element.
+ *
+ * Splits are only loaded once their transaction element is complete, like the
+ * python loader does.
+ */
+typedef struct {
+    char *account;
+    char *amount;
+    char *memo;
+    char *reference;
+    char *reconciled;
+    char *reconciliation_date;
+} PendingSplit;
+
+typedef struct {
+    time_t date;
+    Transaction *txn;
+} PendingChange;
+
+typedef struct {
+    AccountList *accounts;
+    // Top-level txns we've read. They're added to `transactions` all at once
+    // at the end.
+    GPtrArray *txns;
+    GPtrArray *schedules;
+    GHashTable *properties;
+    char **document_id;
+    // name -> Account. Accounts we've already resolved a split name to. Saves
+    // us from a collation-based scan of the whole list for each split.
+    GHashTable *name2account;
+    // Depth of the element being parsed. The root element is at depth 0.
+    int depth;
+    bool properties_read;
+    // First error we've encountered. When it's set, we keep on parsing (we
+    // want to know if the file is well-formed) but we don't load anything.
+    LoadResult error;
+
+    // Transaction being read. NULL if we're not in a <transaction> element.
+    Transaction *txn;
+    TxnTarget txn_target;
+    int txn_depth;
+    char *txn_reference;
+    GArray *splits;
+
+    // Schedule being read. rec_depth is -1 if we're not in a <recurrence>.
+    int rec_depth;
+    char *rec_type;
+    char *rec_every;
+    char *rec_stop_date;
+    Transaction *rec_ref;
+    GArray *rec_deletions;
+    GArray *rec_changes;
+    // change_depth is -1 if we're not in a <change> element.
+    int change_depth;
+    time_t change_date;
+    Transaction *change_txn;
+} LoadState;
+
+/* Private */
+static const char*
+getattr(const gchar **names, const gchar **values, const char *name)
+{
+    for (int i=0; names[i] != NULL; i++) {
+        if (strcmp(names[i], name) == 0) {
+            return values[i];
+        }
+    }
+    return NULL;
+}
+
+// Restores newlines that save_native() escaped.
+static void
+setstr_newlines(char **dst, const char *s)
+{
+    if (s != NULL && strstr(s, "\\n") != NULL) {
+        char **toks = g_strsplit(s, "\\n", 0);
+        char *res = g_strjoinv("\n", toks);
+        g_strfreev(toks);
+        strset(dst, res);
+        g_free(res);
+    } else {
+        strset(dst, s);
+    }
+}
+
+/* Parses a "YYYY-MM-DD" date.
+ *
+ * Returns 0 if `s` isn't a valid date. Like the python loader, we consider
+ * years before 1900 to be typos and use 2000 + their last two digits.
+ */
+static time_t
+str2date(const char *s)
+{
+    struct tm date = {0};
+
+    if (s == NULL) {
+        return 0;
+    }
+    // strptime() would also accept years that don't have 4 digits.
+    for (int i=0; i<4; i++) {
+        if (!g_ascii_isdigit(s[i])) {
+            return 0;
+        }
+    }
+    char *end = strptime(s, "%Y-%m-%d", &date);
+    if (end == NULL || *end != '\0') {
+        return 0;
+    }
+    int year = date.tm_year + 1900;
+    if (year < 1900) {
+        year = (year % 100) + 2000;
+    }
+    if (!g_date_valid_dmy(date.tm_mday, date.tm_mon + 1, year)) {
+        return 0;
+    }
+    struct tm res = {0};
+    res.tm_year = year - 1900;
+    res.tm_mon = date.tm_mon;
+    res.tm_mday = date.tm_mday;
+    return mktime(&res);
+}
+
+// Returns whether `s` is an int, setting its value in `dest`.
+static bool
+str2int(const char *s, long *dest)
+{
+    char *end;
+
+    *dest = strtol(s, &end, 10);
+    if (end == s) {
+        return false;
+    }
+    while (*end == ' ') {
+        end++;
+    }
+    return *end == '\0';
+}
+
+static AccountType
+str2accounttype(const char *s)
+{
+    if (s == NULL) {
+        return ACCOUNT_ASSET;
+    } else if (strcmp(s, "liability") == 0) {
+        return ACCOUNT_LIABILITY;
+    } else if (strcmp(s, "income") == 0) {
+        return ACCOUNT_INCOME;
+    } else if (strcmp(s, "expense") == 0) {
+        return ACCOUNT_EXPENSE;
+    } else {
+        return ACCOUNT_ASSET;
+    }
+}
+
+static RepeatType
+str2repeattype(const char *s)
+{
+    for (RepeatType t=REPEAT_DAILY; t<=REPEAT_WEEKDAY_LAST; t++) {
+        if (s != NULL && strcmp(s, repeat_type_name(t)) == 0) {
+            return t;
+        }
+    }
+    return REPEAT_MONTHLY;
+}
+
+static LoadResult
+parse_amount(Amount *dest, const char *s, Currency *currency)
+{
+    if (amount_parse(dest, s, currency->code, false, false, true)) {
+        return LOAD_OK;
+    }
+    if (amount_parse_currency(s, currency->code, true) == NULL) {
+        return LOAD_UNSUPPORTED_CURRENCY;
+    }
+    return LOAD_INVALID;
+}
+
+static Account*
+find_account(LoadState *st, const char *name, AccountType auto_create_type)
+{
+    Account *res = g_hash_table_lookup(st->name2account, name);
+    if (res != NULL) {
+        return res;
+    }
+    res = accounts_find_by_name(st->accounts, name);
+    if (res == NULL) {
+        res = accounts_create(st->accounts);
+        account_init(
+            res, name, st->accounts->default_currency, auto_create_type);
+    }
+    g_hash_table_insert(st->name2account, g_strdup(name), res);
+    return res;
+}
+
+static void
+free_txn(Transaction *txn)
+{
+    for (unsigned int i=0; i<txn->splitcount; i++) {
+        split_deinit(&txn->splits[i]);
+    }
+    transaction_deinit(txn);
+    free(txn);
+}
+
+static void
+clear_splits(GArray *splits)
+{
+    for (unsigned int i=0; i<splits->len; i++) {
+        PendingSplit *ps = &g_array_index(splits, PendingSplit, i);
+        g_free(ps->account);
+        g_free(ps->amount);
+        g_free(ps->memo);
+        g_free(ps->reference);
+        g_free(ps->reconciled);
+        g_free(ps->reconciliation_date);
+    }
+    g_array_set_size(splits, 0);
+}
+
+static void
+clear_schedule(LoadState *st)
+{
+    st->rec_depth = -1;
+    g_free(st->rec_type);
+    g_free(st->rec_every);
+    g_free(st->rec_stop_date);
+    st->rec_type = NULL;
+    st->rec_every = NULL;
+    st->rec_stop_date = NULL;
+    if (st->rec_ref != NULL) {
+        free_txn(st->rec_ref);
+        st->rec_ref = NULL;
+    }
+    g_array_set_size(st->rec_deletions, 0);
+    for (unsigned int i=0; i<st->rec_changes->len; i++) {
+        free_txn(g_array_index(st->rec_changes, PendingChange, i).txn);
+    }
+    g_array_set_size(st->rec_changes, 0);
+    st->change_depth = -1;
+    if (st->change_txn != NULL) {
+        free_txn(st->change_txn);
+        st->change_txn = NULL;
+    }
+}
+
+static void
+load_properties(LoadState *st, const gchar **names, const gchar **values)
+{
+    st->properties_read = true;
+    for (int i=0; names[i] != NULL; i++) {
+        g_hash_table_insert(
+            st->properties, g_strdup(names[i]), g_strdup(values[i]));
+    }
+}
+
+static void
+load_account(LoadState *st, const gchar **names, const gchar **values)
+{
+    const char *name = getattr(names, values, "name");
+    if (name == NULL || name[0] == '\0') {
+        return;
+    }
+    if (accounts_find_by_name(st->accounts, name) != NULL) {
+        return;
+    }
+    const char *code = getattr(names, values, "currency");
+    Currency *currency = code != NULL ? currency_get(code) : NULL;
+    if (currency == NULL) {
+        currency = st->accounts->default_currency;
+    }
+    AccountType type = str2accounttype(getattr(names, values, "type"));
+    Account *a = accounts_create(st->accounts);
+    account_init(a, name, currency, type);
+    strset(&a->groupname, getattr(names, values, "group"));
+    strset(&a->reference, getattr(names, values, "reference"));
+    const char *account_number = getattr(names, values, "account_number");
+    strset(&a->account_number, account_number != NULL ? account_number : "");
+    const char *inactive = getattr(names, values, "inactive");
+    a->inactive = inactive != NULL && strcmp(inactive, "y") == 0;
+    const char *notes = getattr(names, values, "notes");
+    setstr_newlines(&a->notes, notes != NULL ? notes : "");
+}
+
+static void
+start_txn(
+    LoadState *st,
+    TxnTarget target,
+    const gchar **names,
+    const gchar **values)
+{
+    time_t date = str2date(getattr(names, values, "date"));
+    if (date == 0) {
+        date = today();
+    }
+    Transaction *txn = malloc(sizeof(Transaction));
+    transaction_init(txn, TXN_TYPE_NORMAL, date);
+    const char *s;
+    if ((s = getattr(names, values, "description")) != NULL) {
+        strset(&txn->description, s);
+    }
+    if ((s = getattr(names, values, "payee")) != NULL) {
+        strset(&txn->payee, s);
+    }
+    if ((s = getattr(names, values, "checkno")) != NULL) {
+        strset(&txn->checkno, s);
+    }
+    if ((s = getattr(names, values, "notes")) != NULL) {
+        setstr_newlines(&txn->notes, s);
+    }
+    long mtime;
+    if ((s = getattr(names, values, "mtime")) != NULL && str2int(s, &mtime)) {
+        txn->mtime = mtime;
+    }
+    st->txn = txn;
+    st->txn_target = target;
+    // start_element() has already counted the <transaction> element in depth.
+    st->txn_depth = st->depth - 1;
+    st->txn_reference = g_strdup(getattr(names, values, "reference"));
+}
+
+static void
+add_split(LoadState *st, const gchar **names, const gchar **values)
+{
+    PendingSplit ps;
+    ps.account = g_strdup(getattr(names, values, "account"));
+    ps.amount = g_strdup(getattr(names, values, "amount"));
+    ps.memo = g_strdup(getattr(names, values, "memo"));
+    ps.reference = g_strdup(getattr(names, values, "reference"));
+    ps.reconciled = g_strdup(getattr(names, values, "reconciled"));
+    ps.reconciliation_date = g_strdup(
+        getattr(names, values, "reconciliation_date"));
+    g_array_append_val(st->splits, ps);
+}
+
+static LoadResult
+load_splits(LoadState *st, Transaction *txn)
+{
+    Currency *default_currency = st->accounts->default_currency;
+    for (unsigned int i=0; i<st->splits->len; i++) {
+        PendingSplit *ps = &g_array_index(st->splits, PendingSplit, i);
+        const char *s = ps->amount != NULL ? ps->amount : "";
+        Amount amount;
+        LoadResult res = parse_amount(&amount, s, default_currency);
+        if (res != LOAD_OK) {
+            return res;
+        }
+        Account *account = NULL;
+        if (ps->account != NULL && ps->account[0] != '\0') {
+            AccountType auto_create_type = amount.val >= 0 ?
+                ACCOUNT_INCOME : ACCOUNT_EXPENSE;
+            account = find_account(st, ps->account, auto_create_type);
+            // Amounts without a currency code have the currency of their
+            // account.
+            if (account->currency != default_currency) {
+                res = parse_amount(&amount, s, account->currency);
+                if (res != LOAD_OK) {
+                    return res;
+                }
+            }
+        }
+        Split *split = transaction_add_split(txn);
+        split_account_set(split, account);
+        split_amount_set(split, &amount);
+        strset(&split->memo, ps->memo != NULL ? ps->memo : "");
+        if (ps->reference != NULL && ps->reference[0] != '\0') {
+            strset(&split->reference, ps->reference);
+        } else {
+            strset(&split->reference, st->txn_reference);
+        }
+        if (ps->reconciled != NULL && strcmp(ps->reconciled, "y") == 0) {
+            split->reconciliation_date = txn->date;
+        } else if (account == NULL || (amount.val != 0 &&
+                    amount.currency != account->currency)) {
+            // fix #442: off-currency transactions shouldn't be reconciled
+            split->reconciliation_date = 0;
+        } else if (ps->reconciliation_date != NULL) {
+            split->reconciliation_date = str2date(ps->reconciliation_date);
+        }
+    }
+    transaction_balance(txn, NULL, false);
+    while (txn->splitcount < 2) {
+        transaction_add_split(txn);
+    }
+    return LOAD_OK;
+}
+
+static void
+end_txn(LoadState *st)
+{
+    Transaction *txn = st->txn;
+    st->txn = NULL;
+    LoadResult res = load_splits(st, txn);
+    clear_splits(st->splits);
+    g_free(st->txn_reference);
+    st->txn_reference = NULL;
+    if (res != LOAD_OK) {
+        st->error = res;
+        free_txn(txn);
+        return;
+    }
+    switch (st->txn_target) {
+        case TXN_TOPLEVEL:
+            g_ptr_array_add(st->txns, txn);
+            break;
+        case TXN_SCHEDULE_REF:
+            st->rec_ref = txn;
+            break;
+        case TXN_GLOBAL_CHANGE:
+            st->change_txn = txn;
+            break;
+    }
+}
+
+static void
+end_schedule(LoadState *st)
+{
+    if (st->rec_ref == NULL) {
+        // No reference transaction, nothing to schedule.
+        clear_schedule(st);
+        return;
+    }
+    long every = 1;
+    if (st->rec_every != NULL && !str2int(st->rec_every, &every)) {
+        st->error = LOAD_INVALID;
+        clear_schedule(st);
+        return;
+    }
+    Schedule *sched = calloc(1, sizeof(Schedule));
+    schedule_init(
+        sched, st->rec_ref, str2repeattype(st->rec_type), (unsigned int)every);
+    sched->stop = str2date(st->rec_stop_date);
+    for (unsigned int i=0; i<st->rec_deletions->len; i++) {
+        schedule_delete_at(
+            sched, g_array_index(st->rec_deletions, time_t, i));
+    }
+    for (unsigned int i=0; i<st->rec_changes->len; i++) {
+        PendingChange *change = &g_array_index(
+            st->rec_changes, PendingChange, i);
+        schedule_add_global_change(sched, change->date, change->txn);
+    }
+    g_ptr_array_add(st->schedules, sched);
+    clear_schedule(st);
+}
+
+/* GMarkup callbacks */
+static void
+start_element(
+    GMarkupParseContext *context,
+    const gchar *element_name,
+    const gchar **attribute_names,
+    const gchar **attribute_values,
+    gpointer user_data,
+    GError **error)
+{
+    LoadState *st = user_data;
+    const gchar **names = attribute_names;
+    const gchar **values = attribute_values;
+    int depth = st->depth;
+
+    st->depth++;
+    if (depth == 0) {
+        if (strcmp(element_name, "moneyguru-file") != 0) {
+            g_set_error(
+                error, G_MARKUP_ERROR, G_MARKUP_ERROR_UNKNOWN_ELEMENT,
+                "not a moneyGuru document");
+            return;
+        }
+        const char *document_id = getattr(names, values, "document_id");
+        *st->document_id = g_strdup(document_id);
+        return;
+    }
+    if (st->error != LOAD_OK) {
+        return;
+    }
+    if (strcmp(element_name, "account") == 0) {
+        load_account(st, names, values);
+    } else if (strcmp(element_name, "properties") == 0) {
+        if (depth == 1 && !st->properties_read) {
+            load_properties(st, names, values);
+        }
+    } else if (strcmp(element_name, "split") == 0) {
+        if (st->txn != NULL) {
+            add_split(st, names, values);
+        }
+    } else if (strcmp(element_name, "transaction") == 0) {
+        if (st->txn != NULL) {
+            return;
+        }
+        if (depth == 1) {
+            start_txn(st, TXN_TOPLEVEL, names, values);
+        } else if (st->change_depth >= 0) {
+            if (depth == st->change_depth + 1 && st->change_txn == NULL) {
+                start_txn(st, TXN_GLOBAL_CHANGE, names, values);
+            }
+        } else if (st->rec_depth >= 0) {
+            if (depth == st->rec_depth + 1 && st->rec_ref == NULL) {
+                start_txn(st, TXN_SCHEDULE_REF, names, values);
+            }
+        }
+    } else if (strcmp(element_name, "recurrence") == 0) {
+        if (st->rec_depth < 0 && st->txn == NULL) {
+            st->rec_depth = depth;
+            st->rec_type = g_strdup(getattr(names, values, "type"));
+            st->rec_every = g_strdup(getattr(names, values, "every"));
+            st->rec_stop_date = g_strdup(getattr(names, values, "stop_date"));
+        }
+    } else if (strcmp(element_name, "exception") == 0) {
+        const char *date = getattr(names, values, "date");
+        if (st->rec_depth >= 0 && date != NULL) {
+            time_t d = str2date(date);
+            g_array_append_val(st->rec_deletions, d);
+        }
+    } else if (strcmp(element_name, "change") == 0) {
+        const char *date = getattr(names, values, "date");
+        if (st->rec_depth >= 0 && st->change_depth < 0 && date != NULL) {
+            st->change_depth = depth;
+            st->change_date = str2date(date);
+        }
+    }
+}
+
+static void
+end_element(
+    GMarkupParseContext *context,
+    const gchar *element_name,
+    gpointer user_data,
+    GError **error)
+{
+    LoadState *st = user_data;
+
+    st->depth--;
+    int depth = st->depth;
+    if (st->error != LOAD_OK) {
+        return;
+    }
+    if (st->txn != NULL && depth == st->txn_depth) {
+        end_txn(st);
+    } else if (depth == st->change_depth) {
+        if (st->change_txn != NULL) {
+            PendingChange change = {st->change_date, st->change_txn};
+            g_array_append_val(st->rec_changes, change);
+            st->change_txn = NULL;
+        }
+        st->change_depth = -1;
+    } else if (depth == st->rec_depth) {
+        end_schedule(st);
+    }
+}
+
+/* Public */
+LoadResult
+load_native(
+    const char *filename,
+    char **document_id,
+    GHashTable *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    GPtrArray *schedules)
+{
+    *document_id = NULL;
+    FILE *fp = fopen(filename, "rb");
+    if (fp == NULL) {
+        return LOAD_INVALID;
+    }
+
+    LoadState st = {0};
+    st.accounts = accounts;
+    st.txns = g_ptr_array_new();
+    st.schedules = schedules;
+    st.properties = properties;
+    st.document_id = document_id;
+    st.name2account = g_hash_table_new_full(
+        g_str_hash, g_str_equal, g_free, NULL);
+    st.error = LOAD_OK;
+    st.splits = g_array_new(false, false, sizeof(PendingSplit));
+    st.rec_depth = -1;
+    st.rec_deletions = g_array_new(false, false, sizeof(time_t));
+    st.rec_changes = g_array_new(false, false, sizeof(PendingChange));
+    st.change_depth = -1;
+
+    GMarkupParser parser = {start_element, end_element, NULL, NULL, NULL};
+    GMarkupParseContext *context = g_markup_parse_context_new(
+        &parser, 0, &st, NULL);
+    char *buf = malloc(READ_CHUNK_SIZE);
+    bool wellformed = true;
+    size_t len;
+    while ((len = fread(buf, 1, READ_CHUNK_SIZE, fp)) > 0) {
+        if (!g_markup_parse_context_parse(context, buf, len, NULL)) {
+            wellformed = false;
+            break;
+        }
+    }
+    if (wellformed) {
+        wellformed = !ferror(fp) &&
+            g_markup_parse_context_end_parse(context, NULL);
+    }
+    free(buf);
+    fclose(fp);
+    g_markup_parse_context_free(context);
+
+    if (st.txn != NULL) {
+        free_txn(st.txn);
+    }
+    g_free(st.txn_reference);
+    clear_splits(st.splits);
+    g_array_free(st.splits, true);
+    clear_schedule(&st);
+    g_array_free(st.rec_deletions, true);
+    g_array_free(st.rec_changes, true);
+    g_hash_table_destroy(st.name2account);
+    transactions_add_many(
+        transactions, (Transaction **)st.txns->pdata, st.txns->len, false);
+    g_ptr_array_free(st.txns, true);
+
+    if (!wellformed) {
+        return LOAD_INVALID;
+    }
+    return st.error;
+}
@@ -11,6 +11,8 @@
 #include "schedule.h"
 #include "util.h"
 #include "save.h"
+#include "load.h"
+#include "binary.h"
 
 // NOTE ABOUT DECREF AND ERRORS
 //
@@ -221,6 +223,22 @@ _strsetnn(char **dst, PyObject *src)
     }
 }
 
+// Returns whether setting `src` in a string that is `s` would change it.
+static bool
+_strchanges(const char *s, PyObject *src)
+{
+    if (src == Py_None) {
+        return s != NULL;
+    }
+    const char *news = PyUnicode_AsUTF8(src);
+    if (news == NULL) {
+        // _strset() will report the error.
+        PyErr_Clear();
+        return true;
+    }
+    return s == NULL || strcmp(s, news) != 0;
+}
+
 static PyObject*
 _strget(const char *src)
 {
@@ -431,6 +449,61 @@ py_currency_set_CAD_value(PyObject *self, PyObject *args)
     return Py_None;
 }
 
+static PyObject*
+py_currency_set_CAD_values(PyObject *self, PyObject *args)
+{
+    char *code;
+    PyObject *values, *fast;
+    Currency *c;
+    Py_ssize_t len;
+    time_t *dates;
+    double *rates;
+    bool ok;
+
+    if (!PyArg_ParseTuple(args, "sO", &code, &values)) {
+        return NULL;
+    }
+
+    c = getcur(code);
+    if (c == NULL) {
+        return NULL;
+    }
+
+    fast = PySequence_Fast(values, "values must be a sequence");
+    if (fast == NULL) {
+        return NULL;
+    }
+    len = PySequence_Fast_GET_SIZE(fast);
+    dates = malloc(sizeof(time_t) * (len + 1));
+    rates = malloc(sizeof(double) * (len + 1));
+    ok = true;
+    for (int i=0; i<len; i++) {
+        PyObject *pydate;
+        // borrowed
+        PyObject *item = PySequence_Fast_GET_ITEM(fast, i);
+        if (!PyArg_ParseTuple(item, "Od", &pydate, &rates[i])) {
+            ok = false;
+            break;
+        }
+        dates[i] = pydate2time(pydate);
+        if (dates[i] == -1) {
+            ok = false;
+            break;
+        }
+    }
+    Py_DECREF(fast);
+    if (ok && !currency_set_CAD_values(c, dates, rates, len)) {
+        PyErr_SetString(PyExc_IOError, "Couldn't write rates");
+        ok = false;
+    }
+    free(dates);
+    free(rates);
+    if (!ok) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
 static PyObject*
 py_currency_daterange(PyObject *self, PyObject *args)
 {
@@ -1087,7 +1160,11 @@ PyAccount_change(PyAccount *self, PyObject *args, PyObject *kwds)
         }
         self->account->type = type;
     }
+    // Loaders pass keys whether they changed or not. Bumping the keys version
+    // for nothing would throw away the indexes of every account list.
+    bool keys_changed = false;
     if (reference != NULL) {
+        keys_changed |= _strchanges(self->account->reference, reference);
         if (!_strset(&self->account->reference, reference)) {
             return NULL;
         }
@@ -1098,10 +1175,15 @@ PyAccount_change(PyAccount *self, PyObject *args, PyObject *kwds)
         }
     }
     if (account_number != NULL) {
+        keys_changed |= _strchanges(
+            self->account->account_number, account_number);
         if (!_strset(&self->account->account_number, account_number)) {
             return NULL;
         }
     }
+    if (keys_changed) {
+        account_keys_changed();
+    }
     if (inactive != -1) {
         self->account->inactive = inactive;
     }
@@ -2279,6 +2361,95 @@ PyEntryList_balance(PyEntryList *self, PyObject *args)
     }
 }
 
+/* Converts `seq`, a sorted sequence of dates, into a newly allocated time_t
+ * array. Returns NULL and sets an exception on error.
+ */
+static time_t*
+_pyseq2sorted_times(PyObject *seq, Py_ssize_t *count)
+{
+    PyObject *fast = PySequence_Fast(seq, "dates must be a sequence");
+    if (fast == NULL) {
+        return NULL;
+    }
+    Py_ssize_t len = PySequence_Fast_GET_SIZE(fast);
+    time_t *res = malloc(sizeof(time_t) * len);
+    bool ok = true;
+    for (Py_ssize_t i=0; i<len; i++) {
+        res[i] = pydate2time(PySequence_Fast_GET_ITEM(fast, i));
+        if (res[i] == -1) {
+            ok = false;
+            break;
+        }
+        if (i > 0 && res[i] < res[i-1]) {
+            PyErr_SetString(PyExc_ValueError, "dates must be sorted");
+            ok = false;
+            break;
+        }
+    }
+    Py_DECREF(fast);
+    if (!ok) {
+        free(res);
+        return NULL;
+    }
+    *count = len;
+    return res;
+}
+
+/* Returns `vals`, amounts in `currency`, as an array.array of floats. */
+static PyObject*
+_pyfloatarray(const int64_t *vals, Py_ssize_t count, const Currency *currency)
+{
+    double *floats = malloc(sizeof(double) * count);
+    double factor = pow(10, currency->exponent);
+    for (Py_ssize_t i=0; i<count; i++) {
+        floats[i] = vals[i] ? (double)vals[i] / factor : 0;
+    }
+    PyObject *res = NULL;
+    PyObject *bytes = PyBytes_FromStringAndSize(
+        (char *)floats, sizeof(double) * count);
+    free(floats);
+    if (bytes == NULL) {
+        return NULL;
+    }
+    PyObject *array = PyImport_ImportModule("array");
+    if (array != NULL) {
+        res = PyObject_CallMethod(array, "array", "sO", "d", bytes);
+        Py_DECREF(array);
+    }
+    Py_DECREF(bytes);
+    return res;
+}
+
+static PyObject*
+PyEntryList_balance_series(PyEntryList *self, PyObject *args)
+{
+    PyObject *dates_py;
+    char *currency;
+
+    if (!PyArg_ParseTuple(args, "Os", &dates_py, &currency)) {
+        return NULL;
+    }
+    Currency *c = getcur(currency);
+    if (c == NULL) {
+        return NULL;
+    }
+    Py_ssize_t count;
+    time_t *dates = _pyseq2sorted_times(dates_py, &count);
+    if (dates == NULL) {
+        return NULL;
+    }
+    int64_t *vals = malloc(sizeof(int64_t) * count);
+    PyObject *res = NULL;
+    if (entries_balance_series(self->entries, c, dates, count, vals)) {
+        res = _pyfloatarray(vals, count, c);
+    } else {
+        PyErr_SetString(PyExc_ValueError, "problems computing balances");
+    }
+    free(vals);
+    free(dates);
+    return res;
+}
+
 static bool
 _PyEntryList_cash_flow(PyEntryList *self, Amount *dst, PyObject *daterange)
 {
@@ -2375,7 +2546,7 @@ PyEntryList_iter(PyEntryList *self)
 {
     PyObject *list = PyList_New(self->entries->count);
     for (int i=0; i<self->entries->count; i++) {
-        Entry *entry = self->entries->entries[i];
+        Entry *entry = &self->entries->entries[i];
         // stolen
         PyList_SetItem(list, i, (PyObject *)_PyEntry_from_entry(entry));
     }
@@ -2384,6 +2555,22 @@ PyEntryList_iter(PyEntryList *self)
     return res;
 }
 
+static PyObject*
+PyEntryList_balances(PyEntryList *self, PyObject *args)
+{
+    EntryList *entries = self->entries;
+    int64_t *vals = malloc(sizeof(int64_t) * entries->count * 2);
+    for (int i=0; i<entries->count; i++) {
+        Entry *entry = &entries->entries[i];
+        vals[i*2] = entry->balance.val;
+        vals[i*2+1] = entry->reconciled_balance.val;
+    }
+    PyObject *res = PyBytes_FromStringAndSize(
+        (char *)vals, sizeof(int64_t) * entries->count * 2);
+    free(vals);
+    return res;
+}
+
 static Py_ssize_t
 PyEntryList_len(PyEntryList *self)
 {
@@ -2514,6 +2701,7 @@ PyAccountList_create_from(PyAccountList *self, PyAccount *account)
         // This is not done if both PyAccounts point to the same Account.
         account_deinit(a);
         account_copy(a, account->account);
+        account_keys_changed();
     }
     PyAccount *res = _PyAccount_from_account(a);
     return (PyObject *)res;
@@ -2531,6 +2719,61 @@ PyAccountList_entries_for_account(PyAccountList *self, PyAccount *account)
     return (PyObject *)_PyEntryList_proxy(entries);
 }
 
+static PyObject*
+PyAccountList_sum_balance_series(PyAccountList *self, PyObject *args)
+{
+    PyObject *accounts_py;
+    PyObject *dates_py;
+    char *currency;
+
+    if (!PyArg_ParseTuple(args, "OOs", &accounts_py, &dates_py, &currency)) {
+        return NULL;
+    }
+    Currency *c = getcur(currency);
+    if (c == NULL) {
+        return NULL;
+    }
+    PyObject *accounts = PySequence_List(accounts_py);
+    if (accounts == NULL) {
+        return NULL;
+    }
+    Py_ssize_t count;
+    time_t *dates = _pyseq2sorted_times(dates_py, &count);
+    if (dates == NULL) {
+        Py_DECREF(accounts);
+        return NULL;
+    }
+    int64_t *totals = calloc(count, sizeof(int64_t));
+    int64_t *vals = malloc(sizeof(int64_t) * count);
+    bool ok = true;
+    Py_ssize_t len = PyList_GET_SIZE(accounts);
+    for (Py_ssize_t i=0; i<len; i++) {
+        // borrowed
+        PyAccount *account = (PyAccount *)PyList_GET_ITEM(accounts, i);
+        if (!Account_Check(account)) {
+            PyErr_SetString(PyExc_TypeError, "not an account");
+            ok = false;
+            break;
+        }
+        EntryList *entries = accounts_entries_for_account(
+            &self->alist, account->account);
+        if (!entries_balance_series(entries, c, dates, count, vals)) {
+            PyErr_SetString(PyExc_ValueError, "problems computing balances");
+            ok = false;
+            break;
+        }
+        for (Py_ssize_t j=0; j<count; j++) {
+            totals[j] += vals[j];
+        }
+    }
+    PyObject *res = ok ? _pyfloatarray(totals, count, c) : NULL;
+    free(vals);
+    free(totals);
+    free(dates);
+    Py_DECREF(accounts);
+    return res;
+}
+
 static PyObject*
 PyAccountList_filter(PyAccountList *self, PyObject *args, PyObject *kwds)
 {
@@ -2839,6 +3082,7 @@ PyRecurrence_change(PyRecurrence *self, PyObject *args, PyObject *kwds)
         self->schedule.every = repeat_every;
         schedule_reset_exceptions(&self->schedule);
     }
+    schedule_reset_spawns(&self->schedule);
     Py_RETURN_NONE;
 }
 
@@ -2940,6 +3184,12 @@ PyRecurrence_start_date(PyRecurrence *self)
     return time2pydate(self->schedule.ref.date);
 }
 
+static PyObject *
+PyRecurrence_min_date(PyRecurrence *self)
+{
+    return time2pydate(schedule_min_date(&self->schedule));
+}
+
 static PyObject *
 PyRecurrence_stop_date(PyRecurrence *self)
 {
@@ -3038,29 +3288,39 @@ PyTransactionList_account_names(PyTransactionList *self)
     return res;
 }
 
-static PyObject*
-PyTransactionList_add(PyTransactionList *self, PyObject *args)
+// Returns whether `txn` can be added to the list. Sets an error if it can't.
+static bool
+_PyTransactionList_can_add(PyTransactionList *self, PyTransaction *txn)
 {
-    PyTransaction *txn;
-    int keep_position = false;
-
-    if (!PyArg_ParseTuple(args, "O|p", &txn, &keep_position)) {
-        return NULL;
-    }
     if (!PyObject_IsInstance((PyObject *)txn, Transaction_Type)) {
         PyErr_SetString(PyExc_TypeError, "not a txn");
-        return NULL;
+        return false;
     }
+    if (!txn->owned) {
+        if (transactions_find(&self->tlist, txn->txn) >= 0) {
+            PyErr_SetString(PyExc_ValueError, "already there");
+            return false;
+        }
+        if (txn->txn->ref != NULL) {
+            // Adding a txn that has a ref? hum, not supposed to
+            PyErr_SetString(PyExc_ValueError, "txn shouldn't have a ref");
+            return false;
+        }
+    }
+    return true;
+}
+
+// Returns the Transaction to add to the list for `txn`, which has to have
+// been checked with _PyTransactionList_can_add().
+static Transaction*
+_PyTransactionList_adopt(PyTransaction *txn)
+{
     Transaction *toadd;
     if (txn->owned) {
         // Steal ownership. Probably a new txn.
         toadd = txn->txn;
         txn->owned = false;
     } else {
-        if (transactions_find(&self->tlist, txn->txn) >= 0) {
-            PyErr_SetString(PyExc_ValueError, "already there");
-            return NULL;
-        }
         /* An unowned txn that isn't already in the list means one thing: we're
          * importing from another TransactionList. This is usually not much of
          * a problem: we can copy the txn and add the copy.
@@ -3076,20 +3336,74 @@ PyTransactionList_add(PyTransactionList *self, PyObject *args)
          * usually used for spawns, but since we're not a spawn, let's use it
          * for something else.
          */
-        if (txn->txn->ref != NULL) {
-            // Adding a txn that has a ref? hum, not supposed to
-            PyErr_SetString(PyExc_ValueError, "txn shouldn't have a ref");
-            return NULL;
-        }
         toadd = calloc(sizeof(Transaction), 1);
         transaction_copy(toadd, txn->txn);
         txn->txn->ref = toadd;
     }
+    return toadd;
+}
+
+static PyObject*
+PyTransactionList_add(PyTransactionList *self, PyObject *args)
+{
+    PyTransaction *txn;
+    int keep_position = false;
+
+    if (!PyArg_ParseTuple(args, "O|p", &txn, &keep_position)) {
+        return NULL;
+    }
+    if (!_PyTransactionList_can_add(self, txn)) {
+        return NULL;
+    }
+    Transaction *toadd = _PyTransactionList_adopt(txn);
     transactions_add(&self->tlist, toadd, keep_position);
     PyTransactionList_clear_cache(self);
     Py_RETURN_NONE;
 }
 
+/* Adds all txns in `txns` at once.
+ *
+ * Same as calling add() on each txn (with `keep_position` being the opposite
+ * of `assign_positions`), but much faster when adding a lot of txns.
+ */
+static PyObject*
+PyTransactionList_add_many(PyTransactionList *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *txns;
+    int assign_positions = true;
+    static char *kwlist[] = {"txns", "assign_positions", NULL};
+
+    int res = PyArg_ParseTupleAndKeywords(
+        args, kwds, "O|p", kwlist, &txns, &assign_positions);
+    if (!res) {
+        return NULL;
+    }
+    PyObject *fast = PySequence_Fast(txns, "txns must be a sequence");
+    if (fast == NULL) {
+        return NULL;
+    }
+    Py_ssize_t len = PySequence_Fast_GET_SIZE(fast);
+    // We check all txns before adopting any of them so that we don't end up
+    // with stolen txns that aren't in the list.
+    for (Py_ssize_t i=0; i<len; i++) {
+        PyTransaction *txn = (PyTransaction *)PySequence_Fast_GET_ITEM(fast, i);
+        if (!_PyTransactionList_can_add(self, txn)) {
+            Py_DECREF(fast);
+            return NULL;
+        }
+    }
+    Transaction **toadd = malloc(sizeof(Transaction*) * len);
+    for (Py_ssize_t i=0; i<len; i++) {
+        PyTransaction *txn = (PyTransaction *)PySequence_Fast_GET_ITEM(fast, i);
+        toadd[i] = _PyTransactionList_adopt(txn);
+    }
+    Py_DECREF(fast);
+    transactions_add_many(&self->tlist, toadd, len, !assign_positions);
+    free(toadd);
+    PyTransactionList_clear_cache(self);
+    Py_RETURN_NONE;
+}
+
 static PyObject*
 PyTransactionList_clear(PyTransactionList *self, PyObject *args)
 {
@@ -3245,6 +3559,34 @@ PyTransactionList_transactions_at_date(PyTransactionList *self, PyObject *date_p
     return res;
 }
 
+/* Returns the transaction that `txn` is in this list.
+ *
+ * That's `txn` itself or, if `txn` was copied into the list from another list
+ * (see _PyTransactionList_adopt()), its copy. Returns None if neither is in the
+ * list.
+ */
+static PyObject *
+PyTransactionList_instance(PyTransactionList *self, PyTransaction *txn)
+{
+    if (!PyObject_IsInstance((PyObject *)txn, Transaction_Type)) {
+        PyErr_SetString(PyExc_TypeError, "not a transaction");
+        return NULL;
+    }
+    if (txn->owned) {
+        Py_RETURN_NONE;
+    }
+    if (transactions_find(&self->tlist, txn->txn) >= 0) {
+        Py_INCREF(txn);
+        return (PyObject *)txn;
+    }
+    if (txn->txn->ref != NULL) {
+        if (transactions_find(&self->tlist, txn->txn->ref) >= 0) {
+            return (PyObject *)_PyTransaction_from_txn(txn->txn->ref);
+        }
+    }
+    Py_RETURN_NONE;
+}
+
 static int
 PyTransactionList_contains(PyTransactionList *self, PyTransaction *txn)
 {
@@ -3377,6 +3719,31 @@ PyUndoStep_init(PyUndoStep *self, PyObject *args, PyObject *kwds)
     return 0;
 }
 
+/* Returns a (from_date, affected_accounts) tuple describing what has to be
+ * recooked after an undo or redo of `step`. from_date is None if the whole
+ * document has to be recooked.
+ */
+static PyObject *
+_PyUndoStep_dirty(UndoStep *step)
+{
+    PyObject *from_date = time2pydate(undostep_dirty_date(step));
+    if (from_date == NULL) {
+        return NULL;
+    }
+    Account **accounts = undostep_affected_accounts(step);
+    PyObject *affected = PySet_New(NULL);
+    for (int i=0; accounts[i] != NULL; i++) {
+        PyAccount *a = _PyAccount_from_account(accounts[i]);
+        PySet_Add(affected, (PyObject*)a);
+        Py_DECREF(a);
+    }
+    free(accounts);
+    PyObject *res = PyTuple_Pack(2, from_date, affected);
+    Py_DECREF(from_date);
+    Py_DECREF(affected);
+    return res;
+}
+
 static PyObject *
 PyUndoStep_undo(PyUndoStep *self, PyObject *args)
 {
@@ -3389,7 +3756,7 @@ PyUndoStep_undo(PyUndoStep *self, PyObject *args)
     if (!undostep_undo(&self->step, &alist->alist, &tlist->tlist)) {
         return NULL;
     }
-    Py_RETURN_NONE;
+    return _PyUndoStep_dirty(&self->step);
 }
 
 static PyObject *
@@ -3404,7 +3771,7 @@ PyUndoStep_redo(PyUndoStep *self, PyObject *args)
     if (!undostep_redo(&self->step, &alist->alist, &tlist->tlist)) {
         return NULL;
     }
-    Py_RETURN_NONE;
+    return _PyUndoStep_dirty(&self->step);
 }
 
 static void
@@ -3427,6 +3794,31 @@ _sort_txn_by_date(gconstpointer a, gconstpointer b, gpointer data)
     return ((Transaction *)a)->date - ((Transaction *)b)->date;
 }
 
+/* Restores the balances of `entries` from the `balances` dict given to
+ * oven_cook_txns(), if it has valid ones for their account.
+ */
+static bool
+_entries_restore_from(EntryList *entries, PyObject *balances)
+{
+    if (balances == Py_None) {
+        return false;
+    }
+    PyAccount *account = _PyAccount_from_account(entries->account);
+    // borrowed
+    PyObject *data = PyDict_GetItem(balances, (PyObject *)account);
+    Py_DECREF(account);
+    if (data == NULL || !PyBytes_Check(data)) {
+        return false;
+    }
+    Py_ssize_t size = PyBytes_GET_SIZE(data);
+    if (size % (sizeof(int64_t) * 2)) {
+        return false;
+    }
+    return entries_restore(
+        entries, (int64_t *)PyBytes_AS_STRING(data),
+        size / (sizeof(int64_t) * 2));
+}
+
 static PyObject*
 py_oven_cook_txns(PyObject *self, PyObject *args)
 {
@@ -3434,30 +3826,41 @@ py_oven_cook_txns(PyObject *self, PyObject *args)
     PyTransactionList *txns;
     PyObject *schedules;
     PyObject *from_py, *until_py;
+    PyObject *affected_py = Py_None;
+    PyObject *balances = Py_None;
 
     int res = PyArg_ParseTuple(
-        args, "OOOOO", &accounts, &txns, &schedules, &from_py, &until_py);
+        args, "OOOOO|OO", &accounts, &txns, &schedules, &from_py, &until_py,
+        &affected_py, &balances);
     if (!res) {
         return NULL;
     }
     time_t from = pydate2time(from_py);
     time_t until = pydate2time(until_py);
 
-    // Clear old cooked entries
-    for (int i=0; i<accounts->alist.count; i++) {
-        Account *a = accounts->alist.accounts[i];
-        EntryList *entries = accounts_entries_for_account(
-            &accounts->alist, a);
-        entries_clear(entries, from);
+    // When we're given a list of affected accounts, we only touch the entries
+    // of those accounts. Other EntryLists and their running balances are left
+    // as they are. NULL means "all accounts".
+    GHashTable *affected = NULL;
+    if (affected_py != Py_None) {
+        affected = g_hash_table_new(NULL, NULL);
+        Account **list = _pyseq2accounts(affected_py);
+        for (int i=0; list[i] != NULL; i++) {
+            g_hash_table_add(affected, list[i]);
+        }
+        free(list);
     }
 
-    // add relevant txns to cooked txns list
+    // add relevant txns to cooked txns list. Our txn list is sorted, so we
+    // only have to look at the txns within our range.
     GSequence *filtered = g_sequence_new(NULL);
-    for (unsigned int i=0; i<txns->tlist.count; i++) {
+    unsigned int start = transactions_bisect_date(&txns->tlist, from);
+    for (unsigned int i=start; i<txns->tlist.count; i++) {
         Transaction *txn = txns->tlist.txns[i];
-        if ((txn->date >= from) && (txn->date <= until)) {
-            g_sequence_append(filtered, txn);
+        if (txn->date > until) {
+            break;
         }
+        g_sequence_append(filtered, txn);
     }
 
     // generate spawns to add to txns list
@@ -3465,21 +3868,25 @@ py_oven_cook_txns(PyObject *self, PyObject *args)
     for (int i=0; i<len; i++) {
         // borrowed
         PyRecurrence *rec = (PyRecurrence *)PyList_GetItem(schedules, i);
-        // we have ownership of all those spawns here. We'll manage them in a
-        // split way: spawns that don't belong in `filtered` are freed right
-        // away. spawns that do belong in `filtered` will end up in *owned*
-        // PyTransaction instances (we take care of this in the following
-        // main loop).
-        GSList *spawns = schedule_get_spawns(&rec->schedule, until);
+        // we have ownership of all those spawns here. They will end up in
+        // *owned* PyTransaction instances (we take care of this in the
+        // following main loop).
+        GSList *spawns = schedule_get_spawns_between(
+            &rec->schedule, from, until);
         GSList *iter = spawns;
         while (iter) {
             Transaction *spawn = iter->data;
-            if ((spawn->date >= from) && (spawn->date <= until)) {
-                g_sequence_append(filtered, spawn);
-            } else {
-                // spawns are owned by us. If we aren't going to return them,
-                // we have to free them.
-                transaction_deinit(spawn);
+            g_sequence_append(filtered, spawn);
+            if (affected != NULL) {
+                // Spawns are brand new instances. Entries pointing to them
+                // have to be created whether their account is affected or
+                // not.
+                for (int j=0; j<spawn->splitcount; j++) {
+                    Account *a = spawn->splits[j].account;
+                    if (a != NULL) {
+                        g_hash_table_add(affected, a);
+                    }
+                }
             }
             iter = g_slist_next(iter);
         }
@@ -3487,6 +3894,17 @@ py_oven_cook_txns(PyObject *self, PyObject *args)
     }
     g_sequence_sort(filtered, _sort_txn_by_date, NULL);
 
+    // Clear old cooked entries
+    for (int i=0; i<accounts->alist.count; i++) {
+        Account *a = accounts->alist.accounts[i];
+        if (affected != NULL && !g_hash_table_contains(affected, a)) {
+            continue;
+        }
+        EntryList *entries = accounts_entries_for_account(
+            &accounts->alist, a);
+        entries_clear(entries, from);
+    }
+
     // For each txn to cook, generate entries. Also, add txn to resulting
     // `cooked` list.
     PyObject *cooked = PyList_New(g_sequence_get_length(filtered));
@@ -3508,6 +3926,10 @@ py_oven_cook_txns(PyObject *self, PyObject *args)
             if (split->account == NULL) {
                 continue;
             }
+            if (affected != NULL
+                    && !g_hash_table_contains(affected, split->account)) {
+                continue;
+            }
             EntryList *entries = accounts_entries_for_account(
                 &accounts->alist, split->account);
             entries_create(entries, split, txn);
@@ -3518,10 +3940,20 @@ py_oven_cook_txns(PyObject *self, PyObject *args)
 
     // Cook all entries
     GHashTableIter iter2;
-    g_hash_table_iter_init(&iter2, accounts->alist.a2entries);
-    gpointer _, entries;
-    while (g_hash_table_iter_next(&iter2, &_, &entries)) {
-        entries_cook(entries);
+    gpointer key, value;
+    if (affected != NULL) {
+        g_hash_table_iter_init(&iter2, affected);
+        while (g_hash_table_iter_next(&iter2, &key, &value)) {
+            entries_cook(accounts_entries_for_account(&accounts->alist, key));
+        }
+        g_hash_table_destroy(affected);
+    } else {
+        g_hash_table_iter_init(&iter2, accounts->alist.a2entries);
+        while (g_hash_table_iter_next(&iter2, &key, &value)) {
+            if (!_entries_restore_from(value, balances)) {
+                entries_cook(value);
+            }
+        }
     }
     return cooked;
 }
@@ -3571,8 +4003,12 @@ py_inc_date(PyObject *self, PyObject *args)
     }
 }
 
+typedef int (*SaveFunc)(
+    char *, char *, DocumentProperties *, AccountList *, TransactionList *,
+    Schedule **);
+
 static PyObject*
-py_save_native(PyObject *self, PyObject *args)
+_py_save(PyObject *args, SaveFunc save)
 {
     char *filename;
     char *document_id;
@@ -3596,7 +4032,7 @@ py_save_native(PyObject *self, PyObject *args)
     }
 
     Schedule **cs = _pyseq2scheds(schedules);
-    res = save_native(
+    res = save(
         filename,
         document_id,
         &props,
@@ -3605,12 +4041,209 @@ py_save_native(PyObject *self, PyObject *args)
         cs);
     free(cs);
     if (res != 0) {
-        PyErr_SetString(PyExc_RuntimeError, "error during save_native()");
+        PyErr_SetString(PyExc_RuntimeError, "error during save");
         return NULL;
     }
     Py_RETURN_NONE;
 }
 
+static PyObject*
+py_save_native(PyObject *self, PyObject *args)
+{
+    return _py_save(args, save_native);
+}
+
+static PyObject*
+py_save_binary(PyObject *self, PyObject *args)
+{
+    return _py_save(args, save_binary);
+}
+
+static PyObject*
+py_dump_native(PyObject *self, PyObject *args)
+{
+    char *document_id;
+    PyAccountList *accounts;
+    PyTransactionList *txns;
+    PyObject *schedules;
+    char *currency_code;
+    DocumentProperties props;
+
+    int res = PyArg_ParseTuple(
+        args, "sOOOsiii", &document_id, &accounts, &txns, &schedules,
+        &currency_code, &props.first_weekday, &props.ahead_months,
+        &props.year_start_month);
+    if (!res) {
+        return NULL;
+    }
+
+    props.default_currency = getcur(currency_code);
+    if (props.default_currency == NULL) {
+        return NULL;
+    }
+
+    Schedule **cs = _pyseq2scheds(schedules);
+    char *buffer = NULL;
+    size_t size = 0;
+    res = dump_native(
+        &buffer,
+        &size,
+        document_id,
+        &props,
+        &accounts->alist,
+        &txns->tlist,
+        cs);
+    free(cs);
+    if (res != 0) {
+        PyErr_SetString(PyExc_RuntimeError, "error during dump_native()");
+        return NULL;
+    }
+    PyObject *bytes = PyBytes_FromStringAndSize(buffer, size);
+    free(buffer);
+    return bytes;
+}
+
+/* Appends the element of the single entity in `accounts`, `txns` or
+ * `schedules` (two of them being NULL) to `res`.
+ */
+static bool
+_dump_native_element(
+    PyObject *res,
+    Account **accounts,
+    Transaction **txns,
+    Schedule **schedules)
+{
+    char *buffer = NULL;
+    size_t size = 0;
+    if (dump_native_elements(&buffer, &size, accounts, txns, schedules) != 0) {
+        PyErr_SetString(PyExc_RuntimeError, "error during dump_native_elements()");
+        return false;
+    }
+    PyObject *bytes = PyBytes_FromStringAndSize(buffer, size);
+    free(buffer);
+    if (bytes == NULL) {
+        return false;
+    }
+    PyList_Append(res, bytes);
+    Py_DECREF(bytes);
+    return true;
+}
+
+static PyObject*
+py_dump_native_elements(PyObject *self, PyObject *args)
+{
+    PyObject *accounts_py, *txns_py, *schedules_py;
+
+    if (!PyArg_ParseTuple(args, "OOO", &accounts_py, &txns_py, &schedules_py)) {
+        return NULL;
+    }
+    Account **accounts = _pyseq2accounts(accounts_py);
+    Transaction **txns = _pyseq2txns(txns_py);
+    Schedule **schedules = _pyseq2scheds(schedules_py);
+    PyObject *res = PyList_New(0);
+    bool ok = true;
+    for (Account **a=accounts; ok && *a!=NULL; a++) {
+        Account *single[2] = {*a, NULL};
+        ok = _dump_native_element(res, single, NULL, NULL);
+    }
+    for (Transaction **t=txns; ok && *t!=NULL; t++) {
+        Transaction *single[2] = {*t, NULL};
+        ok = _dump_native_element(res, NULL, single, NULL);
+    }
+    for (Schedule **sc=schedules; ok && *sc!=NULL; sc++) {
+        Schedule *single[2] = {*sc, NULL};
+        ok = _dump_native_element(res, NULL, NULL, single);
+    }
+    free(accounts);
+    free(txns);
+    free(schedules);
+    if (!ok) {
+        Py_DECREF(res);
+        return NULL;
+    }
+    return res;
+}
+
+typedef LoadResult (*LoadFunc)(
+    const char *, char **, GHashTable *, AccountList *, TransactionList *,
+    GPtrArray *);
+
+static PyObject*
+_py_load(PyObject *args, LoadFunc load)
+{
+    char *filename;
+    PyAccountList *accounts;
+    PyTransactionList *txns;
+
+    if (!PyArg_ParseTuple(args, "sOO", &filename, &accounts, &txns)) {
+        return NULL;
+    }
+
+    char *document_id;
+    GHashTable *properties = g_hash_table_new_full(
+        g_str_hash, g_str_equal, g_free, g_free);
+    GPtrArray *schedules = g_ptr_array_new();
+    LoadResult res = load(
+        filename,
+        &document_id,
+        properties,
+        &accounts->alist,
+        &txns->tlist,
+        schedules);
+    PyTransactionList_clear_cache(txns);
+    PyObject *result;
+    if (res == LOAD_OK) {
+        PyObject *props = PyDict_New();
+        GHashTableIter iter;
+        gpointer key, value;
+        g_hash_table_iter_init(&iter, properties);
+        while (g_hash_table_iter_next(&iter, &key, &value)) {
+            PyObject *v = PyUnicode_FromString(value);
+            PyDict_SetItemString(props, key, v);
+            Py_DECREF(v);
+        }
+        PyObject *scheds = PyList_New(schedules->len);
+        for (unsigned int i=0; i<schedules->len; i++) {
+            PyRecurrence *rec = (PyRecurrence *)PyType_GenericAlloc(
+                (PyTypeObject *)Recurrence_Type, 0);
+            schedule_copy(&rec->schedule, g_ptr_array_index(schedules, i));
+            // stolen
+            PyList_SetItem(scheds, i, (PyObject *)rec);
+        }
+        result = Py_BuildValue(
+            "NNN", _strget(document_id), props, scheds);
+    } else if (res == LOAD_UNSUPPORTED_CURRENCY) {
+        PyErr_SetString(UnsupportedCurrencyError, "unsupported currency");
+        result = NULL;
+    } else {
+        // We couldn't load the file, but we let the python loader be the one
+        // telling why.
+        Py_INCREF(Py_None);
+        result = Py_None;
+    }
+    for (unsigned int i=0; i<schedules->len; i++) {
+        Schedule *sched = g_ptr_array_index(schedules, i);
+        schedule_deinit(sched);
+        free(sched);
+    }
+    g_ptr_array_free(schedules, true);
+    g_hash_table_destroy(properties);
+    g_free(document_id);
+    return result;
+}
+
+static PyObject*
+py_load_native(PyObject *self, PyObject *args)
+{
+    return _py_load(args, load_native);
+}
+
+static PyObject*
+py_load_binary(PyObject *self, PyObject *args)
+{
+    return _py_load(args, load_binary);
+}
+
 /* Python Boilerplate */
 
 static PyGetSetDef PyAmount_getseters[] = {
@@ -3748,11 +4381,23 @@ static PyMethodDef module_methods[] = {
     {"currency_register", py_currency_register, METH_VARARGS},
     {"currency_getrate", py_currency_getrate, METH_VARARGS},
     {"currency_set_CAD_value", py_currency_set_CAD_value, METH_VARARGS},
+    {"currency_set_CAD_values", py_currency_set_CAD_values, METH_VARARGS},
     {"currency_daterange", py_currency_daterange, METH_VARARGS},
+    // When cooking all accounts, `balances` can be a dict mapping accounts to
+    // the result of EntryList.balances() from an earlier, identical cook.
+    // These balances are restored instead of being computed.
     {"oven_cook_txns", py_oven_cook_txns, METH_VARARGS},
     {"patch_today", py_patch_today, METH_O},
     {"inc_date", py_inc_date, METH_VARARGS},
     {"save_native", py_save_native, METH_VARARGS},
+    {"dump_native", py_dump_native, METH_VARARGS},
+    // Returns a list with the native XML element of each of the `accounts`,
+    // `txns` and `schedules` (in that order) as bytes.
+    {"dump_native_elements", py_dump_native_elements, METH_VARARGS},
+    {"load_native", py_load_native, METH_VARARGS},
+    // Same as save_native() and load_native(), but in the binary format.
+    {"save_binary", py_save_binary, METH_VARARGS},
+    {"load_binary", py_load_binary, METH_VARARGS},
     {NULL}  /* Sentinel */
 };
 
@@ -3761,6 +4406,9 @@ static PyMethodDef PyEntryList_methods[] = {
     // If `currency` is specified, the result is converted to it.
     // if `with_budget` is True, budget spawns are counted.
     {"balance", (PyCFunction)PyEntryList_balance, METH_VARARGS, ""},
+    // Returns balances at each of the sorted `dates`, converted to `currency`,
+    // as an array of floats.
+    {"balance_series", (PyCFunction)PyEntryList_balance_series, METH_VARARGS, ""},
     // Returns the sum of entry amounts occuring in `date_range`.
     // If `currency` is specified, the result is converted to it.
     {"cash_flow", (PyCFunction)PyEntryList_cash_flow, METH_VARARGS, ""},
@@ -3769,6 +4417,9 @@ static PyMethodDef PyEntryList_methods[] = {
     {"last_entry", (PyCFunction)PyEntryList_last_entry, METH_VARARGS, ""},
     {"normal_balance", (PyCFunction)PyEntryList_normal_balance, METH_VARARGS, ""},
     {"normal_cash_flow", (PyCFunction)PyEntryList_normal_cash_flow, METH_VARARGS, ""},
+    // Returns the balance and reconciled balance of each entry, as bytes. See
+    // oven_cook_txns().
+    {"balances", (PyCFunction)PyEntryList_balances, METH_NOARGS, ""},
     {0, 0, 0, 0},
 };
 
@@ -3834,6 +4485,9 @@ static PyMethodDef PyAccountList_methods[] = {
     {"create", (PyCFunction)PyAccountList_create, METH_VARARGS, ""},
     {"create_from", (PyCFunction)PyAccountList_create_from, METH_O, ""},
     {"entries_for_account", (PyCFunction)PyAccountList_entries_for_account, METH_O, ""},
+    // Returns the sum of the balances of `accounts` at each of the sorted
+    // `dates`, converted to `currency`, as an array of floats.
+    {"sum_balance_series", (PyCFunction)PyAccountList_sum_balance_series, METH_VARARGS, ""},
     // Returns all accounts of the given `type` and/or `groupname`.
     {"filter", (PyCFunction)PyAccountList_filter, METH_VARARGS|METH_KEYWORDS, ""},
     // Returns the first account matching with ``name`` (case insensitive)
@@ -3938,9 +4592,11 @@ PyType_Spec Transaction_Type_Spec = {
 
 static PyMethodDef PyTransactionList_methods[] = {
     {"add", (PyCFunction)PyTransactionList_add, METH_VARARGS, ""},
+    {"add_many", (PyCFunction)PyTransactionList_add_many, METH_VARARGS|METH_KEYWORDS, ""},
     {"clear", (PyCFunction)PyTransactionList_clear, METH_NOARGS, ""},
     {"clear_cache", (PyCFunction)PyTransactionList_clear_cache, METH_NOARGS, ""},
     {"first", (PyCFunction)PyTransactionList_first, METH_NOARGS, ""},
+    {"instance", (PyCFunction)PyTransactionList_instance, METH_O, ""},
     {"last", (PyCFunction)PyTransactionList_last, METH_NOARGS, ""},
     {"move_before", (PyCFunction)PyTransactionList_move_before, METH_VARARGS, ""},
     {"move_last", (PyCFunction)PyTransactionList_move_last, METH_O, ""},
@@ -3992,6 +4648,7 @@ static PyMethodDef PyRecurrence_methods[] = {
 
 static PyGetSetDef PyRecurrence_getseters[] = {
     {"start_date", (getter)PyRecurrence_start_date, NULL, NULL, NULL},
+    {"min_date", (getter)PyRecurrence_min_date, NULL, NULL, NULL},
     {"stop_date", (getter)PyRecurrence_stop_date, NULL, NULL, NULL},
     {"repeat_type", (getter)PyRecurrence_repeat_type, NULL, NULL, NULL},
     {"repeat_every", (getter)PyRecurrence_repeat_every, NULL, NULL, NULL},
@@ -4098,5 +4755,8 @@ PyInit__ccore(void)
 
     UndoStep_Type = PyType_FromSpec(&UndoStep_Type_Spec);
     PyModule_AddObject(m, "UndoStep", UndoStep_Type);
+    PyModule_AddObject(
+        m, "BINARY_MAGIC",
+        PyBytes_FromStringAndSize(BINARY_MAGIC, BINARY_MAGIC_LEN));
     return m;
 }
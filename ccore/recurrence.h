@@ -1,3 +1,5 @@
+#pragma once
+
 #include <time.h>
 
 #define SECS_IN_DAY 86400
@@ -3,6 +3,19 @@
 #include "schedule.h"
 #include "document.h"
 
+/* Writes the `size` bytes of `data` to `filename` through a temporary file
+ * that replaces `filename` once it's completely written and synced. This way,
+ * an interrupted save never leaves a truncated document behind.
+ *
+ * Returns 0 on success, -1 on error.
+ */
+int
+save_atomically(const char *filename, const char *data, size_t size);
+
+/* Writes the document, in XML, to `filename`.
+ *
+ * The document is written in memory first, then saved with save_atomically().
+ */
 int
 save_native(
     char *filename,
@@ -11,3 +24,45 @@ save_native(
     AccountList *accounts,
     TransactionList *transactions,
     Schedule **schedules);
+
+/* Same as save_native(), but writes the document in the compact binary format
+ * described in binary.h.
+ */
+int
+save_binary(
+    char *filename,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules);
+
+/* Same as save_native(), but writes the document in memory.
+ *
+ * On success, `buffer` points to a newly allocated buffer (to free with
+ * free()) of `size` bytes. It's a snapshot of the document: it can be written
+ * to disk later, from another thread, without touching the document.
+ */
+int
+dump_native(
+    char **buffer,
+    size_t *size,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules);
+
+/* Writes the <account>, <transaction> and <recurrence> elements of `accounts`,
+ * `txns` and `schedules` in memory, in the same form save_native() gives them.
+ *
+ * All three are NULL-terminated lists and can be NULL. On success, `buffer`
+ * points to a newly allocated buffer (to free with free()) of `size` bytes.
+ */
+int
+dump_native_elements(
+    char **buffer,
+    size_t *size,
+    Account **accounts,
+    Transaction **txns,
+    Schedule **schedules);
@@ -0,0 +1,211 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <glib.h>
+#include "../save.h"
+#include "../binary.h"
+
+/* The body of the document is written in memory while we fill the string
+ * table. The table goes in front of it once everything is written.
+ */
+typedef struct {
+    GByteArray *body;
+    // string -> GUINT_TO_POINTER(its reference)
+    GHashTable *refs;
+    // Strings in reference order. They belong to the document.
+    GPtrArray *strings;
+    // Day number of the last transaction written.
+    int64_t last_day;
+} BinaryWriter;
+
+static void
+put_uvarint(GByteArray *buf, uint64_t val)
+{
+    guint8 bytes[10];
+    int len = 0;
+    while (val >= 0x80) {
+        bytes[len++] = (val & 0x7f) | 0x80;
+        val >>= 7;
+    }
+    bytes[len++] = val;
+    g_byte_array_append(buf, bytes, len);
+}
+
+static void
+put_varint(GByteArray *buf, int64_t val)
+{
+    put_uvarint(buf, ((uint64_t)val << 1) ^ (uint64_t)(val >> 63));
+}
+
+static void
+put_str(BinaryWriter *w, const char *s)
+{
+    if (s == NULL) {
+        put_uvarint(w->body, 0);
+        return;
+    }
+    gpointer ref = g_hash_table_lookup(w->refs, s);
+    if (ref == NULL) {
+        g_ptr_array_add(w->strings, (gpointer)s);
+        ref = GUINT_TO_POINTER(w->strings->len);
+        g_hash_table_insert(w->refs, (gpointer)s, ref);
+    }
+    put_uvarint(w->body, GPOINTER_TO_UINT(ref));
+}
+
+static int64_t
+date2days(time_t date)
+{
+    struct tm *t = localtime(&date);
+    GDate d;
+    g_date_clear(&d, 1);
+    g_date_set_dmy(&d, t->tm_mday, t->tm_mon + 1, t->tm_year + 1900);
+    return g_date_get_julian(&d);
+}
+
+static void
+put_txn(BinaryWriter *w, Transaction *t)
+{
+    int64_t day = date2days(t->date);
+    put_varint(w->body, day - w->last_day);
+    w->last_day = day;
+    put_varint(w->body, t->mtime);
+    put_str(w, t->description);
+    put_str(w, t->payee);
+    put_str(w, t->checkno);
+    put_str(w, t->notes);
+    put_uvarint(w->body, t->splitcount);
+    for (unsigned int i=0; i<t->splitcount; i++) {
+        Split *sp = &t->splits[i];
+        put_str(w, sp->account != NULL ? sp->account->name : NULL);
+        put_str(w, sp->amount.currency != NULL ? sp->amount.currency->code : NULL);
+        put_varint(w->body, sp->amount.val);
+        put_str(w, sp->memo);
+        put_str(w, sp->reference);
+        if (sp->reconciliation_date) {
+            int64_t offset = date2days(sp->reconciliation_date) - day;
+            put_uvarint(
+                w->body,
+                (((uint64_t)offset << 1) ^ (uint64_t)(offset >> 63)) + 1);
+        } else {
+            put_uvarint(w->body, 0);
+        }
+    }
+}
+
+static void
+put_account(BinaryWriter *w, Account *a)
+{
+    put_str(w, a->name);
+    put_str(w, a->currency->code);
+    put_uvarint(w->body, a->type);
+    put_str(w, a->groupname);
+    put_str(w, a->reference);
+    put_str(w, a->account_number);
+    put_uvarint(w->body, a->inactive ? 1 : 0);
+    put_str(w, a->notes);
+}
+
+static void
+put_schedule(BinaryWriter *w, Schedule *sc)
+{
+    put_uvarint(w->body, sc->type);
+    put_uvarint(w->body, sc->every);
+    put_uvarint(w->body, sc->stop ? date2days(sc->stop) + 1 : 0);
+    put_txn(w, &sc->ref);
+
+    GHashTableIter iter;
+    gpointer key, value;
+    put_uvarint(w->body, g_hash_table_size(sc->deletions));
+    g_hash_table_iter_init(&iter, sc->deletions);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        put_uvarint(w->body, date2days((time_t)key));
+    }
+    put_uvarint(w->body, g_hash_table_size(sc->globalchanges));
+    g_hash_table_iter_init(&iter, sc->globalchanges);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        put_uvarint(w->body, date2days((time_t)key));
+        put_txn(w, (Transaction *)value);
+    }
+}
+
+static void
+write_body(
+    BinaryWriter *w,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules)
+{
+    put_str(w, document_id);
+    put_str(w, properties->default_currency->code);
+    put_varint(w->body, properties->first_weekday);
+    put_varint(w->body, properties->ahead_months);
+    put_varint(w->body, properties->year_start_month);
+
+    put_uvarint(w->body, accounts->count);
+    for (int i=0; i<accounts->count; i++) {
+        put_account(w, accounts->accounts[i]);
+    }
+
+    put_uvarint(w->body, transactions->count);
+    for (int i=0; i<transactions->count; i++) {
+        put_txn(w, transactions->txns[i]);
+    }
+
+    // Like save_native(), we skip schedules that don't spawn anything.
+    unsigned int alive = 0;
+    for (Schedule **sc=schedules; *sc!=NULL; sc++) {
+        if (schedule_is_alive(*sc)) {
+            alive++;
+        }
+    }
+    put_uvarint(w->body, alive);
+    for (Schedule **sc=schedules; *sc!=NULL; sc++) {
+        if (schedule_is_alive(*sc)) {
+            // Schedule reference txns don't follow top-level ones.
+            w->last_day = 0;
+            put_schedule(w, *sc);
+        }
+    }
+}
+
+/* Public */
+int
+save_binary(
+    char *filename,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules)
+{
+    BinaryWriter w;
+    w.body = g_byte_array_new();
+    w.refs = g_hash_table_new(g_str_hash, g_str_equal);
+    w.strings = g_ptr_array_new();
+    w.last_day = 0;
+    write_body(&w, document_id, properties, accounts, transactions, schedules);
+
+    GByteArray *head = g_byte_array_new();
+    g_byte_array_append(head, (guint8 *)BINARY_MAGIC, BINARY_MAGIC_LEN);
+    put_uvarint(head, BINARY_VERSION);
+    put_uvarint(head, w.strings->len);
+    for (unsigned int i=0; i<w.strings->len; i++) {
+        const char *s = g_ptr_array_index(w.strings, i);
+        size_t len = strlen(s);
+        put_uvarint(head, len);
+        // We include the NUL byte so that loaded strings can be used in place.
+        g_byte_array_append(head, (guint8 *)s, len + 1);
+    }
+
+    g_byte_array_append(head, w.body->data, w.body->len);
+    int res = save_atomically(filename, (char *)head->data, head->len);
+    g_byte_array_free(head, true);
+    g_byte_array_free(w.body, true);
+    g_hash_table_destroy(w.refs);
+    g_ptr_array_free(w.strings, true);
+    return res;
+}
@@ -1,67 +1,140 @@
+// for fileno() and fsync()
+#ifndef _POSIX_C_SOURCE
+#define _POSIX_C_SOURCE 200809L
+#endif
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
 #include <glib.h>
 #include "../save.h"
+#include "../util.h"
 
-static char*
-escape_newline(char *s)
+/* The whole document is written in a single buffer that grows as needed. */
+typedef struct {
+    char *data;
+    unsigned int len;
+    // Allocated size of `data`. See vec_capacity().
+    unsigned int capacity;
+} OutBuf;
+
+static void
+buf_append(OutBuf *b, const char *s, size_t len)
 {
-    char **toks = g_strsplit(s, "\n", 0);
-    char *res = g_strjoinv("\\n", toks);
-    g_strfreev(toks);
-    return res;
+    vec_resize((void **)&b->data, 1, b->len + len, &b->capacity);
+    memcpy(b->data + b->len, s, len);
+    b->len += len;
+}
+
+static void
+buf_puts(OutBuf *b, const char *s)
+{
+    buf_append(b, s, strlen(s));
+}
+
+static void
+buf_int(OutBuf *b, long val)
+{
+    char s[24];
+    buf_append(b, s, sprintf(s, "%ld", val));
+}
+
+/* Appends `s`, escaped the same way g_markup_escape_text() does.
+ *
+ * If `newlines` is true, newlines are also escaped as "\n": etree, which we
+ * used to save with, didn't keep them in attributes.
+ */
+static void
+buf_escaped(OutBuf *b, const char *s, bool newlines)
+{
+    const char *start = s;
+    for (const char *p=s; *p; p++) {
+        const char *esc = NULL;
+        char hex[8];
+        unsigned char c = *p;
+        switch (c) {
+            case '&': esc = "&amp;"; break;
+            case '<': esc = "&lt;"; break;
+            case '>': esc = "&gt;"; break;
+            case '\'': esc = "&apos;"; break;
+            case '"': esc = "&quot;"; break;
+            case '\n':
+                if (newlines) {
+                    esc = "\\n";
+                }
+                break;
+            case '\t':
+            case '\r':
+                break;
+            default:
+                if (c < 0x20 || c == 0x7f) {
+                    sprintf(hex, "&#x%x;", c);
+                    esc = hex;
+                } else if (c == 0xc2) {
+                    // U+0080 to U+009F, except for U+0085, are control chars.
+                    unsigned char next = p[1];
+                    if (next >= 0x80 && next <= 0x9f && next != 0x85) {
+                        buf_append(b, start, p - start);
+                        sprintf(hex, "&#x%x;", next);
+                        buf_puts(b, hex);
+                        p++;
+                        start = p + 1;
+                    }
+                }
+        }
+        if (esc != NULL) {
+            buf_append(b, start, p - start);
+            buf_puts(b, esc);
+            start = p + 1;
+        }
+    }
+    buf_puts(b, start);
 }
 
+// Appends ` name="val"` if `val` isn't NULL. `name` includes " name=\"".
 static void
-setattrib(FILE *fp, char *fmt, char *val)
+buf_attr(OutBuf *b, const char *name, const char *val, bool newlines)
 {
     if (val) {
-        char *s = g_markup_printf_escaped(fmt, val);
-        fwrite(s, strlen(s), 1, fp);
-        g_free(s);
+        buf_puts(b, name);
+        buf_escaped(b, val, newlines);
+        buf_append(b, "\"", 1);
     }
 }
 
-static int
-date2str(char *dest, time_t date)
+static void
+buf_date(OutBuf *b, time_t date)
 {
     struct tm *t = localtime(&date);
-    return sprintf(
-        dest, "%d-%02d-%02d", t->tm_year+1900, t->tm_mon+1, t->tm_mday);
+    char s[24];
+    buf_append(
+        b, s,
+        sprintf(s, "%d-%02d-%02d", t->tm_year+1900, t->tm_mon+1, t->tm_mday));
 }
 
 static void
-writedate(FILE *fp, char *fmt, time_t val)
+buf_date_attr(OutBuf *b, const char *name, time_t val)
 {
     if (val) {
-        char dfmt[20];
-        date2str(dfmt, val);
-        char *s = g_markup_printf_escaped(fmt, dfmt);
-        fwrite(s, strlen(s), 1, fp);
-        g_free(s);
+        buf_puts(b, name);
+        buf_date(b, val);
+        buf_append(b, "\"", 1);
     }
 }
 
 static int
-write_txn(FILE *fp, Transaction *t)
-{
-    char dfmt[20];
-    date2str(dfmt, t->date);
-    char *s = g_markup_printf_escaped(
-        "<transaction date=\"%s\" mtime=\"%ld\"",
-        dfmt,
-        t->mtime);
-    fwrite(s, strlen(s), 1, fp);
-    g_free(s);
-    setattrib(fp, " description=\"%s\"", t->description);
-    setattrib(fp, " payee=\"%s\"", t->payee);
-    setattrib(fp, " checkno=\"%s\"", t->checkno);
-    if (t->notes) {
-        char *notes = escape_newline(t->notes);
-        setattrib(fp, " notes=\"%s\"", notes);
-        g_free(notes);
-    }
-    s = ">\n";
-    fwrite(s, strlen(s), 1, fp);
+write_txn(OutBuf *b, Transaction *t)
+{
+    buf_puts(b, "<transaction date=\"");
+    buf_date(b, t->date);
+    buf_puts(b, "\" mtime=\"");
+    buf_int(b, t->mtime);
+    buf_append(b, "\"", 1);
+    buf_attr(b, " description=\"", t->description, false);
+    buf_attr(b, " payee=\"", t->payee, false);
+    buf_attr(b, " checkno=\"", t->checkno, false);
+    buf_attr(b, " notes=\"", t->notes, true);
+    buf_puts(b, ">\n");
 
     for (int i=0; i<t->splitcount; i++) {
         Split *sp = &t->splits[i];
@@ -69,127 +142,212 @@ write_txn(FILE *fp, Transaction *t)
         if (!amount_format(afmt, &sp->amount, true, false)) {
             return -2;
         }
-        char *aname = "";
-        if (sp->account) {
-            aname = sp->account->name;
+        buf_attr(b, "<split account=\"", sp->account ? sp->account->name : "", false);
+        buf_attr(b, " amount=\"", afmt, false);
+        buf_attr(b, " memo=\"", sp->memo, false);
+        buf_attr(b, " reference=\"", sp->reference, false);
+        buf_date_attr(b, " reconciliation_date=\"", sp->reconciliation_date);
+        buf_puts(b, " />\n");
+    }
+
+    buf_puts(b, "</transaction>\n");
+    return 0;
+}
+
+static void
+write_account(OutBuf *b, Account *a)
+{
+    buf_attr(b, "<account name=\"", a->name, false);
+    buf_attr(b, " currency=\"", a->currency->code, false);
+    buf_attr(b, " type=\"", account_type_name(a), false);
+    buf_attr(b, " group=\"", a->groupname, false);
+    buf_attr(b, " reference=\"", a->reference, false);
+    buf_attr(b, " account_number=\"", a->account_number, false);
+    if (a->inactive) {
+        buf_puts(b, " inactive=\"y\"");
+    }
+    buf_attr(b, " notes=\"", a->notes, true);
+    buf_puts(b, " />\n");
+}
+
+static int
+write_schedule(OutBuf *b, Schedule *sc)
+{
+    if (!schedule_is_alive(sc)) {
+        return 0;
+    }
+    buf_attr(b, "<recurrence type=\"", repeat_type_name(sc->type), false);
+    buf_puts(b, " every=\"");
+    buf_int(b, sc->every);
+    buf_append(b, "\"", 1);
+    buf_date_attr(b, " stop=\"", sc->stop);
+    buf_puts(b, ">\n");
+    int res = write_txn(b, &sc->ref);
+    if (res != 0) {
+        return res;
+    }
+
+    GHashTableIter iter;
+    gpointer key, value;
+    g_hash_table_iter_init(&iter, sc->deletions);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        buf_date_attr(b, "<exception date=\"", (time_t)key);
+        buf_puts(b, " />\n");
+    }
+
+    g_hash_table_iter_init(&iter, sc->globalchanges);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        buf_date_attr(b, "<change date=\"", (time_t)key);
+        buf_puts(b, ">\n");
+        res = write_txn(b, (Transaction *)value);
+        if (res != 0) {
+            return res;
         }
-        s = g_markup_printf_escaped(
-            "<split account=\"%s\" amount=\"%s\"",
-            aname,
-            afmt);
-        fwrite(s, strlen(s), 1, fp);
-        g_free(s);
-        setattrib(fp, " memo=\"%s\"", sp->memo);
-        setattrib(fp, " reference=\"%s\"", sp->reference);
-        writedate(fp, " reconciliation_date=\"%s\"", sp->reconciliation_date);
-        s = " />\n";
-        fwrite(s, strlen(s), 1, fp);
-    }
-
-    s = "</transaction>\n";
-    fwrite(s, strlen(s), 1, fp);
+        buf_puts(b, "</change>\n");
+    }
+    buf_puts(b, "</recurrence>\n");
     return 0;
 }
 
-int
-save_native(
-    char *filename,
+static int
+write_native(
+    OutBuf *b,
     char *document_id,
     DocumentProperties *properties,
     AccountList *accounts,
     TransactionList *transactions,
     Schedule **schedules)
 {
-    FILE *fp = fopen(filename, "w");
-    if (fp == NULL) {
-        return -1;
-    }
-    char *s;
+    buf_attr(b, "<moneyguru-file document_id=\"", document_id, false);
+    buf_puts(b, ">\n");
 
-    s = g_markup_printf_escaped(
-        "<moneyguru-file document_id=\"%s\">\n",
-        document_id);
-    fwrite(s, strlen(s), 1, fp);
-    g_free(s);
-
-    s = g_markup_printf_escaped(
-        "<properties default_currency=\"%s\" first_weekday=\"%d\""
-        " ahead_months=\"%d\" year_start_month=\"%d\"/>\n",
-        properties->default_currency->code,
-        properties->first_weekday,
-        properties->ahead_months,
-        properties->year_start_month);
-    fwrite(s, strlen(s), 1, fp);
-    g_free(s);
+    buf_attr(
+        b, "<properties default_currency=\"",
+        properties->default_currency->code, false);
+    buf_puts(b, " first_weekday=\"");
+    buf_int(b, properties->first_weekday);
+    buf_puts(b, "\" ahead_months=\"");
+    buf_int(b, properties->ahead_months);
+    buf_puts(b, "\" year_start_month=\"");
+    buf_int(b, properties->year_start_month);
+    buf_puts(b, "\"/>\n");
 
     for (int i=0; i<accounts->count; i++) {
-        Account *a = accounts->accounts[i];
-        s = g_markup_printf_escaped(
-            "<account name=\"%s\" currency=\"%s\" type=\"%s\"",
-            a->name,
-            a->currency->code,
-            account_type_name(a));
-        fwrite(s, strlen(s), 1, fp);
-        g_free(s);
-        setattrib(fp, " group=\"%s\"", a->groupname);
-        setattrib(fp, " reference=\"%s\"", a->reference);
-        setattrib(fp, " account_number=\"%s\"", a->account_number);
-        if (a->inactive) {
-            s = " inactive=\"y\"";
-            fwrite(s, strlen(s), 1, fp);
-        }
-        if (a->notes) {
-            char *notes = escape_newline(a->notes);
-            setattrib(fp, " notes=\"%s\"", notes);
-            g_free(notes);
-        }
-        fwrite(" />\n", 4, 1, fp);
+        write_account(b, accounts->accounts[i]);
     }
 
     for (int i=0; i<transactions->count; i++) {
         Transaction *t = transactions->txns[i];
-        int res = write_txn(fp, t);
+        int res = write_txn(b, t);
         if (res != 0) {
             return res;
         }
     }
 
     while (*schedules) {
-        Schedule *sc = *schedules;
-        if (!schedule_is_alive(sc)) {
-            continue;
-        }
-        s = g_markup_printf_escaped(
-            "<recurrence type=\"%s\" every=\"%d\"",
-            repeat_type_name(sc->type),
-            sc->every);
-        fwrite(s, strlen(s), 1, fp);
-        g_free(s);
-        writedate(fp, " stop=\"%s\"", sc->stop);
-        s = ">\n";
-        fwrite(s, strlen(s), 1, fp);
-        write_txn(fp, &sc->ref);
-
-        GHashTableIter iter;
-        gpointer key, value;
-        g_hash_table_iter_init(&iter, sc->deletions);
-        while (g_hash_table_iter_next(&iter, &key, &value)) {
-            writedate(fp, "<exception date=\"%s\" />\n", (time_t)key);
-        }
-
-        g_hash_table_iter_init(&iter, sc->globalchanges);
-        while (g_hash_table_iter_next(&iter, &key, &value)) {
-            writedate(fp, "<change date=\"%s\">\n", (time_t)key);
-            write_txn(fp, (Transaction *)value);
-            s = "</change>\n";
-            fwrite(s, strlen(s), 1, fp);
+        int res = write_schedule(b, *schedules);
+        if (res != 0) {
+            return res;
         }
-        s = "</recurrence>\n";
-        fwrite(s, strlen(s), 1, fp);
         schedules++;
     }
-    s = "</moneyguru-file>";
-    fwrite(s, strlen(s), 1, fp);
-    fclose(fp);
+    buf_puts(b, "</moneyguru-file>");
     return 0;
 }
+
+// Hands the content of `b` over to `buffer` and `size`, or frees it on error.
+static int
+buf_finish(OutBuf *b, int res, char **buffer, size_t *size)
+{
+    if (res != 0) {
+        free(b->data);
+        *buffer = NULL;
+        *size = 0;
+    } else {
+        *buffer = b->data;
+        *size = b->len;
+    }
+    return res;
+}
+
+/* Public */
+int
+save_atomically(const char *filename, const char *data, size_t size)
+{
+    char *tmppath = g_strconcat(filename, ".tmp", NULL);
+    FILE *fp = fopen(tmppath, "wb");
+    if (fp == NULL) {
+        g_free(tmppath);
+        return -1;
+    }
+    bool ok = fwrite(data, 1, size, fp) == size;
+    ok = fflush(fp) == 0 && ok;
+    ok = fsync(fileno(fp)) == 0 && ok;
+    ok = fclose(fp) == 0 && ok;
+    ok = ok && rename(tmppath, filename) == 0;
+    if (!ok) {
+        remove(tmppath);
+    }
+    g_free(tmppath);
+    return ok ? 0 : -1;
+}
+
+int
+save_native(
+    char *filename,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules)
+{
+    OutBuf b = {0};
+    int res = write_native(
+        &b, document_id, properties, accounts, transactions, schedules);
+    if (res == 0) {
+        res = save_atomically(filename, b.data, b.len);
+    }
+    free(b.data);
+    return res;
+}
+
+int
+dump_native(
+    char **buffer,
+    size_t *size,
+    char *document_id,
+    DocumentProperties *properties,
+    AccountList *accounts,
+    TransactionList *transactions,
+    Schedule **schedules)
+{
+    OutBuf b = {0};
+    int res = write_native(
+        &b, document_id, properties, accounts, transactions, schedules);
+    return buf_finish(&b, res, buffer, size);
+}
+
+int
+dump_native_elements(
+    char **buffer,
+    size_t *size,
+    Account **accounts,
+    Transaction **txns,
+    Schedule **schedules)
+{
+    OutBuf b = {0};
+    int res = 0;
+    while (accounts != NULL && *accounts != NULL) {
+        write_account(&b, *accounts);
+        accounts++;
+    }
+    while (res == 0 && txns != NULL && *txns != NULL) {
+        res = write_txn(&b, *txns);
+        txns++;
+    }
+    while (res == 0 && schedules != NULL && *schedules != NULL) {
+        res = write_schedule(&b, *schedules);
+        schedules++;
+    }
+    return buf_finish(&b, res, buffer, size);
+}
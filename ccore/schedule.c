@@ -1,4 +1,5 @@
 #include "schedule.h"
+#include "util.h"
 
 /* Private */
 static void
@@ -9,6 +10,131 @@ _txn_free(gpointer data)
     free(txn);
 }
 
+/* Discards memoized spawn slots with a recurrence date >= `date` and sets our
+ * generation state so that the next generated slot is the first discarded
+ * one.
+ */
+static void
+_spawns_truncate(Schedule *sched, time_t date)
+{
+    SpawnCache *c = &sched->spawns;
+    while (c->count > 0 && c->slots[c->count-1].recurrence_date >= date) {
+        c->count--;
+    }
+    if (c->count > 0) {
+        SpawnSlot *last = &c->slots[c->count-1];
+        c->incsize = last->incsize + sched->every;
+        c->ref = last->ref;
+        c->delta = last->delta;
+    } else {
+        c->incsize = 0;
+        c->ref = &sched->ref;
+        c->delta = 0;
+    }
+    c->version = sched->version;
+}
+
+/* Called after a change to exceptions at `date`. If our start date moved, all
+ * slots are invalid. Otherwise, only those from `date` are.
+ */
+static void
+_spawns_changed_at(Schedule *sched, time_t start, time_t date)
+{
+    if (sched->spawns.version != sched->version) {
+        // already invalidated
+        return;
+    }
+    if (sched->ref.date != start) {
+        schedule_reset_spawns(sched);
+    } else {
+        _spawns_truncate(sched, date);
+    }
+}
+
+/* Returns the end date up to which recurrence dates have to be generated for
+ * a spawning up to `end`. See schedule_get_spawns().
+ */
+static time_t
+_spawns_end(const Schedule *sched, time_t end)
+{
+    GHashTableIter iter;
+    gpointer key, value;
+    g_hash_table_iter_init(&iter, sched->deletions);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        if ((time_t)key > end) {
+            end = (time_t)key;
+        }
+    }
+    g_hash_table_iter_init(&iter, sched->globalchanges);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        time_t rd = (time_t)key;
+        time_t vd = ((Transaction *)value)->date;
+        if (vd < rd) {
+            end += (rd - vd);
+        }
+    }
+    if ((sched->stop > 0) && (end > sched->stop)) {
+        end = sched->stop;
+    }
+    return end;
+}
+
+/* Makes sure that we have memoized slots for all recurrence dates up to
+ * `end`.
+ */
+static bool
+_spawns_extend(Schedule *sched, time_t end)
+{
+    SpawnCache *c = &sched->spawns;
+    if (c->version != sched->version) {
+        _spawns_truncate(sched, 0);
+    }
+    while (true) {
+        time_t date = inc_date(sched->ref.date, sched->type, c->incsize);
+        if (date == -1) {
+            c->incsize += sched->every;
+            continue;
+        }
+        if (date > end) {
+            break;
+        }
+        Transaction *txn = g_hash_table_lookup(
+            sched->globalchanges, (gpointer)date);
+        if (txn != NULL) {
+            c->ref = txn;
+            c->delta = txn->date - date;
+        }
+        if (c->count == c->capacity) {
+            if (!vec_resize(
+                    (void **)&c->slots, sizeof(SpawnSlot), c->count + 1,
+                    &c->capacity)) {
+                return false;
+            }
+        }
+        SpawnSlot *slot = &c->slots[c->count];
+        slot->recurrence_date = date;
+        slot->delta = c->delta;
+        slot->ref = c->ref;
+        slot->incsize = c->incsize;
+        slot->deleted = schedule_is_deleted_at(sched, date);
+        c->count++;
+        c->incsize += sched->every;
+    }
+    return true;
+}
+
+static Transaction*
+_spawn_create(const SpawnSlot *slot)
+{
+    Transaction *spawn = calloc(sizeof(Transaction), 1);
+    transaction_copy(spawn, slot->ref);
+    spawn->type = TXN_TYPE_RECURRENCE;
+    spawn->date = slot->recurrence_date + slot->delta;
+    spawn->recurrence_date = slot->recurrence_date;
+    spawn->ref = slot->ref;
+    return spawn;
+}
+
 /* Public */
 bool
 schedule_init(
@@ -31,12 +157,21 @@ schedule_init(
         g_direct_equal,
         NULL,
         _txn_free);
+    sched->version = 1;
+    sched->spawns.version = 0;
+    sched->spawns.count = 0;
+    sched->spawns.capacity = 0;
+    sched->spawns.slots = NULL;
     return true;
 }
 
 void
 schedule_deinit(Schedule *sched)
 {
+    free(sched->spawns.slots);
+    sched->spawns.slots = NULL;
+    sched->spawns.count = 0;
+    sched->spawns.capacity = 0;
     g_hash_table_destroy(sched->deletions);
     sched->deletions = NULL;
     g_hash_table_destroy(sched->globalchanges);
@@ -49,10 +184,12 @@ schedule_add_global_change(
     time_t date,
     const Transaction *txn)
 {
+    time_t start = sched->ref.date;
     Transaction *toadd = calloc(sizeof(Transaction), 1);
     transaction_copy(toadd, txn);
     g_hash_table_insert(sched->globalchanges, (gpointer)date, toadd);
     schedule_update_ref(sched);
+    _spawns_changed_at(sched, start, date);
 }
 
 bool
@@ -83,8 +220,10 @@ schedule_copy(Schedule *dst, const Schedule *src)
 void
 schedule_delete_at(Schedule *sched, time_t date)
 {
+    time_t start = sched->ref.date;
     g_hash_table_add(sched->deletions, (gpointer)date);
     schedule_update_ref(sched);
+    _spawns_changed_at(sched, start, date);
 }
 
 bool
@@ -130,10 +269,20 @@ schedule_is_alive(Schedule *sched)
     if (sched->stop == 0) {
         return true;
     }
-    // A bit inefficient, but isn't used a lot...
-    GSList *spawns = schedule_get_spawns(sched, sched->stop);
-    g_slist_free_full(spawns, _txn_free);
-    return spawns != NULL;
+    time_t end = _spawns_end(sched, sched->stop);
+    if (!_spawns_extend(sched, end)) {
+        return false;
+    }
+    SpawnCache *c = &sched->spawns;
+    for (unsigned int i=0; i<c->count; i++) {
+        if (c->slots[i].recurrence_date > end) {
+            break;
+        }
+        if (!c->slots[i].deleted) {
+            return true;
+        }
+    }
+    return false;
 }
 
 bool
@@ -142,70 +291,79 @@ schedule_is_deleted_at(const Schedule *sched, time_t date)
     return g_hash_table_contains(sched->deletions, (gpointer)date);
 }
 
-GSList*
-schedule_get_spawns(Schedule *sched, time_t end)
+time_t
+schedule_min_date(const Schedule *sched)
 {
-    Transaction *current_ref = &sched->ref;
-    time_t start = current_ref->date;
-    int incsize = 0;
-    time_t global_date_delta = 0;
-
+    time_t date = sched->ref.date;
     GHashTableIter iter;
     gpointer key, value;
-    g_hash_table_iter_init(&iter, sched->deletions);
-    while (g_hash_table_iter_next(&iter, &key, &value)) {
-        if ((time_t)key > end) {
-            end = (time_t)key;
-        }
-    }
     g_hash_table_iter_init(&iter, sched->globalchanges);
     while (g_hash_table_iter_next(&iter, &key, &value)) {
-        time_t rd = (time_t)key;
-        time_t vd = ((Transaction *)value)->date;
-        if (vd < rd) {
-            end += (rd - vd);
+        time_t cdate = ((Transaction *)value)->date;
+        if (cdate < date) {
+            date = cdate;
         }
     }
-    if ((sched->stop > 0) && (end > sched->stop)) {
-        end = sched->stop;
-    }
+    return date;
+}
 
+GSList*
+schedule_get_spawns(Schedule *sched, time_t end)
+{
+    end = _spawns_end(sched, end);
+    if (!_spawns_extend(sched, end)) {
+        return NULL;
+    }
     GSList *res = NULL;
-    while (true) {
-        time_t date = inc_date(start, sched->type, incsize);
-        incsize += sched->every;
-        if (date == -1) {
-            continue;
-        }
-        if (date > end) {
+    SpawnCache *c = &sched->spawns;
+    for (unsigned int i=0; i<c->count; i++) {
+        SpawnSlot *slot = &c->slots[i];
+        if (slot->recurrence_date > end) {
             break;
         }
-        Transaction *txn = g_hash_table_lookup(
-            sched->globalchanges, (gpointer)date);
-        if (txn != NULL) {
-            current_ref = txn;
-            global_date_delta = current_ref->date - date;
+        if (!slot->deleted) {
+            res = g_slist_prepend(res, (gpointer)_spawn_create(slot));
         }
-        // if txn != NULL, this schedule period is deleted
-        if (!schedule_is_deleted_at(sched, date)) {
-            Transaction *spawn = calloc(sizeof(Transaction), 1);
-            transaction_copy(spawn, current_ref);
-            spawn->type = TXN_TYPE_RECURRENCE;
-            spawn->date = date + global_date_delta;
-            spawn->recurrence_date = date;
-            spawn->ref = current_ref;
-            res = g_slist_prepend(res, (gpointer)spawn);
+    }
+    res = g_slist_reverse(res);
+    return res;
+}
+
+GSList*
+schedule_get_spawns_between(Schedule *sched, time_t from, time_t until)
+{
+    time_t end = _spawns_end(sched, until);
+    if (!_spawns_extend(sched, end)) {
+        return NULL;
+    }
+    GSList *res = NULL;
+    SpawnCache *c = &sched->spawns;
+    for (unsigned int i=0; i<c->count; i++) {
+        SpawnSlot *slot = &c->slots[i];
+        if (slot->recurrence_date > end) {
+            break;
+        }
+        time_t date = slot->recurrence_date + slot->delta;
+        if (!slot->deleted && date >= from && date <= until) {
+            res = g_slist_prepend(res, (gpointer)_spawn_create(slot));
         }
     }
     res = g_slist_reverse(res);
     return res;
 }
 
+void
+schedule_reset_spawns(Schedule *sched)
+{
+    sched->version++;
+}
+
 void
 schedule_reset_exceptions(Schedule *sched)
 {
     g_hash_table_remove_all(sched->deletions);
     g_hash_table_remove_all(sched->globalchanges);
+    schedule_reset_spawns(sched);
 }
 
 void
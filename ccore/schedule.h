@@ -35,6 +35,36 @@
  * this date, this schedule doesn't happen anymore), we simply set
  * :attr:`stop_date`.
  */
+
+/* A spawn slot, as computed by a schedule's memoized spawn generation.
+ *
+ * There's one slot per recurrence date, deleted or not. The transaction
+ * itself is only created when it's returned by schedule_get_spawns().
+ */
+typedef struct {
+    time_t recurrence_date;
+    // Delta of the global change in effect for this slot.
+    time_t delta;
+    // Model transaction for the spawn. Either the schedule's `ref` or one of
+    // its global changes.
+    Transaction *ref;
+    // inc_date() count that yielded `recurrence_date`.
+    int incsize;
+    bool deleted;
+} SpawnSlot;
+
+typedef struct {
+    // Schedule version these slots were generated for.
+    unsigned int version;
+    unsigned int count;
+    unsigned int capacity;
+    SpawnSlot *slots;
+    // Generation state for the next slot
+    int incsize;
+    Transaction *ref;
+    time_t delta;
+} SpawnCache;
+
 typedef struct {
     Transaction ref;
     // date at which the schedule stops. 0 if never.
@@ -45,6 +75,10 @@ typedef struct {
     // key-only hash. Contains the recurrence date of deleted occurrences.
     GHashTable *deletions;
     GHashTable *globalchanges;
+    // Bumped whenever the schedule changes in a way that invalidates all of
+    // its memoized spawns.
+    unsigned int version;
+    SpawnCache spawns;
 } Schedule;
 
 // ref is copied, not kept as a pointer.
@@ -83,6 +117,11 @@ schedule_is_alive(Schedule *sched);
 bool
 schedule_is_deleted_at(const Schedule *sched, time_t date);
 
+// Returns the earliest date among our ref and our global changes, that is,
+// the earliest date from which our spawns can be affected by a change to us.
+time_t
+schedule_min_date(const Schedule *sched);
+
 /* Returns the list of transactions spawned by our schedule.
  *
  * We start at :attr:`start_date` and end at ``end``. We have to specify an end
@@ -98,10 +137,28 @@ schedule_is_deleted_at(const Schedule *sched, time_t date);
  * The caller is responsible for freeing the resuling GSList. The caller also
  * inherits ownership of the returned spawn (they're freshly created, not
  * referenced anywhere).
+ *
+ * Spawn dates are memoized: they're only computed for recurrence dates we
+ * haven't reached before. Exception changes only discard the memoized dates
+ * that follow them.
  */
 GSList*
 schedule_get_spawns(Schedule *sched, time_t end);
 
+/* Same as schedule_get_spawns(), but only returns spawns with a date between
+ * `from` and `until` inclusively. Spawns outside that range aren't created.
+ */
+GSList*
+schedule_get_spawns_between(Schedule *sched, time_t from, time_t until);
+
+/* Discards all memoized spawns.
+ *
+ * Call this after changing the schedule's ref date, type or repeat interval
+ * directly.
+ */
+void
+schedule_reset_spawns(Schedule *sched);
+
 void
 schedule_reset_exceptions(Schedule *sched);
 
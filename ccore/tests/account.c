@@ -113,6 +113,43 @@ static void test_accounts_rename()
     accounts_deinit(&al);
 }
 
+static void test_accounts_find_after_changes()
+{
+    /* Lookups keep working as accounts are changed, removed and undeleted. */
+    AccountList al;
+
+    accounts_init(&al, NULL);
+    Account *a1 = accounts_create(&al);
+    account_init(a1, "one", NULL, ACCOUNT_ASSET);
+    strset(&a1->account_number, "42");
+    Account *a2 = accounts_create(&al);
+    account_init(a2, "two", NULL, ACCOUNT_ASSET);
+    strset(&a2->account_number, "42");
+    strset(&a2->reference, "ref");
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_name(&al, "42"), a1);
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_reference(&al, "ref"), a2);
+    CU_ASSERT_PTR_NULL(accounts_find_by_reference(&al, ""));
+
+    // The account number now points to the next account having it.
+    accounts_remove(&al, a1);
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_name(&al, "42"), a2);
+    CU_ASSERT_PTR_NULL(accounts_find_by_name(&al, "one"));
+    accounts_undelete(&al, a1);
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_name(&al, "one"), a1);
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_name(&al, "42"), a2);
+
+    // Changes made directly on the account are picked up once signaled.
+    strset(&a2->reference, "other");
+    account_keys_changed();
+    CU_ASSERT_PTR_NULL(accounts_find_by_reference(&al, "ref"));
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_reference(&al, "other"), a2);
+
+    // A name matching another account's number: the first in the list wins.
+    Account *a3 = accounts_create(&al);
+    account_init(a3, "42", NULL, ACCOUNT_ASSET);
+    CU_ASSERT_PTR_EQUAL(accounts_find_by_name(&al, "42"), a2);
+    accounts_deinit(&al);
+}
 
 void test_account_init()
 {
@@ -124,5 +161,6 @@ void test_account_init()
     CU_ADD_TEST(s, test_accounts_find_account_number);
     CU_ADD_TEST(s, test_accounts_remove);
     CU_ADD_TEST(s, test_accounts_rename);
+    CU_ADD_TEST(s, test_accounts_find_after_changes);
 }
 
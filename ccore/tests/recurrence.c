@@ -1,5 +1,7 @@
 #include <CUnit/CUnit.h>
 #include "../recurrence.h"
+#include "../schedule.h"
+#include "../util.h"
 
 static time_t mkdate(int year, int month, int day)
 {
@@ -77,6 +79,87 @@ static void test_inc_weekday_last()
     CU_ASSERT_EQUAL(res, mkdate(2019, 2, 26));
 }
 
+static void
+free_spawns(GSList *spawns)
+{
+    GSList *iter = spawns;
+    while (iter) {
+        transaction_deinit(iter->data);
+        free(iter->data);
+        iter = g_slist_next(iter);
+    }
+    g_slist_free(spawns);
+}
+
+// Asserts that the memoized spawns of `sched` are the same as the ones of a
+// freshly copied schedule.
+static void
+assert_spawns_fresh(Schedule *sched, time_t from, time_t until)
+{
+    Schedule fresh = {0};
+    schedule_copy(&fresh, sched);
+    GSList *spawns1 = schedule_get_spawns_between(sched, from, until);
+    GSList *spawns2 = schedule_get_spawns_between(&fresh, from, until);
+    CU_ASSERT_EQUAL(g_slist_length(spawns1), g_slist_length(spawns2));
+    GSList *iter1 = spawns1;
+    GSList *iter2 = spawns2;
+    while (iter1 && iter2) {
+        Transaction *t1 = iter1->data;
+        Transaction *t2 = iter2->data;
+        CU_ASSERT_EQUAL(t1->date, t2->date);
+        CU_ASSERT_EQUAL(t1->recurrence_date, t2->recurrence_date);
+        CU_ASSERT_STRING_EQUAL(t1->description, t2->description);
+        iter1 = g_slist_next(iter1);
+        iter2 = g_slist_next(iter2);
+    }
+    free_spawns(spawns1);
+    free_spawns(spawns2);
+    schedule_deinit(&fresh);
+}
+
+static void test_schedule_spawns_memoized()
+{
+    Transaction ref;
+    Schedule sched = {0};
+    transaction_init(&ref, TXN_TYPE_NORMAL, mkdate(2019, 1, 1));
+    strset(&ref.description, "foo");
+    schedule_init(&sched, &ref, REPEAT_WEEKLY, 1);
+
+    GSList *spawns = schedule_get_spawns(&sched, mkdate(2019, 3, 1));
+    CU_ASSERT_EQUAL(g_slist_length(spawns), 9);
+    free_spawns(spawns);
+    // Only spawns within the range are returned
+    spawns = schedule_get_spawns_between(
+        &sched, mkdate(2019, 1, 8), mkdate(2019, 1, 22));
+    CU_ASSERT_EQUAL(g_slist_length(spawns), 3);
+    CU_ASSERT_EQUAL(((Transaction *)spawns->data)->date, mkdate(2019, 1, 8));
+    free_spawns(spawns);
+
+    // Changes in exceptions are correctly reflected in memoized spawns
+    schedule_delete_at(&sched, mkdate(2019, 2, 5));
+    assert_spawns_fresh(&sched, 0, mkdate(2019, 3, 1));
+    Transaction change;
+    transaction_init(&change, TXN_TYPE_NORMAL, mkdate(2019, 1, 23));
+    strset(&change.description, "bar");
+    schedule_add_global_change(&sched, mkdate(2019, 1, 22), &change);
+    assert_spawns_fresh(&sched, 0, mkdate(2019, 3, 1));
+    spawns = schedule_get_spawns_between(
+        &sched, mkdate(2019, 1, 23), mkdate(2019, 1, 23));
+    CU_ASSERT_EQUAL(g_slist_length(spawns), 1);
+    CU_ASSERT_STRING_EQUAL(((Transaction *)spawns->data)->description, "bar");
+    free_spawns(spawns);
+    // Deleting the first spawn moves the start date
+    schedule_delete_at(&sched, mkdate(2019, 1, 1));
+    assert_spawns_fresh(&sched, 0, mkdate(2019, 4, 1));
+    // Changing the type directly requires a spawn reset
+    sched.type = REPEAT_DAILY;
+    schedule_reset_spawns(&sched);
+    assert_spawns_fresh(&sched, 0, mkdate(2019, 4, 1));
+    schedule_deinit(&sched);
+    transaction_deinit(&ref);
+    transaction_deinit(&change);
+}
+
 void test_recurrence_init()
 {
     CU_pSuite s;
@@ -88,5 +171,6 @@ void test_recurrence_init()
     CU_ADD_TEST(s, test_inc_yearly);
     CU_ADD_TEST(s, test_inc_weekday);
     CU_ADD_TEST(s, test_inc_weekday_last);
+    CU_ADD_TEST(s, test_schedule_spawns_memoized);
 }
 
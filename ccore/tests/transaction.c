@@ -1,5 +1,7 @@
 #include <CUnit/CUnit.h>
+#include <stdlib.h>
 #include "../transaction.h"
+#include "../transactions.h"
 #include "../accounts.h"
 #include "../currency.h"
 
@@ -137,6 +139,104 @@ static void test_affected_accounts()
     CU_ASSERT_PTR_NULL(affected[2]);
 }
 
+static void test_txnlist_sorted()
+{
+    TransactionList tl;
+    transactions_init(&tl);
+    Transaction t1, t2, t3, t4;
+    transaction_init(&t1, TXN_TYPE_NORMAL, 42);
+    transaction_init(&t2, TXN_TYPE_NORMAL, 12);
+    transaction_init(&t3, TXN_TYPE_NORMAL, 42);
+    transaction_init(&t4, TXN_TYPE_NORMAL, 30);
+    transactions_add(&tl, &t1, false);
+    transactions_add(&tl, &t2, false);
+    transactions_add(&tl, &t3, false);
+    transactions_add(&tl, &t4, false);
+    // We're always in (date, position) order
+    CU_ASSERT_PTR_EQUAL(tl.txns[0], &t2);
+    CU_ASSERT_PTR_EQUAL(tl.txns[1], &t4);
+    CU_ASSERT_PTR_EQUAL(tl.txns[2], &t1);
+    CU_ASSERT_PTR_EQUAL(tl.txns[3], &t3);
+    // t3 ended up at the end of its date
+    CU_ASSERT_EQUAL(t3.position, 1);
+    CU_ASSERT_EQUAL(transactions_find(&tl, &t3), 3);
+    CU_ASSERT_EQUAL(transactions_bisect_date(&tl, 30), 1);
+    CU_ASSERT_EQUAL(transactions_bisect_date(&tl, 31), 2);
+    CU_ASSERT_EQUAL(transactions_bisect_date(&tl, 43), 4);
+    Transaction **bunch = transactions_at_date(&tl, 42);
+    CU_ASSERT_PTR_EQUAL(bunch[0], &t1);
+    CU_ASSERT_PTR_EQUAL(bunch[1], &t3);
+    CU_ASSERT_PTR_NULL(bunch[2]);
+    free(bunch);
+    CU_ASSERT_PTR_NULL(transactions_at_date(&tl, 41));
+
+    // Moving t3 before t1 puts it in the right place
+    transactions_move_before(&tl, &t3, &t1);
+    CU_ASSERT_PTR_EQUAL(tl.txns[2], &t3);
+    CU_ASSERT_PTR_EQUAL(tl.txns[3], &t1);
+
+    CU_ASSERT_TRUE(transactions_remove(&tl, &t4));
+    CU_ASSERT_FALSE(transactions_remove(&tl, &t4));
+    CU_ASSERT_EQUAL(transactions_find(&tl, &t4), -1);
+    CU_ASSERT_EQUAL(tl.count, 3);
+    CU_ASSERT_PTR_EQUAL(tl.txns[1], &t3);
+    transactions_deinit(&tl);
+}
+
+static void test_txnlist_drift()
+{
+    /* Txns modified in place can still be found and are put back in their
+     * place by transactions_sort().
+     */
+    TransactionList tl;
+    transactions_init(&tl);
+    Transaction t1, t2, t3;
+    transaction_init(&t1, TXN_TYPE_NORMAL, 10);
+    transaction_init(&t2, TXN_TYPE_NORMAL, 20);
+    transaction_init(&t3, TXN_TYPE_NORMAL, 30);
+    transactions_add(&tl, &t1, false);
+    transactions_add(&tl, &t2, false);
+    transactions_add(&tl, &t3, false);
+    t1.date = 40;
+    CU_ASSERT_EQUAL(transactions_find(&tl, &t1), 0);
+    transactions_sort(&tl);
+    CU_ASSERT_EQUAL(transactions_find(&tl, &t1), 2);
+    CU_ASSERT_PTR_EQUAL(tl.txns[0], &t2);
+    CU_ASSERT_PTR_EQUAL(tl.txns[1], &t3);
+    t3.date = 5;
+    CU_ASSERT_TRUE(transactions_reposition(&tl, &t3));
+    CU_ASSERT_PTR_EQUAL(tl.txns[0], &t3);
+    transactions_deinit(&tl);
+}
+
+static void test_txnlist_add_many()
+{
+    /* Adding txns in bulk gives the same result as adding them one by one.
+     */
+    TransactionList tl;
+    transactions_init(&tl);
+    Transaction t1, t2, t3, t4, t5;
+    transaction_init(&t1, TXN_TYPE_NORMAL, 42);
+    transaction_init(&t2, TXN_TYPE_NORMAL, 12);
+    transaction_init(&t3, TXN_TYPE_NORMAL, 42);
+    transaction_init(&t4, TXN_TYPE_NORMAL, 30);
+    transaction_init(&t5, TXN_TYPE_NORMAL, 42);
+    transactions_add(&tl, &t1, false);
+    Transaction *toadd[] = {&t2, &t3, &t4, &t5};
+    transactions_add_many(&tl, toadd, 4, false);
+    CU_ASSERT_EQUAL(tl.count, 5);
+    CU_ASSERT_PTR_EQUAL(tl.txns[0], &t2);
+    CU_ASSERT_PTR_EQUAL(tl.txns[1], &t4);
+    CU_ASSERT_PTR_EQUAL(tl.txns[2], &t1);
+    CU_ASSERT_PTR_EQUAL(tl.txns[3], &t3);
+    CU_ASSERT_PTR_EQUAL(tl.txns[4], &t5);
+    CU_ASSERT_EQUAL(t3.position, 1);
+    CU_ASSERT_EQUAL(t5.position, 2);
+    CU_ASSERT_EQUAL(transactions_find(&tl, &t5), 4);
+    CU_ASSERT_EQUAL(transactions_bisect_date(&tl, 31), 2);
+    transactions_deinit(&tl);
+}
+
 void test_transaction_init()
 {
     CU_pSuite s;
@@ -146,4 +246,7 @@ void test_transaction_init()
     CU_ADD_TEST(s, test_balance_currencies);
     CU_ADD_TEST(s, test_balance);
     CU_ADD_TEST(s, test_affected_accounts);
+    CU_ADD_TEST(s, test_txnlist_sorted);
+    CU_ADD_TEST(s, test_txnlist_drift);
+    CU_ADD_TEST(s, test_txnlist_add_many);
 }
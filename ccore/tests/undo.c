@@ -1,6 +1,8 @@
 #include <CUnit/CUnit.h>
+#include <stdlib.h>
 #include "../accounts.h"
 #include "../undo.h"
+#include "../util.h"
 
 static void test_string_ownership()
 {
@@ -26,11 +28,52 @@ static void test_string_ownership()
     CU_ASSERT_STRING_EQUAL(a->name, "foo"); // no segfault
 }
 
+static void test_dirty_range()
+{
+    /* An undo step tells which date and accounts it affects */
+    AccountList al = {0};
+    TransactionList tl = {0};
+    Currency *CAD = currency_get("CAD");
+    accounts_init(&al, CAD);
+    transactions_init(&tl);
+    Account *a1 = accounts_create(&al);
+    account_init(a1, "foo", CAD, ACCOUNT_ASSET);
+    Account *a2 = accounts_create(&al);
+    account_init(a2, "bar", CAD, ACCOUNT_ASSET);
+    Transaction *t = calloc(sizeof(Transaction), 1);
+    transaction_init(t, TXN_TYPE_NORMAL, 4200);
+    Split *s = transaction_add_split(t);
+    s->account = a1;
+    transactions_add(&tl, t, false);
+    UndoStep us = {0};
+    Transaction *changed_txns[2] = {t, NULL};
+    undostep_init(&us, NULL, NULL, NULL, NULL, NULL, changed_txns, NULL);
+    // We move our txn earlier and to another account.
+    t->date = 4100;
+    s->account = a2;
+    undostep_undo(&us, &al, &tl);
+    // Both the old and the new versions of the txn are considered
+    CU_ASSERT_EQUAL(undostep_dirty_date(&us), 4100);
+    Account **affected = undostep_affected_accounts(&us);
+    CU_ASSERT_EQUAL(listlen((void *)affected), 2);
+    CU_ASSERT(pointer_in_list((void **)affected, a1));
+    CU_ASSERT(pointer_in_list((void **)affected, a2));
+    free(affected);
+    undostep_deinit(&us);
+
+    // When accounts change, everything is dirty.
+    Account *changed_accounts[2] = {a1, NULL};
+    undostep_init(&us, NULL, NULL, changed_accounts, NULL, NULL, NULL, NULL);
+    CU_ASSERT_EQUAL(undostep_dirty_date(&us), 0);
+    undostep_deinit(&us);
+}
+
 void test_undo_init()
 {
     CU_pSuite s;
 
     s = CU_add_suite("Undo", NULL, NULL);
     CU_ADD_TEST(s, test_string_ownership);
+    CU_ADD_TEST(s, test_dirty_range);
 }
 
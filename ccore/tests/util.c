@@ -16,12 +16,44 @@ static void test_strstrip()
     free(dst);
 }
 
+static void test_vec_capacity()
+{
+    // We grow by doubling
+    CU_ASSERT_EQUAL(vec_capacity(0, 0), 0);
+    CU_ASSERT_EQUAL(vec_capacity(0, 1), 16);
+    CU_ASSERT_EQUAL(vec_capacity(16, 16), 16);
+    CU_ASSERT_EQUAL(vec_capacity(16, 17), 32);
+    CU_ASSERT_EQUAL(vec_capacity(32, 100), 128);
+    // But only shrink when we're under a quarter of our capacity
+    CU_ASSERT_EQUAL(vec_capacity(128, 33), 128);
+    CU_ASSERT_EQUAL(vec_capacity(128, 31), 64);
+    CU_ASSERT_EQUAL(vec_capacity(128, 0), 16);
+}
+
+static void test_vec_resize()
+{
+    int *items = NULL;
+    unsigned int capacity = 0;
+    for (int i=0; i<100; i++) {
+        CU_ASSERT_TRUE_FATAL(vec_resize((void **)&items, sizeof(int), i+1, &capacity));
+        items[i] = i;
+    }
+    CU_ASSERT_EQUAL(capacity, 128);
+    CU_ASSERT_EQUAL(items[99], 99);
+    CU_ASSERT_TRUE_FATAL(vec_resize((void **)&items, sizeof(int), 10, &capacity));
+    CU_ASSERT_EQUAL(capacity, 32);
+    CU_ASSERT_EQUAL(items[9], 9);
+    free(items);
+}
+
 void test_util_init()
 {
     CU_pSuite s;
 
     s = CU_add_suite("Util", NULL, NULL);
     CU_ADD_TEST(s, test_strstrip);
+    CU_ADD_TEST(s, test_vec_capacity);
+    CU_ADD_TEST(s, test_vec_resize);
 }
 
 
@@ -1,5 +1,12 @@
 #include <stdlib.h>
+#include <string.h>
+#include <limits.h>
 #include "transactions.h"
+#include "util.h"
+
+// Past this number of drifted txns, transactions_sort() re-sorts everything
+// instead of repositioning txns one by one.
+#define TRANSACTIONS_MAX_REPOSITION 32
 
 /* Private */
 static int
@@ -17,6 +24,26 @@ _txn_cmp_key(const void *a, const void *b)
     return 0;
 }
 
+// A txn being added by transactions_add_many(). `order` is its index in the
+// added txns and keeps txns with the same key in the order they were given.
+typedef struct {
+    Transaction *txn;
+    unsigned int order;
+} _TxnToAdd;
+
+static int
+_txn_cmp_toadd(const void *a, const void *b)
+{
+    const _TxnToAdd *t1 = a;
+    const _TxnToAdd *t2 = b;
+
+    int res = _txn_cmp_key(&t1->txn, &t2->txn);
+    if (res == 0) {
+        res = t1->order < t2->order ? -1 : 1;
+    }
+    return res;
+}
+
 static int
 _txn_cmp_mtime(const void *a, const void *b)
 {
@@ -50,12 +77,120 @@ _txn_cmp_mtime(const void *a, const void *b)
 /*    g_hash_table_destroy(seen);                                  */
 /*}                                                                */
 
+/* Returns the index at which a txn with key (date, position) would be
+ * inserted in `txns`.
+ *
+ * If `after` is true, the index is after all txns having the same key.
+ * Otherwise, it's before them.
+ */
+static unsigned int
+_txns_bisect(
+    const TransactionList *txns,
+    time_t date,
+    int position,
+    bool after)
+{
+    unsigned int low = 0;
+    unsigned int high = txns->count;
+    while (low < high) {
+        unsigned int mid = low + ((high - low) / 2);
+        const TransactionKey *key = &txns->keys[mid];
+        bool before;
+        if (key->date != date) {
+            before = key->date < date;
+        } else if (key->position != position) {
+            before = key->position < position;
+        } else {
+            before = after;
+        }
+        if (before) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low;
+}
+
+static void
+_txns_key_set(TransactionList *txns, unsigned int index, time_t date, int position)
+{
+    TransactionKey *key = &txns->keys[index];
+    key->date = date;
+    key->position = position;
+    key = g_hash_table_lookup(txns->index, txns->txns[index]);
+    key->date = date;
+    key->position = position;
+}
+
+// Adjusts our capacity to our count.
+static void
+_txns_resize(TransactionList *txns)
+{
+    unsigned int capacity = vec_capacity(txns->capacity, txns->count);
+    if (capacity == txns->capacity) {
+        return;
+    }
+    txns->txns = realloc(txns->txns, sizeof(Transaction*) * capacity);
+    txns->keys = realloc(txns->keys, sizeof(TransactionKey) * capacity);
+    txns->capacity = capacity;
+}
+
+static void
+_txns_insert(TransactionList *txns, Transaction *txn)
+{
+    unsigned int index = _txns_bisect(txns, txn->date, txn->position, true);
+    txns->count++;
+    _txns_resize(txns);
+    unsigned int tomove = txns->count - index - 1;
+    memmove(
+        &txns->txns[index+1],
+        &txns->txns[index],
+        sizeof(Transaction*) * tomove);
+    memmove(
+        &txns->keys[index+1],
+        &txns->keys[index],
+        sizeof(TransactionKey) * tomove);
+    txns->txns[index] = txn;
+    g_hash_table_insert(txns->index, txn, malloc(sizeof(TransactionKey)));
+    _txns_key_set(txns, index, txn->date, txn->position);
+}
+
+static void
+_txns_remove_at(TransactionList *txns, unsigned int index)
+{
+    g_hash_table_remove(txns->index, txns->txns[index]);
+    unsigned int tomove = txns->count - index - 1;
+    memmove(
+        &txns->txns[index],
+        &txns->txns[index+1],
+        sizeof(Transaction*) * tomove);
+    memmove(
+        &txns->keys[index],
+        &txns->keys[index+1],
+        sizeof(TransactionKey) * tomove);
+    txns->count--;
+    _txns_resize(txns);
+}
+
+static bool
+_txns_has_drifted(const TransactionList *txns, unsigned int index)
+{
+    const TransactionKey *key = &txns->keys[index];
+    const Transaction *txn = txns->txns[index];
+    return (key->date != txn->date) || (key->position != txn->position);
+}
+
 /* Public */
 void
 transactions_init(TransactionList *txns)
 {
     txns->count = 0;
+    txns->capacity = 0;
     txns->txns = NULL;
+    txns->keys = NULL;
+    txns->index = g_hash_table_new_full(
+        g_direct_hash, g_direct_equal, NULL, free);
 }
 
 void
@@ -67,6 +202,12 @@ transactions_deinit(TransactionList *txns)
     /*    free(txn);                       */
     /*}                                    */
     free(txns->txns);
+    txns->txns = NULL;
+    free(txns->keys);
+    txns->keys = NULL;
+    txns->capacity = 0;
+    g_hash_table_destroy(txns->index);
+    txns->index = NULL;
 }
 
 char**
@@ -79,7 +220,8 @@ transactions_account_names(const TransactionList *txns)
     // we don't know our upper count limit beforehand. Let's try with
     // txns->count and realloc if needed.
     int count = txns->count;
-    char **res = malloc(sizeof(char*) * count);
+    // +1 for the NULL terminator
+    char **res = malloc(sizeof(char*) * (count + 1));
     int current = 0;
     for (int i=txns->count-1; i>=0; i--) {
         Account **accounts = transaction_affected_accounts(bymtime[i]);
@@ -88,7 +230,7 @@ transactions_account_names(const TransactionList *txns)
                 if (current == count) {
                     // Didn't allocate enough space. double it.
                     count *= 2;
-                    res = realloc(res, sizeof(char*) * count);
+                    res = realloc(res, sizeof(char*) * (count + 1));
                 }
                 res[current] = (*accounts)->name;
                 current++;
@@ -103,59 +245,116 @@ transactions_account_names(const TransactionList *txns)
 void
 transactions_add(TransactionList *txns, Transaction *txn, bool keep_position)
 {
+    if (g_hash_table_contains(txns->index, txn)) {
+        // Already there. The only thing we might have to do is to put it back
+        // in its place.
+        transactions_reposition(txns, txn);
+        return;
+    }
     if (!keep_position) {
-        Transaction **others = transactions_at_date(txns, txn->date);
-        if (others != NULL) {
-            Transaction **iter = others;
-            while (*iter != NULL) {
-                if ((*iter)->position >= txn->position) {
-                    txn->position = (*iter)->position + 1;
-                }
-                iter++;
+        // Our txns being sorted, the last txn of the date has the highest
+        // position.
+        unsigned int end = _txns_bisect(txns, txn->date, INT_MAX, true);
+        if (end > 0) {
+            const TransactionKey *last = &txns->keys[end-1];
+            if ((last->date == txn->date) && (last->position >= txn->position)) {
+                txn->position = last->position + 1;
             }
-            free(others);
         }
     }
-    txns->count++;
-    txns->txns = realloc(txns->txns, sizeof(Transaction*) * txns->count);
-    txns->txns[txns->count-1] = txn;
+    _txns_insert(txns, txn);
 }
 
-Transaction**
-transactions_at_date(const TransactionList *txns, time_t date)
+void
+transactions_add_many(
+    TransactionList *txns,
+    Transaction **toadd,
+    unsigned int count,
+    bool keep_position)
 {
-    /* We don't (yet) maintain sort order at all times, so we have to iterate
-     * through the whole list. However, most of the time, all resulting txns
-     * will be bunched up together. Because we don't know how many elements we
-     * need to allocate yet, we start with a first pass, to get first/last
-     * indexes and count. This then allows us to allocate and, with first/last,
-     * make the second pass usually much faster.
-     */
-    int first, last, count=0;
-    for (int i=0; i<txns->count; i++) {
-        if (txns->txns[i]->date == date) {
-            last = i;
-            if (count == 0) {
-                first = i;
+    _TxnToAdd *added = malloc(sizeof(_TxnToAdd) * count);
+    unsigned int addcount = 0;
+    // date -> highest position among txns of that date. Initialized from the
+    // list the first time we meet a date.
+    GHashTable *lastpos = g_hash_table_new(g_direct_hash, g_direct_equal);
+    for (unsigned int i=0; i<count; i++) {
+        Transaction *txn = toadd[i];
+        if (g_hash_table_contains(txns->index, txn)) {
+            transactions_reposition(txns, txn);
+            continue;
+        }
+        if (!keep_position) {
+            gpointer key = (gpointer)txn->date;
+            gpointer last;
+            bool found = g_hash_table_lookup_extended(lastpos, key, NULL, &last);
+            if (!found) {
+                unsigned int end = _txns_bisect(txns, txn->date, INT_MAX, true);
+                if ((end > 0) && (txns->keys[end-1].date == txn->date)) {
+                    last = GINT_TO_POINTER(txns->keys[end-1].position);
+                    found = true;
+                }
             }
-            count++;
+            if (found && (GPOINTER_TO_INT(last) >= txn->position)) {
+                txn->position = GPOINTER_TO_INT(last) + 1;
+            }
+            g_hash_table_insert(lastpos, key, GINT_TO_POINTER(txn->position));
         }
+        added[addcount].txn = txn;
+        added[addcount].order = addcount;
+        addcount++;
     }
+    g_hash_table_destroy(lastpos);
+    qsort(added, addcount, sizeof(_TxnToAdd), _txn_cmp_toadd);
+
+    // Merge our sorted txns with the list, from the end. Added txns go after
+    // listed txns having the same key.
+    int i = txns->count - 1;
+    int j = addcount - 1;
+    txns->count += addcount;
+    _txns_resize(txns);
+    unsigned int k = txns->count;
+    while (j >= 0) {
+        k--;
+        Transaction *txn = added[j].txn;
+        if (i >= 0) {
+            const TransactionKey *key = &txns->keys[i];
+            if ((key->date > txn->date) || ((key->date == txn->date)
+                    && (key->position > txn->position))) {
+                txns->txns[k] = txns->txns[i];
+                txns->keys[k] = *key;
+                i--;
+                continue;
+            }
+        }
+        txns->txns[k] = txn;
+        g_hash_table_insert(txns->index, txn, malloc(sizeof(TransactionKey)));
+        _txns_key_set(txns, k, txn->date, txn->position);
+        j--;
+    }
+    free(added);
+}
+
+Transaction**
+transactions_at_date(const TransactionList *txns, time_t date)
+{
+    unsigned int first = _txns_bisect(txns, date, INT_MIN, false);
+    unsigned int end = _txns_bisect(txns, date, INT_MAX, true);
+    unsigned int count = end - first;
     if (count == 0) {
         return NULL;
     }
     Transaction** res = malloc(sizeof(Transaction*) * (count+1));
-    int fillindex = 0;
-    for (int i=first; i<=last; i++) {
-        if (txns->txns[i]->date == date) {
-            res[fillindex] = txns->txns[i];
-            fillindex++;
-        }
-    }
+    memcpy(res, &txns->txns[first], sizeof(Transaction*) * count);
     res[count] = NULL;
     return res;
 }
 
+unsigned int
+transactions_bisect_date(const TransactionList *txns, time_t date)
+{
+    return _txns_bisect(txns, date, INT_MIN, false);
+}
+
 char**
 transactions_descriptions(const TransactionList *txns)
 {
@@ -178,47 +377,62 @@ transactions_descriptions(const TransactionList *txns)
 int
 transactions_find(const TransactionList *txns, Transaction *txn)
 {
-    for (int i=0; i<txns->count; i++) {
+    const TransactionKey *key = g_hash_table_lookup(txns->index, txn);
+    if (key == NULL) {
+        return -1;
+    }
+    unsigned int index = _txns_bisect(txns, key->date, key->position, false);
+    // We're at the beginning of the txns having the same key. Ours is
+    // among them.
+    for (unsigned int i=index; i<txns->count; i++) {
         if (txns->txns[i] == txn) {
             return i;
         }
     }
+    // not supposed to happen
     return -1;
 }
 
 void
 transactions_move_before(
-    const TransactionList *txns,
+    TransactionList *txns,
     Transaction *txn,
     Transaction *target)
 {
-    if (transactions_find(txns, txn) == -1) {
+    int index = transactions_find(txns, txn);
+    if (index == -1) {
         return;
     }
     if ((target != NULL) && (txn->date != target->date)) {
         target = NULL;
     }
-    Transaction **bunch = transactions_at_date(txns, txn->date);
-    Transaction **iter = bunch;
+    // We take `txn` out of the list while we shuffle positions around and
+    // then we put it back in its new place.
+    _txns_remove_at(txns, index);
+    unsigned int first = _txns_bisect(txns, txn->date, INT_MIN, false);
+    unsigned int end = _txns_bisect(txns, txn->date, INT_MAX, true);
     if (target == NULL) {
         // set txn->position to the highest value of its bunch
-        while (*iter != NULL) {
-            if ((*iter != txn) && ((*iter)->position >= txn->position)) {
-                txn->position = (*iter)->position + 1;
+        for (unsigned int i=first; i<end; i++) {
+            Transaction *other = txns->txns[i];
+            if (other->position >= txn->position) {
+                txn->position = other->position + 1;
             }
-            iter++;
         }
     } else {
         // set txn position to its target and offset everything after it
         txn->position = target->position;
-        while (*iter != NULL) {
-            if ((*iter != txn) && ((*iter)->position >= txn->position)) {
-                (*iter)->position++;
+        for (unsigned int i=first; i<end; i++) {
+            Transaction *other = txns->txns[i];
+            if (other->position >= txn->position) {
+                other->position++;
+                // We offset a whole tail of the bunch: order stays the same.
+                const TransactionKey *key = &txns->keys[i];
+                _txns_key_set(txns, i, key->date, key->position + 1);
             }
-            iter++;
         }
     }
-    free(bunch);
+    _txns_insert(txns, txn);
 }
 
 char**
@@ -265,18 +479,53 @@ transactions_remove(TransactionList *txns, Transaction *txn)
         // bad pointer
         return false;
     }
-    // we have to move memory around
-    memmove(
-        &txns->txns[index],
-        &txns->txns[index+1],
-        sizeof(Transaction*) * (txns->count - index - 1));
-    txns->count--;
-    txns->txns = realloc(txns->txns, sizeof(Transaction*) * txns->count);
+    _txns_remove_at(txns, index);
+    return true;
+}
+
+bool
+transactions_reposition(TransactionList *txns, Transaction *txn)
+{
+    int index = transactions_find(txns, txn);
+    if (index == -1) {
+        return false;
+    }
+    if (_txns_has_drifted(txns, index)) {
+        _txns_remove_at(txns, index);
+        _txns_insert(txns, txn);
+    }
     return true;
 }
 
 void
 transactions_sort(TransactionList *txns)
 {
-    qsort(txns->txns, txns->count, sizeof(Transaction*), _txn_cmp_key);
+    unsigned int driftcount = 0;
+    for (unsigned int i=0; i<txns->count; i++) {
+        if (_txns_has_drifted(txns, i)) {
+            driftcount++;
+        }
+    }
+    if (!driftcount) {
+        return;
+    }
+    if (driftcount > TRANSACTIONS_MAX_REPOSITION) {
+        qsort(txns->txns, txns->count, sizeof(Transaction*), _txn_cmp_key);
+        for (unsigned int i=0; i<txns->count; i++) {
+            Transaction *txn = txns->txns[i];
+            _txns_key_set(txns, i, txn->date, txn->position);
+        }
+        return;
+    }
+    Transaction *drifted[TRANSACTIONS_MAX_REPOSITION];
+    unsigned int count = 0;
+    for (unsigned int i=0; i<txns->count; i++) {
+        if (_txns_has_drifted(txns, i)) {
+            drifted[count] = txns->txns[i];
+            count++;
+        }
+    }
+    for (unsigned int i=0; i<count; i++) {
+        transactions_reposition(txns, drifted[i]);
+    }
 }
@@ -1,9 +1,36 @@
 #pragma once
+#include <glib.h>
 #include "transaction.h"
 
+/* The (date, position) pair under which a txn is sorted in a TransactionList
+ */
+typedef struct {
+    time_t date;
+    int position;
+} TransactionKey;
+
+/* A list of transactions, always kept in (date, position) order.
+ *
+ * Transactions are often modified in place (through their Python wrapper or
+ * through an undo operation) while being in the list. Because of this, the
+ * list remembers, for each txn, the key under which it was inserted. `keys` is
+ * a parallel array of `txns` holding those keys (and is what binary searches
+ * run on) and `index` maps each txn pointer to its key, which allows us to
+ * locate any txn in logarithmic time, even if it was modified in place.
+ *
+ * When a txn is modified in place, it "drifts" from its recorded key.
+ * Functions that modify txns with knowledge of the list (move_before() for
+ * example) put them back in place, but other modifications need a
+ * transactions_sort() call to resync the list.
+ */
 typedef struct {
     unsigned int count;
+    // Allocated size of `txns` and `keys`. See vec_capacity().
+    unsigned int capacity;
     Transaction **txns;
+    TransactionKey *keys;
+    // Transaction* -> TransactionKey*
+    GHashTable *index;
 } TransactionList;
 
 void
@@ -22,17 +49,41 @@ transactions_account_names(const TransactionList *txns);
 void
 transactions_add(TransactionList *txns, Transaction *txn, bool keep_position);
 
+/* Adds the `count` txns in `toadd` to the list.
+ *
+ * The result is the same as calling transactions_add() on each of them, in
+ * order, but we sort the new txns once and merge them with the list in a
+ * single pass instead of inserting them one by one.
+ */
+void
+transactions_add_many(
+    TransactionList *txns,
+    Transaction **toadd,
+    unsigned int count,
+    bool keep_position);
+
 /* Returns a NULL-terminated list of txns with specified date
  *
  * The resulting list must be freed with free(). Returns NULL if there's no
  * matching txn.
+ *
+ * Dates are those under which txns were last sorted (see TransactionList).
  */
 Transaction**
 transactions_at_date(const TransactionList *txns, time_t date);
 
+/* Returns the index of the first txn having a date >= `date`.
+ *
+ * Returns `count` if all txns are before `date`.
+ */
+unsigned int
+transactions_bisect_date(const TransactionList *txns, time_t date);
+
 char**
 transactions_descriptions(const TransactionList *txns);
 
+/* Returns the index of `txn` in the list, or -1 if it's not there.
+ */
 int
 transactions_find(const TransactionList *txns, Transaction *txn);
 
@@ -49,7 +100,7 @@ transactions_find(const TransactionList *txns, Transaction *txn);
  */
 void
 transactions_move_before(
-    const TransactionList *txns,
+    TransactionList *txns,
     Transaction *txn,
     Transaction *target);
 
@@ -70,5 +121,18 @@ transactions_reassign_account(
 bool
 transactions_remove(TransactionList *txns, Transaction *txn);
 
+/* Puts `txn` back in its proper place after it's been modified in place.
+ *
+ * Returns false if `txn` isn't in the list.
+ */
+bool
+transactions_reposition(TransactionList *txns, Transaction *txn);
+
+/* Resyncs the list with txns that were modified in place.
+ *
+ * The list being always sorted, this doesn't re-sort everything: it only
+ * looks for txns that drifted from their recorded key and puts them back in
+ * their proper place.
+ */
 void
 transactions_sort(TransactionList *txns);
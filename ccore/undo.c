@@ -51,6 +51,9 @@ _swap_accounts(ChangedAccount *accounts, int count)
         memcpy(c->account, &c->copy, sizeof(Account));
         memcpy(&c->copy, &tmp, sizeof(Account));
     }
+    if (count) {
+        account_keys_changed();
+    }
     return true;
 }
 
@@ -131,7 +134,11 @@ _readd_txns(Transaction **txns, TransactionList *tlist, AccountList *alist)
 }
 
 static bool
-_swap_txns(ChangedTransaction *txns, int count, AccountList *alist)
+_swap_txns(
+    ChangedTransaction *txns,
+    int count,
+    TransactionList *tlist,
+    AccountList *alist)
 {
     for (int i=0; i<count; i++) {
         ChangedTransaction *c = &txns[i];
@@ -147,6 +154,8 @@ _swap_txns(ChangedTransaction *txns, int count, AccountList *alist)
         memcpy(c->txn, &c->copy, sizeof(Transaction));
         memcpy(&c->copy, &tmp, sizeof(Transaction));
         _add_auto_created_accounts(c->txn, alist);
+        // date and position might have changed.
+        transactions_reposition(tlist, c->txn);
     }
     return true;
 }
@@ -166,10 +175,74 @@ _swap_scheds(ChangedSchedule *scheds, int count)
         memcpy(&tmp, c->sched, sizeof(Schedule));
         memcpy(c->sched, &c->copy, sizeof(Schedule));
         memcpy(&c->copy, &tmp, sizeof(Schedule));
+        // Memoized spawns point to the `ref` they were generated from, which
+        // didn't follow.
+        schedule_reset_spawns(c->sched);
+        schedule_reset_spawns(&c->copy);
     }
     return true;
 }
 
+static time_t
+_min_date(time_t a, time_t b)
+{
+    if (a == 0) {
+        return b;
+    }
+    return (b != 0 && b < a) ? b : a;
+}
+
+static time_t
+_txns_min_date(Transaction **txns, time_t date)
+{
+    if (txns == NULL) {
+        return date;
+    }
+    while (*txns != NULL) {
+        date = _min_date(date, (*txns)->date);
+        txns++;
+    }
+    return date;
+}
+
+// Spawns of a schedule can't happen before its start date or before the
+// date of one of its global changes.
+static time_t
+_sched_min_date(const Schedule *sched, time_t date)
+{
+    return _min_date(date, schedule_min_date(sched));
+}
+
+static void
+_add_accounts(GHashTable *set, Account **accounts)
+{
+    if (accounts == NULL) {
+        return;
+    }
+    while (*accounts != NULL) {
+        g_hash_table_add(set, *accounts);
+        accounts++;
+    }
+}
+
+static void
+_add_txn_accounts(GHashTable *set, Transaction *txn)
+{
+    _add_accounts(set, transaction_affected_accounts(txn));
+}
+
+static void
+_add_sched_accounts(GHashTable *set, Schedule *sched)
+{
+    _add_txn_accounts(set, &sched->ref);
+    GHashTableIter iter;
+    gpointer key, value;
+    g_hash_table_iter_init(&iter, sched->globalchanges);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        _add_txn_accounts(set, (Transaction *)value);
+    }
+}
+
 /* Public */
 void
 undostep_init(
@@ -280,7 +353,8 @@ undostep_undo(UndoStep *step, AccountList *alist, TransactionList *tlist)
     if (!_readd_txns(step->deleted_txns, tlist, alist)) {
         return false;
     }
-    if (!_swap_txns(step->changed_txns, step->changed_txns_count, alist)) {
+    if (!_swap_txns(
+            step->changed_txns, step->changed_txns_count, tlist, alist)) {
         return false;
     }
     if (!_swap_scheds(step->changed_scheds, step->changed_scheds_count)) {
@@ -307,7 +381,8 @@ undostep_redo(UndoStep *step, AccountList *alist, TransactionList *tlist)
     if (!_remove_txns(step->deleted_txns, tlist, alist)) {
         return false;
     }
-    if (!_swap_txns(step->changed_txns, step->changed_txns_count, alist)) {
+    if (!_swap_txns(
+            step->changed_txns, step->changed_txns_count, tlist, alist)) {
         return false;
     }
     if (!_swap_scheds(step->changed_scheds, step->changed_scheds_count)) {
@@ -315,3 +390,71 @@ undostep_redo(UndoStep *step, AccountList *alist, TransactionList *tlist)
     }
     return true;
 }
+
+time_t
+undostep_dirty_date(UndoStep *step)
+{
+    if (step->added_accounts != NULL || step->deleted_accounts != NULL) {
+        return 0;
+    }
+    if (step->changed_account_count > 0) {
+        return 0;
+    }
+    time_t date = 0;
+    date = _txns_min_date(step->added_txns, date);
+    date = _txns_min_date(step->deleted_txns, date);
+    for (int i=0; i<step->changed_txns_count; i++) {
+        ChangedTransaction *c = &step->changed_txns[i];
+        date = _min_date(date, c->txn->date);
+        date = _min_date(date, c->copy.date);
+    }
+    for (int i=0; i<step->changed_scheds_count; i++) {
+        ChangedSchedule *c = &step->changed_scheds[i];
+        date = _sched_min_date(c->sched, date);
+        date = _sched_min_date(&c->copy, date);
+    }
+    return date;
+}
+
+Account**
+undostep_affected_accounts(UndoStep *step)
+{
+    GHashTable *set = g_hash_table_new(g_direct_hash, g_direct_equal);
+    _add_accounts(set, step->added_accounts);
+    _add_accounts(set, step->deleted_accounts);
+    for (int i=0; i<step->changed_account_count; i++) {
+        g_hash_table_add(set, step->changed_accounts[i].account);
+    }
+    Transaction **txns = step->added_txns;
+    while (txns != NULL && *txns != NULL) {
+        _add_txn_accounts(set, *txns);
+        txns++;
+    }
+    txns = step->deleted_txns;
+    while (txns != NULL && *txns != NULL) {
+        _add_txn_accounts(set, *txns);
+        txns++;
+    }
+    for (int i=0; i<step->changed_txns_count; i++) {
+        ChangedTransaction *c = &step->changed_txns[i];
+        _add_txn_accounts(set, c->txn);
+        _add_txn_accounts(set, &c->copy);
+    }
+    for (int i=0; i<step->changed_scheds_count; i++) {
+        ChangedSchedule *c = &step->changed_scheds[i];
+        _add_sched_accounts(set, c->sched);
+        _add_sched_accounts(set, &c->copy);
+    }
+    unsigned int count = g_hash_table_size(set);
+    Account **res = malloc(sizeof(Account*) * (count + 1));
+    GHashTableIter iter;
+    gpointer key, value;
+    unsigned int i = 0;
+    g_hash_table_iter_init(&iter, set);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        res[i++] = key;
+    }
+    res[i] = NULL;
+    g_hash_table_destroy(set);
+    return res;
+}
@@ -70,3 +70,25 @@ undostep_undo(UndoStep *step, AccountList *alist, TransactionList *tlist);
 
 bool
 undostep_redo(UndoStep *step, AccountList *alist, TransactionList *tlist);
+
+/* Returns the earliest date affected by `step`.
+ *
+ * This is the date from which cooked data has to be recomputed after an undo
+ * or a redo. It works in both directions: changed entities are looked at in
+ * their current form as well as in their copied form.
+ *
+ * Returns 0 if the whole document has to be recomputed, which is the case
+ * when accounts are added, removed or changed, or when the step doesn't touch
+ * anything dated.
+ */
+time_t
+undostep_dirty_date(UndoStep *step);
+
+/* Returns a NULL-terminated list of all accounts affected by `step`.
+ *
+ * That is, accounts added, removed or changed by the step as well as accounts
+ * referenced by the splits of its transactions and schedules, in both their
+ * current and copied form. The caller is responsible for freeing the list.
+ */
+Account**
+undostep_affected_accounts(UndoStep *step);
@@ -126,6 +126,53 @@ now()
     return r;
 }
 
+/* Growable arrays */
+
+// Smallest capacity we allocate. We never shrink below it.
+#define VEC_MIN_CAPACITY 16
+
+unsigned int
+vec_capacity(unsigned int capacity, unsigned int count)
+{
+    unsigned int res = capacity;
+    if (count > res) {
+        if (res < VEC_MIN_CAPACITY) {
+            res = VEC_MIN_CAPACITY;
+        }
+        while (res < count) {
+            res *= 2;
+        }
+    } else {
+        // We only shrink when we use less than a quarter of our capacity.
+        // This way, alternating insertions and removals around a threshold
+        // don't cause reallocations each time.
+        while ((res > VEC_MIN_CAPACITY) && (count < res / 4)) {
+            res /= 2;
+        }
+    }
+    return res;
+}
+
+bool
+vec_resize(
+    void **items,
+    size_t itemsize,
+    unsigned int count,
+    unsigned int *capacity)
+{
+    unsigned int newcapacity = vec_capacity(*capacity, count);
+    if (newcapacity == *capacity) {
+        return true;
+    }
+    void *res = realloc(*items, itemsize * newcapacity);
+    if (res == NULL) {
+        return false;
+    }
+    *items = res;
+    *capacity = newcapacity;
+    return true;
+}
+
 /* Other */
 bool
 pointer_in_list(void **list, void *target)
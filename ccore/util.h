@@ -1,4 +1,6 @@
+#pragma once
 #include <stdbool.h>
+#include <stddef.h>
 #include <time.h>
 
 /* String management in ccore
@@ -66,6 +68,35 @@ today_patch(time_t today);
 time_t
 now();
 
+/* Growable arrays
+ *
+ * Lists in ccore are plain arrays with a `count`. To avoid reallocating them
+ * on each insertion or removal, they also keep track of their `capacity`,
+ * which grows by doubling and shrinks (by halving) only when the array is
+ * mostly empty.
+ */
+
+/* Returns the capacity an array of `capacity` has to have to hold `count`
+ * items.
+ *
+ * If the result is the same as `capacity`, no reallocation is needed.
+ */
+unsigned int
+vec_capacity(unsigned int capacity, unsigned int count);
+
+/* Reallocates `*items`, if needed, so that it can hold `count` items of size
+ * `itemsize`.
+ *
+ * `capacity` is updated accordingly. Returns false on error, in which case
+ * `*items` is left untouched.
+ */
+bool
+vec_resize(
+    void **items,
+    size_t itemsize,
+    unsigned int count,
+    unsigned int *capacity);
+
 /* Other */
 
 /* Returns whether pointer `target` is is NULL-terminated list `list`
@@ -24,11 +24,15 @@ class PreferenceNames:
     * ``AutoDecimalPlace``
     * ``CustomRanges``
     * ``ShowScheduleScopeDialog``
+    * ``UseJournal``
+    * ``UseCookedCache``
     """
     AutoSaveInterval = 'AutoSaveInterval'
     AutoDecimalPlace = 'AutoDecimalPlace'
     DayFirstDateEntry = 'DayFirstDateEntry'
     ShowScheduleScopeDialog = 'ShowScheduleScopeDialog'
+    UseJournal = 'UseJournal'
+    UseCookedCache = 'UseCookedCache'
 
 class ApplicationView:
     """Expected interface for :class:`Application`'s view.
@@ -111,6 +115,8 @@ class Application:
         self._auto_decimal_place = self.get_default(PreferenceNames.AutoDecimalPlace, False)
         self._day_first_date_entry = self.get_default(PreferenceNames.DayFirstDateEntry, True)
         self._show_schedule_scope_dialog = self.get_default(PreferenceNames.ShowScheduleScopeDialog, True)
+        self._use_journal = self.get_default(PreferenceNames.UseJournal, False)
+        self._use_cooked_cache = self.get_default(PreferenceNames.UseCookedCache, False)
         self._hook_currency_providers()
         self._update_date_entry_order()
 
@@ -233,3 +239,40 @@ class Application:
         self._show_schedule_scope_dialog = value
         self.set_default(PreferenceNames.ShowScheduleScopeDialog, value)
 
+    @property
+    def use_journal(self):
+        """*get/set bool*. Whether documents keep a journal of their changes.
+
+        With a journal, saving a document appends its changes to a sidecar file instead of rewriting
+        the whole document every time. Changes are logged as they're made, so those that weren't
+        saved are recovered when a document is reopened after a crash.
+
+        .. seealso:: :class:`core.saver.journal.Journal`
+        """
+        return self._use_journal
+
+    @use_journal.setter
+    def use_journal(self, value):
+        if value == self._use_journal:
+            return
+        self._use_journal = value
+        self.set_default(PreferenceNames.UseJournal, value)
+
+    @property
+    def use_cooked_cache(self):
+        """*get/set bool*. Whether cooked entry balances are cached in :attr:`cache_path`.
+
+        Opening a document that didn't change since its balances were cached then restores them
+        instead of computing them again.
+
+        .. seealso:: :mod:`core.saver.cooked`
+        """
+        return self._use_cooked_cache
+
+    @use_cooked_cache.setter
+    def use_cooked_cache(self, value):
+        if value == self._use_cooked_cache:
+            return
+        self._use_cooked_cache = value
+        self.set_default(PreferenceNames.UseCookedCache, value)
+
@@ -8,8 +8,6 @@ import datetime
 import time
 import uuid
 import logging
-import os
-import os.path as op
 from functools import wraps
 
 from core.util import nonone, allsame, dedupe, extract, first, flatten
@@ -19,13 +17,16 @@ from .const import NOEDIT, AccountType
 from .exception import FileFormatError, OperationAborted
 from .gui.base import GUIObject
 from .loader import native
+from .loader.base import used_currencies
 from .model._ccore import (
     AccountList, Entry, TransactionList, amount_parse, amount_format)
 from .model.currency import Currencies
 from .model.date import YearRange
 from .model.oven import Oven
 from .model.undo import Undoer, Action
-from .saver.native import save as save_native
+from .saver import cooked, journal
+from .saver.autosave import Autosaver
+from .saver.native import save as save_native, dump as dump_native
 
 EXCLUDED_ACCOUNTS_PREFERENCE = 'ExcludedAccounts'
 
@@ -34,8 +35,6 @@ class ScheduleScope:
     Global = 1
     Cancel = 2
 
-AUTOSAVE_BUFFER_COUNT = 10 # Number of autosave files that will be kept in the cache.
-
 def handle_abort(method):
     @wraps(method)
     def wrapper(self, *args, **kwargs):
@@ -49,6 +48,9 @@ def handle_abort(method):
 def find_schedule_of_spawn(spawn, schedules):
     return first(s for s in schedules if s.contains_spawn(spawn))
 
+def _affected_accounts(transactions):
+    return set(flatten(t.affected_accounts() for t in transactions))
+
 class Document(GUIObject):
     """Manages everything (including views) about an opened document.
 
@@ -94,6 +96,11 @@ class Document(GUIObject):
         self._date_range = YearRange(datetime.date.today())
         self._document_id = None
         self._dirty_flag = False
+        self._autosaver = Autosaver()
+        self._journal = None
+        #: Whether the document is saved in the compact binary format rather than in XML. It's
+        #: set when loading a document, and can be changed to convert it.
+        self.binary_format = False
 
     # --- Private
     def _add_transactions(self, transactions):
@@ -102,19 +109,67 @@ class Document(GUIObject):
         for txn in transactions:
             self.transactions.add(txn)
         min_date = min(t.date for t in transactions)
-        self._cook(from_date=min_date)
+        self._cook(from_date=min_date, accounts=_affected_accounts(transactions))
 
     def _autosave(self):
-        existing_names = [name for name in os.listdir(self.app.cache_path) if name.startswith('autosave')]
-        existing_names.sort()
-        timestamp = int(time.time())
-        autosave_name = 'autosave{0}.moneyguru'.format(timestamp)
-        while autosave_name in existing_names:
-            timestamp += 1
-            autosave_name = 'autosave{0}.moneyguru'.format(timestamp)
-        self.save_to_xml(op.join(self.app.cache_path, autosave_name), autosave=True)
-        if len(existing_names) >= AUTOSAVE_BUFFER_COUNT:
-            os.remove(op.join(self.app.cache_path, existing_names[0]))
+        # We only take a snapshot here. The file is written by the autosaver's worker thread.
+        if self._document_id is None:
+            self._document_id = uuid.uuid4().hex
+        data = dump_native(
+            self._document_id, self._properties, self.accounts, self.transactions, self.schedules
+        )
+        self._autosaver.save(self.app.cache_path, data)
+
+    def _close_journal(self):
+        # Unsaved records aren't part of the document. We only want them replayed after a crash.
+        if self._journal is not None:
+            try:
+                self._journal.rollback()
+            except OSError:
+                # Already discarded along with what it was logging.
+                pass
+        self._journal = self._undoer.journal = None
+
+    def _start_journal(self, filename, journal_state=None):
+        # Starts journaling changes to ``filename``, which has just been loaded or saved in full.
+        self._close_journal()
+        if not self.app.use_journal:
+            return
+        args = (filename, self._properties, self.accounts, self.transactions, self.schedules)
+        if journal_state is not None:
+            self._journal = journal.Journal.resume(*args, *journal_state)
+        else:
+            self._journal = journal.Journal.create(*args)
+        self._undoer.journal = self._journal
+
+    def _cooked_cache_path(self):
+        if not (self.app.use_cooked_cache and self.app.cache_path and self._document_id):
+            return None
+        return cooked.cache_file(self.app.cache_path, self._document_id)
+
+    def _write_cooked_cache(self, path, key):
+        try:
+            cooked.save(path, key, self.oven.cooked_until, self.accounts)
+        except OSError:
+            logging.warning("Couldn't write cooked cache %s", path)
+
+    def _cook_after_load(self, filename, currencies):
+        # Cooks the document we just loaded from ``filename``, which uses ``currencies``. If we
+        # have cooked balances for it in our cache, we restore them and only cook the rest of our
+        # date range. Otherwise, we cache our balances for the next time.
+        path = self._cooked_cache_path()
+        if path is None:
+            self._cook()
+            return
+        key = cooked.content_hash(filename, currencies)
+        cached = cooked.read(path, key, self.accounts)
+        if cached is not None and cached[0] <= self.date_range.end:
+            until_date, balances = cached
+            self.oven.cook(until_date=until_date, balances=balances)
+            self.oven.continue_cooking(self.date_range.end)
+        else:
+            self._cook()
+            self._write_cooked_cache(path, key)
 
     def _change_transaction(self, transaction, global_scope=False, **kwargs):
         date = kwargs.get('date', NOEDIT)
@@ -137,8 +192,8 @@ class Document(GUIObject):
                 self.transactions.move_last(transaction)
         self.transactions.clear_cache()
 
-    def _cook(self, from_date=None):
-        self.oven.cook(from_date=from_date, until_date=self.date_range.end)
+    def _cook(self, from_date=None, accounts=None):
+        self.oven.cook(from_date=from_date, until_date=self.date_range.end, accounts=accounts)
         # Whenever we cook, we touch. That saves us some touch() repetitions.
         self.touch()
 
@@ -228,7 +283,7 @@ class Document(GUIObject):
                 kwargs['notes'] = notes
             if kwargs:
                 account.change(**kwargs)
-        self._cook()
+        self._cook(accounts=set(accounts))
         self.transactions.clear_cache()
         return True
 
@@ -333,6 +388,7 @@ class Document(GUIObject):
         action = Action(tr('Change transaction'))
         action.change_transactions([original], self.schedules)
         self._undoer.record(action)
+        affected = original.affected_accounts()
         # don't forget that account up here is an external instance. Even if an account of
         # the same name exists in self.accounts, it's not gonna be the same instance.
         for split in new.splits:
@@ -344,7 +400,8 @@ class Document(GUIObject):
             original, date=new.date, description=new.description,
             payee=new.payee, checkno=new.checkno, notes=new.notes, global_scope=global_scope
         )
-        self._cook(from_date=min_date)
+        affected |= original.affected_accounts()
+        self._cook(from_date=min_date, accounts=affected)
         self.accounts.clean_empty_categories()
         self.date_range = self.date_range.around(original.date)
 
@@ -380,13 +437,15 @@ class Document(GUIObject):
             Currencies.get_rates_db().ensure_rates(date, currencies_to_ensure)
 
         min_date = date if date is not NOEDIT else datetime.date.max
+        affected = _affected_accounts(transactions)
         for transaction in transactions:
             min_date = min(min_date, transaction.date)
             self._change_transaction(
                 transaction, date=date, description=description, payee=payee, checkno=checkno,
                 from_=from_, to=to, amount=amount, currency=currency, global_scope=global_scope
             )
-        self._cook(from_date=min_date)
+        affected |= _affected_accounts(transactions)
+        self._cook(from_date=min_date, accounts=affected)
         self.accounts.clean_empty_categories()
         self.date_range = self.date_range.around(transactions[-1].date)
 
@@ -421,7 +480,7 @@ class Document(GUIObject):
         for schedule, recurrence_date in schedule_deletions:
             schedule.delete_at(recurrence_date)
         min_date = min(t.date for t in transactions)
-        self._cook(from_date=min_date)
+        self._cook(from_date=min_date, accounts=_affected_accounts(transactions))
         self.accounts.clean_empty_categories(from_account)
 
     def duplicate_transactions(self, transactions):
@@ -468,7 +527,10 @@ class Document(GUIObject):
         self._undoer.record(action)
         for transaction in transactions:
             self.transactions.move_before(transaction, to_transaction)
-        self._cook()
+        min_date = affected_date
+        if to_transaction is not None:
+            min_date = min(min_date, to_transaction.date)
+        self._cook(from_date=min_date)
 
     # --- Entry
     @handle_abort
@@ -633,7 +695,7 @@ class Document(GUIObject):
         self._undoer.record(action)
         for schedule in schedules:
             self.schedules.remove(schedule)
-        min_date = min(s.ref.date for s in schedules)
+        min_date = min(s.min_date for s in schedules)
         self._cook(from_date=min_date)
 
     # --- Load / Save / Import
@@ -644,49 +706,79 @@ class Document(GUIObject):
 
         :param filename: ``str``
         """
+        if self._journal is not None and self._journal.path == journal.journal_path(filename):
+            # We're reopening our document without saving it.
+            self._close_journal()
         loader = native.Loader(self.default_currency)
         try:
             loader.parse(filename)
         except FileFormatError:
             raise FileFormatError(tr('"%s" is not a moneyGuru file') % filename)
-        loader.load()
+        # We cook the loaded document ourselves.
+        loader.load(cook=False)
         self.clear()
         self._document_id = loader.document_id
+        self.binary_format = loader.binary
         for propname in self._properties:
             if propname in loader.properties:
                 self._properties[propname] = loader.properties[propname]
         self.accounts = loader.accounts
         self.oven._accounts = self.accounts
         self._undoer._accounts = self.accounts
-        for transaction in loader.transactions:
-            self.transactions.add(transaction, True)
+        self.transactions = loader.transactions
+        self.oven._transactions = self.transactions
+        self._undoer._transactions = self.transactions
         for recurrence in loader.schedules:
             self.schedules.append(recurrence)
         self.accounts.default_currency = self.default_currency
-        self._cook()
+        self._start_journal(filename, loader.journal_state)
+        self._cook_after_load(filename, loader.currencies)
         self._undoer.set_save_point()
+        if loader.journal_recovered:
+            # Those changes were never saved.
+            self.set_dirty()
         self._restore_preferences_after_load()
 
     def save_to_xml(self, filename, autosave=False):
         """Saves the document to ``filename``.
 
-        ``filename`` must be a path to a moneyGuru XML document.
+        ``filename`` must be a path to a moneyGuru XML document. If :attr:`binary_format` is set,
+        the document is written in our binary format instead.
 
         If ``autosave`` is true, the operation will not affect the document's
         modified state.
 
+        If we keep a journal for ``filename``, we commit it rather than rewriting the whole file,
+        unless it grew too big.
+
         :param filename: ``str``
         :param autosave: ``bool``
         """
         if self._document_id is None:
             self._document_id = uuid.uuid4().hex
-        save_native(
-            filename, self._document_id, self._properties, self.accounts,
-            self.transactions, self.schedules
-        )
-        if not autosave:
-            self._undoer.set_save_point()
-            self._dirty_flag = False
+        if autosave:
+            save_native(
+                filename, self._document_id, self._properties, self.accounts,
+                self.transactions, self.schedules
+            )
+            return
+        current = self._journal
+        if current is not None and current.path == journal.journal_path(filename) \
+                and not current.needs_compaction():
+            current.commit()
+        else:
+            save_native(
+                filename, self._document_id, self._properties, self.accounts,
+                self.transactions, self.schedules, binary=self.binary_format
+            )
+            journal.discard(filename)
+            self._start_journal(filename)
+        path = self._cooked_cache_path()
+        if path is not None:
+            currencies = used_currencies(self.accounts, self.transactions)
+            self._write_cooked_cache(path, cooked.content_hash(filename, currencies))
+        self._undoer.set_save_point()
+        self._dirty_flag = False
 
     def import_entries(self, target_account, ref_account, matches):
         """Imports entries in ``mathes`` into ``target_account``.
@@ -807,8 +899,8 @@ class Document(GUIObject):
 
     def undo(self):
         """Undo the last undoable action."""
-        self._undoer.undo()
-        self._cook()
+        from_date, accounts = self._undoer.undo()
+        self._cook(from_date=from_date, accounts=accounts if from_date is not None else None)
 
     def can_redo(self):
         """Returns whether the document has something to redo."""
@@ -820,12 +912,14 @@ class Document(GUIObject):
 
     def redo(self):
         """Redo the last redoable action."""
-        self._undoer.redo()
-        self._cook()
+        from_date, accounts = self._undoer.redo()
+        self._cook(from_date=from_date, accounts=accounts if from_date is not None else None)
 
     # --- Misc
     def clear(self):
+        self._close_journal()
         self._document_id = None
+        self.binary_format = False
         del self.schedules[:]
         self._undoer.clear()
         self._dirty_flag = False
@@ -836,6 +930,7 @@ class Document(GUIObject):
         self._cook()
 
     def close(self):
+        self._close_journal()
         self._save_preferences()
 
     def can_restore_from_prefs(self):
@@ -865,6 +960,8 @@ class Document(GUIObject):
         return amount.currency_code == self.default_currency
 
     def touch(self):
+        if self._journal is not None:
+            self._journal.flush()
         self.step += 1
         if self.app.autosave_interval and self.step % self.app.autosave_interval == 0:
             self._autosave()
@@ -11,12 +11,14 @@ class AccountBalanceGraph(BalanceGraph):
         BalanceGraph.__init__(self, account_view)
         self._account = account_view.account
 
-    def _balance_for_date(self, date):
+    def _balances_for_dates(self, dates):
         if self._account is None:
-            return 0
+            return [0] * len(dates)
         entries = self.document.accounts.entries_for_account(self._account)
-        entry = entries.last_entry(date)
-        return entry.normal_balance() if entry else 0
+        balances = entries.balance_series(dates, self._account.currency)
+        if self._account.is_credit_account():
+            balances = [-balance for balance in balances]
+        return balances
 
     # --- Properties
     @property
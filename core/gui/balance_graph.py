@@ -22,19 +22,21 @@ class BrushID:
 class BalanceGraph(Graph):
     # BalanceGraph's data point is (float x, float y)
     # --- Virtual
-    def _balance_for_date(self, date):
-        return 0
+    def _balances_for_dates(self, dates):
+        # Returns a sequence of balances, one for each date in the sorted ``dates``.
+        return [0] * len(dates)
 
     # --- Override
     def compute_data(self):
         date_range = self.document.date_range
         TODAY = date.today()
         date2value = {}
-        last_balance = self._balance_for_date(date_range.start - ONE_DAY)
+        dates = [date_range.start - ONE_DAY] + list(date_range)
+        balances = self._balances_for_dates(dates)
+        last_balance = balances[0]
         if last_balance:
             date2value[date_range.start] = last_balance
-        for date_point in date_range:
-            balance = self._balance_for_date(date_point)
+        for date_point, balance in zip(dates[1:], balances[1:]):
             if (balance != last_balance) or (date_point == TODAY) or (date_point == date_range.end):
                 if date2value and last_balance != balance:
                     # create a "step"
@@ -57,6 +57,9 @@ class AccountPane:
         entries = iwin.loader.accounts.entries_for_account(account)
         self.count = len(entries)
         self.matches = [] # [[ref, imported]]
+        # ref -> match and imported -> match, for all matches with a ref or an imported entry.
+        self._ref2match = {}
+        self._imported2match = {}
         self.parsing_date_format = parsing_date_format
         self.max_day = 31
         self.max_month = 12
@@ -84,6 +87,7 @@ class AccountPane:
         for entry in (e for e in to_import if e.reference):
             reference2entry[entry.reference] = entry
         self.matches = []
+        matched = set()
         if self.selected_target is not None:
             entries = self.iwin.document.accounts.entries_for_account(self.selected_target)
             for entry in entries:
@@ -91,53 +95,80 @@ class AccountPane:
                     other = reference2entry[entry.reference]
                     if entry.reconciled:
                         self.iwin.import_table.dont_import.add(other)
-                    to_import.remove(other)
+                    matched.add(other)
                     del reference2entry[entry.reference]
                 else:
                     other = None
                 if other is not None or not entry.reconciled:
                     self.matches.append([entry, other])
-        self.matches += [[None, entry] for entry in to_import]
+        self.matches += [[None, entry] for entry in to_import if entry not in matched]
+        self._index_matches()
         self._sort_matches()
 
+    def _index_matches(self):
+        self._ref2match = {m[0]: m for m in self.matches if m[0] is not None}
+        self._imported2match = {m[1]: m for m in self.matches if m[1] is not None}
+
     def _sort_matches(self):
         self.matches.sort(key=lambda t: t[0].date if t[0] is not None else t[1].date)
 
-    def bind(self, existing, imported):
-        [match1] = [m for m in self.matches if m[0] is existing]
-        [match2] = [m for m in self.matches if m[1] is imported]
+    def _bind(self, existing, imported):
+        # Binds without removing the imported entry's former match from self.matches. Returns
+        # that match.
+        match1 = self._ref2match[existing]
+        match2 = self._imported2match[imported]
         assert match1[1] is None
         assert match2[0] is None
         match1[1] = match2[1]
-        self.matches.remove(match2)
+        self._imported2match[imported] = match1
+        return match2
+
+    def bind(self, existing, imported):
+        self.matches.remove(self._bind(existing, imported))
 
     def can_swap_date_fields(self, first, second): # 'day', 'month', 'year'
         return (first, second) in self._swap_possibilities or (second, first) in self._swap_possibilities
 
     def match_entries_by_date_and_amount(self, threshold):
         delta = datetime.timedelta(days=threshold)
-        unmatched = (
-            to_import for ref, to_import in self.matches if ref is None)
-        unmatched_refs = (
-            ref for ref, to_import in self.matches if to_import is None)
-        amount2refs = defaultdict(list)
-        for entry in unmatched_refs:
-            amount2refs[entry.amount].append(entry)
+        # Unmatched refs are indexed by amount and by date bucket. Buckets are threshold + 1 days
+        # wide, so the refs close enough to a date are in its bucket or in the ones next to it.
+        bucket_size = max(threshold + 1, 1)
+        bucket2refs = defaultdict(list)
+        unmatched = []
+        for index, (ref, to_import) in enumerate(self.matches):
+            if ref is None:
+                unmatched.append(to_import)
+            elif to_import is None:
+                bucket = ref.date.toordinal() // bucket_size
+                bucket2refs[(ref.amount, bucket)].append((index, ref))
+        removed = set()
         for entry in unmatched:
-            if entry.amount not in amount2refs:
-                continue
-            potentials = amount2refs[entry.amount]
-            for ref in potentials:
-                if abs(ref.date - entry.date) <= delta:
-                    self.bind(ref, entry)
-                    potentials.remove(ref)
+            bucket = entry.date.toordinal() // bucket_size
+            candidates = []
+            for key in ((entry.amount, b) for b in (bucket - 1, bucket, bucket + 1)):
+                refs = bucket2refs.get(key)
+                if refs:
+                    candidates += [
+                        (index, ref, refs) for index, ref in refs
+                        if abs(ref.date - entry.date) <= delta]
+            if candidates:
+                # Like when we looked at refs in the order of matches, the first one wins.
+                index, ref, refs = min(candidates, key=lambda c: c[0])
+                refs.remove((index, ref))
+                removed.add(id(self._bind(ref, entry)))
+        if removed:
+            self.matches = [m for m in self.matches if id(m) not in removed]
         self._sort_matches()
 
 
     def unbind(self, existing, imported):
-        [match] = [m for m in self.matches if m[0] is existing and m[1] is imported]
+        match = self._ref2match[existing]
+        assert match[1] is imported
         match[1] = None
-        self.matches.append([None, imported])
+        newmatch = [None, imported]
+        self.matches.append(newmatch)
+        self._imported2match[imported] = newmatch
         self._sort_matches()
 
     @property
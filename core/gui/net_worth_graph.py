@@ -11,12 +11,8 @@ class NetWorthGraph(BalanceGraph):
     def __init__(self, networth_view):
         BalanceGraph.__init__(self, networth_view)
 
-    def _balance_for_date(self, date):
-        def bal(a):
-            entries = self.document.accounts.entries_for_account(a)
-            return entries.balance(date, self._currency)
-
-        return sum(map(bal, self._accounts))
+    def _balances_for_dates(self, dates):
+        return self.document.accounts.sum_balance_series(self._accounts, dates, self._currency)
 
     def compute_data(self):
         accounts = set(a for a in self.document.accounts if a.is_balance_sheet_account())
@@ -4,8 +4,10 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import calendar
 import datetime
 import re
+from functools import lru_cache
 
 from core.util import dedupe, nonone
 from core.trans import tr
@@ -42,15 +44,18 @@ POSSIBLE_PATTERNS = [
 ]
 re_possibly_a_date = re.compile('|'.join(POSSIBLE_PATTERNS))
 
+def unsupported_currency_error(currency):
+    msg = tr(
+        "Unsupported currency: {}. Aborting load. Did you disable a currency plugin?"
+    ).format(currency)
+    return FileFormatError(msg)
+
 def parse_amount(string, currency, **kwargs):
     try:
         return amount_parse(
             string, currency, with_expression=False, **kwargs)
     except UnsupportedCurrencyError:
-        msg = tr(
-            "Unsupported currency: {}. Aborting load. Did you disable a currency plugin?"
-        ).format(currency)
-        raise FileFormatError(msg)
+        raise unsupported_currency_error(currency)
 
 def get_account_type(type):
     if type in AccountType.All:
@@ -85,23 +90,107 @@ def clean_date(str_date):
     match = re_possibly_a_date.search(str_date)
     return match.group() if match is not None else None
 
+# strptime() regexes for the directives that we compile in compile_date_format(). %b, the
+# abbreviated month name, depends on the locale and is added there.
+DATE_DIRECTIVE_RES = {
+    'd': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'y': r'(?P<y>\d\d)',
+    'Y': r'(?P<Y>\d\d\d\d)',
+    '%': '%',
+}
+re_date_format_part = re.compile(r'%(.)|(\s+)|([^%\s]+)')
+
+@lru_cache(maxsize=None)
+def compile_date_format(date_format):
+    """Returns a function parsing a string into a date with ``date_format``.
+
+    The function behaves like ``datetime.strptime(date_str, date_format).date()`` and raises
+    ValueError the same way, but it's much faster because its regex and month name table are only
+    built once. Formats with directives other than day, month and year are parsed with strptime().
+    """
+    def parse_with_strptime(date_str):
+        return datetime.datetime.strptime(date_str, date_format).date()
+
+    month_abbrs = [name.lower() for name in calendar.month_abbr]
+    directive_res = dict(DATE_DIRECTIVE_RES)
+    names = sorted(month_abbrs[1:], key=len, reverse=True)
+    directive_res['b'] = '(?P<b>{})'.format('|'.join(map(re.escape, names)))
+    regex_parts = []
+    parsed_len = 0
+    for match in re_date_format_part.finditer(date_format):
+        directive, spaces, literal = match.groups()
+        if match.start() != parsed_len or (directive and directive not in directive_res):
+            # stray % or unsupported directive
+            return parse_with_strptime
+        parsed_len = match.end()
+        if directive is not None:
+            regex_parts.append(directive_res[directive])
+        elif spaces:
+            regex_parts.append(r'\s+')
+        else:
+            regex_parts.append(re.escape(literal))
+    if parsed_len != len(date_format):
+        return parse_with_strptime
+    try:
+        regex = re.compile(''.join(regex_parts), re.IGNORECASE)
+    except re.error: # a directive is there twice
+        return parse_with_strptime
+
+    def parse(date_str):
+        match = regex.match(date_str)
+        if match is None or match.end() != len(date_str):
+            raise ValueError("{!r} doesn't match format {!r}".format(date_str, date_format))
+        fields = match.groupdict()
+        if fields.get('Y'):
+            year = int(fields['Y'])
+        elif fields.get('y'):
+            year = int(fields['y'])
+            year += 2000 if year <= 68 else 1900
+        else:
+            year = 1900
+        if fields.get('m'):
+            month = int(fields['m'])
+        elif fields.get('b'):
+            month = month_abbrs.index(fields['b'].lower())
+        else:
+            month = 1
+        day = int(fields['d']) if fields.get('d') else 1
+        return datetime.date(year, month, day)
+
+    return parse
+
 def guess_date_format(str_dates, formats_to_try):
     if not str_dates:
         return None
-    for format in dedupe(formats_to_try):
-        for str_date in str_dates:
+    # Formats are eliminated as soon as they fail to parse a date. The first one left wins.
+    candidates = [(format, compile_date_format(format)) for format in dedupe(formats_to_try)]
+    for str_date in str_dates:
+        remaining = []
+        for format, parse in candidates:
             try:
-                datetime.datetime.strptime(str_date, format)
+                parse(str_date)
             except ValueError:
-                break
-        else:
-            return format
-    return None
+                continue
+            remaining.append((format, parse))
+        if not remaining:
+            return None
+        candidates = remaining
+    return candidates[0][0]
+
+def used_currencies(accounts, transactions):
+    """Returns the set of the currencies of ``accounts`` and of the amounts of ``transactions``."""
+    currencies = {a.currency for a in accounts}
+    for txn in transactions:
+        for split in txn.splits:
+            if split.amount:
+                currencies.add(split.amount.currency_code)
+    return currencies
 
 def parse_date_str(date_str, date_format):
     """Parses date_str using date_format and perform heuristic fixes if needed.
     """
-    result = datetime.datetime.strptime(date_str, date_format).date()
+    result = compile_date_format(date_format)(date_str)
     if result.year < 1900:
         # we have a typo in the house. Just use 2000 + last-two-digits
         year = (result.year % 100) + 2000
@@ -134,17 +223,17 @@ class Loader:
         # parsing dates. This format is used in the ImportWindow. It is also used in
         # self.parse_date_str as a default value
         self.parsing_date_format = self.NATIVE_DATE_FORMAT
+        # Path of the file we parse. Loaders that stream their file read it again from there.
+        self.filename = None
+        # Currencies of the loaded accounts and amounts. Set by load().
+        self.currencies = set()
 
     # --- Private
     def _fetch_currencies(self):
         # Fetch rates if needed
         start_date = min((t.date for t in self.transactions), default=datetime.date.max)
-        currencies = {a.currency for a in self.accounts}
-        for txn in self.transactions:
-            for split in txn.splits:
-                if split.amount:
-                    currencies.add(split.amount.currency_code)
-        Currencies.get_rates_db().ensure_rates(start_date, list(currencies))
+        self.currencies = used_currencies(self.accounts, self.transactions)
+        Currencies.get_rates_db().ensure_rates(start_date, list(self.currencies))
 
     # --- Virtual
     def _parse(self, infile):
@@ -187,6 +276,7 @@ class Loader:
     # --- Public
     def parse(self, filename):
         """Parses 'filename' and raises FileFormatError if appropriate."""
+        self.filename = filename
         try:
             if 't' in self.FILE_OPEN_MODE:
                 kw = {'encoding': self.FILE_ENCODING, 'errors': 'ignore'}
@@ -197,14 +287,16 @@ class Loader:
         except IOError:
             raise FileFormatError()
 
-    def load(self):
+    def load(self, cook=True):
         """Loads the parsed info into self.accounts and self.transactions.
 
-        You must have called parse() before calling this.
+        You must have called parse() before calling this. If ``cook`` is false, our oven doesn't
+        cook the result. Do that when the caller cooks it with its own oven.
         """
         self._load()
         self._post_load()
-        self.oven.cook(datetime.date.min, until_date=None)
+        if cook:
+            self.oven.cook(datetime.date.min, until_date=None)
         self._fetch_currencies()
 
 class TransactionInfo:
@@ -4,10 +4,13 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import codecs
 import csv
+import io
 import logging
+import sys
+from itertools import islice
 
-from core.util import stripfalse
 from core.trans import tr
 
 from ..const import AccountType
@@ -28,6 +31,17 @@ class CsvField:
 
 MERGABLE_FIELDS = {CsvField.Description, CsvField.Payee}
 
+# We never read more than that from the start of the file to guess its dialect.
+SNIFF_SAMPLE_SIZE = 64 * 1024
+# Number of lines we keep in `Loader.lines` for CSV options. Lines after that are streamed from the
+# file at import time.
+PREVIEW_LINE_COUNT = 5000
+# Byte order marks of the encodings whose decoders need one.
+BOMS = {
+    'utf-16': (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE),
+    'utf-32': (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE),
+}
+
 class Loader(base.Loader):
     FILE_OPEN_MODE = 'rb'
 
@@ -36,30 +50,44 @@ class Loader(base.Loader):
         self.columns = []
         self.lines = []
         self.dialect = None # last used dialect
-        self.readcontent = b''
+        self.encoding = 'latin-1'
+        # Number of lines of the file that `lines` was filled with. When the file has more than
+        # that, the rest is read when loading.
+        self.preview_count = 0
+        self.has_more_lines = False
 
     # --- Private
     @staticmethod
-    def _merge_columns(columns, lines):
-        # For any columns that is there more than once, merge the data that goes with it
+    def _merge_columns(columns):
+        # For any columns that is there more than once, merge the data that goes with it. Extra
+        # columns are removed from `columns` and we return a function doing the same to a line.
+        merges = []
         for field in MERGABLE_FIELDS:
             indexes = [i for i, f in enumerate(columns) if f == field]
             if len(indexes) <= 1:
                 continue
-            for line_index, line in enumerate(lines):
-                elems = [line[i] for i in indexes]
-                merged_data = ' '.join(elems)
-                new_line = line[:] # We don't want to touch original lines
-                new_line[indexes[0]] = merged_data
-                for index_to_remove in reversed(indexes[1:]):
-                    del new_line[index_to_remove]
-                lines[line_index] = new_line
+            merges.append(indexes)
             for index_to_remove in reversed(indexes[1:]):
                 del columns[index_to_remove]
 
+        def merge(line):
+            for indexes in merges:
+                merged_data = ' '.join(line[i] for i in indexes)
+                line = line[:] # We don't want to touch original lines
+                line[indexes[0]] = merged_data
+                for index_to_remove in reversed(indexes[1:]):
+                    del line[index_to_remove]
+            return line
+
+        return merge
+
     def _prepare(self, infile):
+        # We sniff a sample of the file rather than the whole thing, which can be huge. We cut that
+        # sample at its last newline so that the sniffer doesn't see half a line.
+        readcontent = infile.read(SNIFF_SAMPLE_SIZE)
+        if len(readcontent) == SNIFF_SAMPLE_SIZE and b'\n' in readcontent:
+            readcontent = readcontent[:readcontent.rindex(b'\n')]
         # Comment lines can confuse the sniffer. We remove them
-        readcontent = infile.read()
         content = readcontent.replace(b'\0', b'').decode('latin-1')
         lines = content.split('\n')
         stripped_lines = [line.strip() for line in lines]
@@ -82,23 +110,46 @@ class Loader(base.Loader):
             class ManualDialect(csv.excel):
                 delimiter = delim
             self.dialect = ManualDialect
-        self.readcontent = readcontent
+
+    def _iter_lines(self):
+        # Yields the non-empty lines of the file, decoded with `self.encoding`, without ever
+        # holding the whole file in memory.
+        with open(self.filename, 'rb') as fp:
+            encoding = codecs.lookup(self.encoding).name
+            boms = BOMS.get(encoding)
+            if boms and not fp.peek(4).startswith(boms):
+                # Stream decoders refuse BOM-less UTF-16 and UTF-32 but bytes.decode(), which
+                # we used to decode with, assumes the native byte order. So do we.
+                encoding += '-le' if sys.byteorder == 'little' else '-be'
+            textfile = io.TextIOWrapper(fp, encoding=encoding, errors='ignore')
+            rawlines = (rawline.replace('\0', '') for rawline in textfile)
+            reader = []
+            try:
+                reader = csv.reader(rawlines, self.dialect)
+            except TypeError:
+                logging.warning("Invalid Dialect (strangely...). Delimiter: %r", self.dialect.delimiter)
+            yield from filter(None, reader)
+
+    def _remaining_lines(self, colcount):
+        # Yields the lines that come after the preview, completed to `colcount` columns.
+        if not self.has_more_lines:
+            return
+        for line in islice(self._iter_lines(), self.preview_count, None):
+            if len(line) < colcount:
+                line += [''] * (colcount - len(line))
+            yield line
 
     def _scan_lines(self, encoding=None):
-        if not encoding:
-            encoding = 'latin-1'
-        content = self.readcontent.decode(encoding, 'ignore').replace('\0', '')
-        rawlines = content.splitlines()
-        try:
-            reader = csv.reader(iter(rawlines), self.dialect)
-        except TypeError:
-            logging.warning("Invalid Dialect (strangely...). Delimiter: %r", self.dialect.delimiter)
-        lines = stripfalse(reader)
+        self.encoding = encoding or 'latin-1'
+        lines = list(islice(self._iter_lines(), PREVIEW_LINE_COUNT + 1))
+        self.has_more_lines = len(lines) > PREVIEW_LINE_COUNT
+        del lines[PREVIEW_LINE_COUNT:]
         # complete smaller lines and strip whitespaces
         maxlen = max(len(line) for line in lines)
         for line in (l for l in lines if len(l) < maxlen):
             line += [''] * (maxlen - len(line))
         self.lines = lines
+        self.preview_count = len(lines)
 
     def _parse_date_format(self, lines, ci):
         date_index = ci[CsvField.Date]
@@ -118,6 +169,25 @@ class Loader(base.Loader):
             raise FileLoadError(tr("The Date column has been set on a column that doesn't contain dates."))
         return date_format, lines_to_load
 
+    def _line2txn(self, line, ci, target_account):
+        info = base.TransactionInfo()
+        info.account = target_account.name
+        for attr, index in ci.items():
+            value = line[index]
+            if attr == CsvField.Date:
+                value = base.parse_date_str(value, self.parsing_date_format)
+            elif attr == CsvField.Increase:
+                attr = CsvField.Amount
+            elif attr == CsvField.Decrease:
+                attr = CsvField.Amount
+                if value.strip() and not value.startswith('-'):
+                    value = '-' + value
+            if isinstance(value, str):
+                value = value.strip()
+            if value:
+                setattr(info, attr, value)
+        return info.load(self.accounts) if info.is_valid() else None
+
     def _check_amount_values(self, lines, ci):
         for line in lines:
             for attr in [CsvField.Amount, CsvField.Increase, CsvField.Decrease]:
@@ -136,10 +206,10 @@ class Loader(base.Loader):
         self._scan_lines()
 
     def _load(self):
-        lines = self.lines[:]
-        colcount = len(lines[0]) if lines else 0
+        colcount = len(self.lines[0]) if self.lines else 0
         columns = self.columns[:colcount]
-        self._merge_columns(columns, lines)
+        merge = self._merge_columns(columns)
+        lines = [merge(line) for line in self.lines]
         ci = {}
         for index, field in enumerate(columns):
             if field is not None:
@@ -152,28 +222,27 @@ class Loader(base.Loader):
             'CSV Import', self.default_currency, AccountType.Asset)
         self.parsing_date_format, lines_to_load = self._parse_date_format(lines, ci)
         self._check_amount_values(lines_to_load, ci)
-        for line in lines_to_load:
-            info = base.TransactionInfo()
-            info.account = target_account.name
-            for attr, index in ci.items():
-                value = line[index]
-                if attr == CsvField.Date:
-                    value = base.parse_date_str(value, self.parsing_date_format)
-                elif attr == CsvField.Increase:
-                    attr = CsvField.Amount
-                elif attr == CsvField.Decrease:
-                    attr = CsvField.Amount
-                    if value.strip() and not value.startswith('-'):
-                        value = '-' + value
-                if isinstance(value, str):
-                    value = value.strip()
-                if value:
-                    setattr(info, attr, value)
-            if info.is_valid():
-                txn = info.load(self.accounts)
-                self.transactions.add(txn)
+        txns = [self._line2txn(line, ci, target_account) for line in lines_to_load]
+        # The date format and amount columns have been validated on the preview. Lines after it
+        # are converted as we read them and we skip those that don't fit.
+        date_index = ci[CsvField.Date]
+        for line in self._remaining_lines(colcount):
+            line = merge(line)
+            cleaned_str_date = base.clean_date(line[date_index])
+            if cleaned_str_date is None:
+                logging.warning('{0} is not a date. Ignoring line'.format(line[date_index]))
+                continue
+            line[date_index] = cleaned_str_date
+            self._check_amount_values([line], ci)
+            try:
+                txns.append(self._line2txn(line, ci, target_account))
+            except ValueError:
+                logging.warning('{0} is not a date. Ignoring line'.format(line[date_index]))
+        self.transactions.add_many([txn for txn in txns if txn is not None])
 
     # --- Public
     def rescan(self, encoding=None):
+        # Only the preview is decoded again. Remaining lines will be decoded with the new encoding
+        # when loading.
         self._scan_lines(encoding=encoding)
 
@@ -10,16 +10,39 @@ import xml.etree.cElementTree as ET
 from core.util import tryint
 
 from ..exception import FileFormatError
-from ..model._ccore import Transaction, Recurrence
+from ..model._ccore import (
+    BINARY_MAGIC, Transaction, Recurrence, UnsupportedCurrencyError, load_binary, load_native)
 from ..model.date import RepeatType
 from ..model.oven import Oven
+from ..saver import journal
 from . import base
 
 
 def parse_amount(string, currency):
     return base.parse_amount(string, currency, strict_currency=True)
 
+def is_binary(filename):
+    """Returns whether ``filename`` is a moneyGuru document in the binary format."""
+    try:
+        with open(filename, 'rb') as fp:
+            return fp.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    except OSError:
+        return False
+
 class Loader(base.Loader):
+    """Loads a moneyGuru document.
+
+    The file is read incrementally. Accounts, transactions and schedules are created as soon as
+    their element is parsed, and that element is then discarded. This way, we never hold more than
+    one top-level element in memory, regardless of the file size.
+
+    :meth:`parse` first tries to load the file with ``load_native()``, which parses it in C directly
+    into our accounts, transactions and schedules. If it can't, for example because the file isn't
+    a moneyGuru document, we fall back to our python parser, which reports the error.
+
+    Documents in the binary format (see :func:`.saver.native.save`) are loaded with
+    ``load_binary()``. There's no python parser for them.
+    """
     FILE_OPEN_MODE = 'rb'
     NATIVE_DATE_FORMAT = '%Y-%m-%d'
 
@@ -31,121 +54,266 @@ class Loader(base.Loader):
         self.oven = Oven(self.accounts, self.transactions, self.schedules)
         self.properties = {}
         self.document_id = None
+        self._properties_read = False
+        self._load_error = None
+        # Top-level transactions read by _parse(). They're added to self.transactions all at once.
+        self._parsed_txns = []
+        #: If the document had a journal, ``(ids, next_id, offset, end)`` to resume it with.
+        #: See :meth:`.Journal.resume`.
+        self.journal_state = None
+        #: Whether the journal had records that were never saved, which we replayed.
+        self.journal_recovered = False
+        #: Whether the document is in the binary format.
+        self.binary = False
 
-    def _parse(self, infile):
+    # --- Private
+    def _str2date(self, s, default=None):
         try:
-            root = ET.parse(infile).getroot()
-        except SyntaxError:
-            raise FileFormatError()
-        if root.tag != 'moneyguru-file':
-            raise FileFormatError()
-        self.root = root
+            return base.parse_date_str(s, self.parsing_date_format)
+        except (ValueError, TypeError):
+            return default
 
-    def _load(self):
-        TODAY = datetime.date.today()
+    @staticmethod
+    def _handle_newlines(s):
+        # etree doesn't correctly save newlines. During save, we escape them. Now's the time to
+        # restore them.
+        # XXX After a while, when most users will have used a moneyGuru version that doesn't
+        # need newline escaping on save, we can remove this one as well.
+        if not s:
+            return s
+        return s.replace('\\n', '\n')
+
+    def _read_element(self, element):
+        # Reads a top-level element. Only top-level transactions are regular transactions, but
+        # accounts and recurrences are read wherever they are.
+        if element.tag == 'properties' and not self._properties_read:
+            self._read_properties(element.attrib)
+        for account_element in element.iter('account'):
+            self._read_account(account_element)
+        if element.tag == 'transaction':
+            self._parsed_txns.append(self._read_transaction(element))
+        for recurrence_element in element.iter('recurrence'):
+            self.schedules.append(self._read_recurrence(recurrence_element))
+
+    def _read_properties(self, attrib):
+        self._properties_read = True
+        for name, value in attrib.items():
+            # For now, all our prefs except default_currency are ints, so
+            # we can simply assume tryint, but we'll eventually need
+            # something more sophisticated.
+            if name != 'default_currency':
+                value = tryint(value, default=None)
+            if name and value is not None:
+                self.properties[name] = value
+
+    def _read_account(self, element):
+        attrib = element.attrib
+        name = attrib.get('name')
+        if not name:
+            return
+        currency = self.get_currency(attrib.get('currency'))
+        type = base.get_account_type(attrib.get('type'))
+        account = self.accounts.create(name, currency, type)
+        account.change(**self._account_attributes(attrib))
+
+    def _account_attributes(self, attrib):
+        return dict(
+            groupname=attrib.get('group'),
+            reference=attrib.get('reference'),
+            account_number=attrib.get('account_number', ''),
+            inactive=attrib.get('inactive') == 'y',
+            notes=self._handle_newlines(attrib.get('notes', '')),
+        )
+
+    def _read_transaction(self, element):
+        attrib = element.attrib
+        date = self._str2date(attrib.get('date'), datetime.date.today())
+        description = attrib.get('description')
+        payee = attrib.get('payee')
+        checkno = attrib.get('checkno')
+        txn = Transaction(date, description, payee, checkno, None, None)
+        txn.notes = self._handle_newlines(attrib.get('notes')) or ''
+        try:
+            txn.mtime = int(attrib.get('mtime', 0))
+        except ValueError:
+            txn.mtime = 0
+        reference = attrib.get('reference')
+        for split_element in element.iter('split'):
+            attrib = split_element.attrib
+            accountname = attrib.get('account')
+            str_amount = attrib.get('amount')
+            account, amount = base.process_split(
+                self.accounts, accountname, str_amount, strict_currency=True)
+            split = txn.new_split()
+            split.account = account
+            split.amount = amount
+            split.memo = attrib.get('memo') or ''
+            split.reference = attrib.get('reference') or reference
+            if attrib.get('reconciled') == 'y':
+                split.reconciliation_date = date
+            elif account is None or not (not amount or amount.currency_code == account.currency):
+                # fix #442: off-currency transactions shouldn't be reconciled
+                split.reconciliation_date = None
+            elif 'reconciliation_date' in attrib:
+                split.reconciliation_date = self._str2date(attrib['reconciliation_date'])
+        txn.balance()
+        while len(txn.splits) < 2:
+            txn.new_split()
+        return txn
 
-        def str2date(s, default=None):
+    def _read_recurrence(self, element):
+        attrib = element.attrib
+        ref = self._read_transaction(element.find('transaction'))
+        repeat_type = RepeatType.from_str(attrib.get('type'))
+        repeat_every = int(attrib.get('every', '1'))
+        recurrence = Recurrence(ref, repeat_type, repeat_every)
+        recurrence.change(stop_date=self._str2date(attrib.get('stop_date')))
+        for exception_element in element.iter('exception'):
             try:
-                return base.parse_date_str(s, self.parsing_date_format)
-            except (ValueError, TypeError):
-                return default
-
-        def handle_newlines(s):
-            # etree doesn't correctly save newlines. During save, we escape them. Now's the time to
-            # restore them.
-            # XXX After a while, when most users will have used a moneyGuru version that doesn't
-            # need newline escaping on save, we can remove this one as well.
-            if not s:
-                return s
-            return s.replace('\\n', '\n')
-
-        def read_transaction_element(element):
-            attrib = element.attrib
-            date = str2date(attrib.get('date'), TODAY)
-            description = attrib.get('description')
-            payee = attrib.get('payee')
-            checkno = attrib.get('checkno')
-            txn = Transaction(date, description, payee, checkno, None, None)
-            txn.notes = handle_newlines(attrib.get('notes')) or ''
+                date = self._str2date(exception_element.attrib['date'])
+                recurrence.delete_at(date)
+            except KeyError:
+                continue
+        for change_element in element.iter('change'):
             try:
-                txn.mtime = int(attrib.get('mtime', 0))
-            except ValueError:
-                txn.mtime = 0
-            reference = attrib.get('reference')
-            for split_element in element.iter('split'):
-                attrib = split_element.attrib
-                accountname = attrib.get('account')
-                str_amount = attrib.get('amount')
-                account, amount = base.process_split(
-                    self.accounts, accountname, str_amount, strict_currency=True)
-                split = txn.new_split()
-                split.account = account
-                split.amount = amount
-                split.memo = attrib.get('memo') or ''
-                split.reference = attrib.get('reference') or reference
-                if attrib.get('reconciled') == 'y':
-                    split.reconciliation_date = date
-                elif account is None or not (not amount or amount.currency_code == account.currency):
-                    # fix #442: off-currency transactions shouldn't be reconciled
-                    split.reconciliation_date = None
-                elif 'reconciliation_date' in attrib:
-                    split.reconciliation_date = str2date(attrib['reconciliation_date'])
-            txn.balance()
-            while len(txn.splits) < 2:
-                txn.new_split()
-            return txn
-
-        root = self.root
-        self.document_id = root.attrib.get('document_id')
-        props_element = root.find('properties')
-        if props_element is not None:
-            for name, value in props_element.attrib.items():
-                # For now, all our prefs except default_currency are ints, so
-                # we can simply assume tryint, but we'll eventually need
-                # something more sophisticated.
-                if name != 'default_currency':
-                    value = tryint(value, default=None)
-                if name and value is not None:
-                    self.properties[name] = value
-        for account_element in root.iter('account'):
-            attrib = account_element.attrib
-            name = attrib.get('name')
-            if not name:
+                date = self._str2date(change_element.attrib['date'])
+                txn_element = change_element.find('transaction')
+                change = self._read_transaction(txn_element) if txn_element is not None else None
+                recurrence.add_global_change(date, change)
+            except KeyError:
+                continue
+        return recurrence
+
+    def _replay_journal(self, filename):
+        read = journal.read(filename)
+        if read is None:
+            return
+        header, actions, offset, end = read
+        txns = list(self.transactions)
+        positions = header.get('positions', '').split()
+        if len(positions) != len(txns):
+            return
+        for txn, position in zip(txns, positions):
+            txn.position = int(position)
+        self.transactions.sort()
+        ids = dict(enumerate(txns))
+        next_id = len(txns)
+        for action in actions:
+            next_id = max(next_id, self._replay_action(action, ids))
+        self.journal_state = ({txn: i for i, txn in ids.items()}, next_id, offset, end)
+        self.journal_recovered = end > offset
+
+    def _replay_action(self, action, ids):
+        # Returns the id following the highest transaction id in `action`.
+        next_id = 0
+        element = action.find('properties')
+        if element is not None:
+            self._read_properties(element.attrib)
+        # Removed accounts go first so that their names can be reused, then renames, then new
+        # accounts.
+        for element in action.findall('remove-account'):
+            account = self.accounts.find(element.attrib['name'])
+            if account is not None:
+                self.accounts.remove(account)
+        new_accounts = []
+        for element in action.findall('set-account'):
+            oldname = element.attrib.get('name')
+            account = self.accounts.find(oldname) if oldname else None
+            if account is None:
+                new_accounts.append(element.find('account'))
                 continue
-            currency = self.get_currency(attrib.get('currency'))
-            type = base.get_account_type(attrib.get('type'))
-            account = self.accounts.create(name, currency, type)
-            group = attrib.get('group')
-            reference = attrib.get('reference')
-            account_number = attrib.get('account_number', '')
-            inactive = attrib.get('inactive') == 'y'
-            notes = handle_newlines(attrib.get('notes', ''))
+            attrib = element.find('account').attrib
+            if attrib['name'] != account.name:
+                self.accounts.rename_account(account, attrib['name'])
             account.change(
-                groupname=group, reference=reference,
-                account_number=account_number, inactive=inactive, notes=notes)
-        elements = [e for e in root if e.tag == 'transaction'] # we only want transaction element *at the root*
-        for transaction_element in elements:
-            txn = read_transaction_element(transaction_element)
-            self.transactions.add(txn)
-        for recurrence_element in root.iter('recurrence'):
-            attrib = recurrence_element.attrib
-            ref = read_transaction_element(recurrence_element.find('transaction'))
-            repeat_type = RepeatType.from_str(attrib.get('type'))
-            repeat_every = int(attrib.get('every', '1'))
-            recurrence = Recurrence(ref, repeat_type, repeat_every)
-            recurrence.change(stop_date=str2date(attrib.get('stop_date')))
-            for exception_element in recurrence_element.iter('exception'):
-                try:
-                    date = str2date(exception_element.attrib['date'])
-                    recurrence.delete_at(date)
-                except KeyError:
+                currency=self.get_currency(attrib.get('currency')),
+                type=base.get_account_type(attrib.get('type')),
+                **self._account_attributes(attrib))
+        for element in new_accounts:
+            name = element.attrib.get('name')
+            if name and self.accounts.find(name) is None:
+                self._read_account(element)
+        for element in action.findall('remove-transaction'):
+            txn = ids.pop(int(element.attrib['id']), None)
+            if txn is not None:
+                self.transactions.remove(txn)
+        for element in action.findall('set-transaction'):
+            txn_id = int(element.attrib['id'])
+            next_id = max(next_id, txn_id + 1)
+            old = ids.get(txn_id)
+            if old is not None:
+                self.transactions.remove(old)
+            txn = self._read_transaction(element.find('transaction'))
+            txn.position = int(element.attrib['position'])
+            self.transactions.add(txn, True)
+            ids[txn_id] = txn
+        element = action.find('schedules')
+        if element is not None:
+            self.schedules[:] = [self._read_recurrence(e) for e in element.findall('recurrence')]
+        return next_id
+
+    # --- Override
+    def _parse(self, infile):
+        events = ET.iterparse(infile, events=('start', 'end'))
+        try:
+            _, root = next(events)
+            if root.tag != 'moneyguru-file':
+                raise FileFormatError()
+            self.document_id = root.attrib.get('document_id')
+            depth = 1
+            for event, element in events:
+                if event == 'start':
+                    depth += 1
                     continue
-            for change_element in recurrence_element.iter('change'):
-                try:
-                    date = str2date(change_element.attrib['date'])
-                    txn_element = change_element.find('transaction')
-                    change = read_transaction_element(txn_element) if txn_element is not None else None
-                    recurrence.add_global_change(date, change)
-                except KeyError:
+                depth -= 1
+                if depth != 1:
                     continue
-            self.schedules.append(recurrence)
+                # We have a complete top-level element.
+                if self._load_error is None:
+                    try:
+                        self._read_element(element)
+                    except FileFormatError as e:
+                        # The file is fine, but we can't load it. We report it at load time.
+                        self._load_error = e
+                root.clear()
+            self.transactions.add_many(self._parsed_txns)
+            self._parsed_txns = []
+        except SyntaxError as e:
+            # The parser's error is part of a reference cycle through its traceback. Don't let it
+            # keep our callers' frames alive.
+            e.__traceback__ = None
+            raise FileFormatError()
+
+    def _load(self):
+        if self._load_error is not None:
+            raise self._load_error
+
+    # --- Public
+    def parse(self, filename):
+        self.binary = is_binary(filename)
+        load_func = load_binary if self.binary else load_native
+        try:
+            loaded = load_func(str(filename), self.accounts, self.transactions)
+        except UnsupportedCurrencyError:
+            # The file is fine, but we can't load it. We report it at load time.
+            self._load_error = base.unsupported_currency_error(self.default_currency)
+            return
+        if loaded is None and self.binary:
+            raise FileFormatError()
+        elif loaded is None:
+            self.accounts.clear()
+            self.transactions.clear()
+            try:
+                super().parse(filename)
+            except FileFormatError:
+                # Don't leave behind what was read before the error.
+                self.accounts.clear()
+                self.transactions.clear()
+                del self.schedules[:]
+                raise
+        else:
+            self.document_id, properties, schedules = loaded
+            self._read_properties(properties)
+            self.schedules += schedules
+        if self._load_error is None:
+            self._replay_journal(filename)
@@ -6,51 +6,98 @@
 #
 # Sections refer to the OFX 1.0.3 spec.
 
-from itertools import dropwhile
+import html
+import re
 
 from ..const import AccountType
 from ..exception import FileFormatError
-from .sgmllib import SGMLParser
 from . import base
 
-class OFXParser(SGMLParser):
+# Size of the chunks in which we feed OFX files to OFXParser.
+CHUNK_SIZE = 64 * 1024
+
+# Matches a start or end tag, or markup we ignore: comments, declarations and processing
+# instructions (the `<?xml ?>` and `<?OFX ?>` headers of OFX 2.x).
+_TAG_RE = re.compile(r'<(?:(/?)([A-Za-z][\w.]*)[^>]*|!--.*?--|[?!][^>]*)>', re.DOTALL)
+
+class OFXParser:
+    """Streaming tokenizer for OFX 1.x (SGML) and 2.x (XML) documents.
+
+    The document is fed in chunks. Every tag with a matching ``start_<tag>`` or ``end_<tag>``
+    method calls it. Start methods can set ``data_handler`` to receive the stripped character data
+    that follows the tag. In SGML, elements with data aren't closed, so their data ends at the next
+    tag. Like in SGML, an end tag closes all elements that were opened after the element it closes.
+    """
     def __init__(self, loader, accounts_only=False):
-        super().__init__()
         self.loader = loader
-        self.data = ''
+        # Pieces of the character data we're collecting for data_handler.
+        self.data = []
         self.data_handler = None
         self.accounts_only = accounts_only
+        # Tags of the open elements that have a start method.
+        self.stack = []
+        # End of the last chunk if it holds the beginning of a tag.
+        self.rest = ''
 
     # --- Helper methods
 
     def flush_data(self):
         if self.data_handler:
-            self.data_handler(self.data.strip())
+            data = ''.join(self.data).strip()
+            if '&' in data:
+                data = html.unescape(data)
+            self.data_handler(data)
             self.data_handler = None
-        self.data = ''
-
-    # --- Global hooks
-
-    def handle_starttag(self, tag, method, attributes):
-        self.flush_data()
-        super().handle_starttag(tag, method, attributes)
-
-    def handle_endtag(self, tag, method):
-        self.flush_data()
-        super().handle_endtag(tag, method)
+        self.data.clear()
 
-    def unknown_starttag(self, tag, attributes):
+    def handle_tag(self, match):
+        is_end, tag = match.groups()
+        if not tag:
+            return
         self.flush_data()
-
-    def unknown_endtag(self, tag):
+        tag = tag.lower()
+        if is_end:
+            if tag not in self.stack:
+                return
+            while True:
+                closed = self.stack.pop()
+                method = getattr(self, 'end_' + closed, None)
+                if method is not None:
+                    method()
+                if closed == tag:
+                    break
+        else:
+            method = getattr(self, 'start_' + tag, None)
+            if method is not None:
+                self.stack.append(tag)
+                method()
+
+    # --- Public
+
+    def feed(self, chunk):
+        if self.rest:
+            chunk = self.rest + chunk
+        pos = 0
+        for match in _TAG_RE.finditer(chunk):
+            if self.data_handler and match.start() > pos:
+                self.data.append(chunk[pos:match.start()])
+            pos = match.end()
+            self.handle_tag(match)
+        # We keep an unfinished tag for the next chunk.
+        tagstart = chunk.find('<', pos)
+        if tagstart == -1:
+            tagstart = len(chunk)
+        if self.data_handler and tagstart > pos:
+            self.data.append(chunk[pos:tagstart])
+        self.rest = chunk[tagstart:]
+
+    def close(self):
+        self.rest = ''
         self.flush_data()
 
-    def handle_data(self, data):
-        self.data += data
-
     # --- Account tags
 
-    def start_stmtrs(self, attributes):
+    def start_stmtrs(self):
         self.loader.start_account()
         self.account_info = self.loader.account_info
     start_ccstmtrs = start_stmtrs
@@ -62,25 +109,25 @@ class OFXParser(SGMLParser):
             a.reference = '|'.join([a.ofx_bank_id, ofx_branch_id, a.ofx_acct_id])
         self.loader.flush_account()
 
-    def start_curdef(self, attributes):
+    def start_curdef(self):
         self.data_handler = self.handle_curdef
 
     def handle_curdef(self, data):
         self.account_info.currency = data
 
-    def start_bankid(self, attributes):
+    def start_bankid(self):
         self.data_handler = self.handle_bankid
 
     def handle_bankid(self, data):
         self.account_info.ofx_bank_id = data
 
-    def start_branchid(self, attributes):
+    def start_branchid(self):
         self.data_handler = self.handle_branchid
 
     def handle_branchid(self, data):
         self.account_info.ofx_branch_id = data
 
-    def start_acctid(self, attributes):
+    def start_acctid(self):
         self.data_handler = self.handle_acctid
 
     def handle_acctid(self, data):
@@ -89,7 +136,7 @@ class OFXParser(SGMLParser):
 
     # --- Entry tags
 
-    def start_stmttrn(self, attributes):
+    def start_stmttrn(self):
         if self.accounts_only:
             return
         self.loader.start_transaction()
@@ -100,7 +147,7 @@ class OFXParser(SGMLParser):
             return
         self.loader.flush_transaction()
 
-    def start_fitid(self, attributes):
+    def start_fitid(self):
         self.data_handler = self.handle_fitid
 
     def handle_fitid(self, data):
@@ -108,7 +155,7 @@ class OFXParser(SGMLParser):
             return
         self.transaction_info.reference = data
 
-    def start_name(self, attributes):
+    def start_name(self):
         self.data_handler = self.handle_name
 
     def handle_name(self, data):
@@ -116,7 +163,7 @@ class OFXParser(SGMLParser):
             return
         self.transaction_info.description = data
 
-    def start_dtposted(self, attributes):
+    def start_dtposted(self):
         self.data_handler = self.handle_dtposted
 
     def handle_dtposted(self, data):
@@ -125,7 +172,7 @@ class OFXParser(SGMLParser):
         self.transaction_info.date = base.parse_date_str(
             data[:8], Loader.NATIVE_DATE_FORMAT)
 
-    def start_trnamt(self, attributes):
+    def start_trnamt(self):
         self.data_handler = self.handle_trnamt
 
     def handle_trnamt(self, data):
@@ -143,6 +190,7 @@ class Loader(base.Loader):
         super().__init__(*args, **kwargs)
         self.account_info = AccountInfo()
         self.transaction_info = base.TransactionInfo()
+        self._loaded_txns = []
 
     def _parse(self, infile):
         # First line is OFXHEADER (section 2.2.1)
@@ -152,19 +200,27 @@ class Loader(base.Loader):
         line = line.strip()
         if line != 'OFXHEADER:100' and not line.startswith('<?OFX'):
             raise FileFormatError()
-        self.lines = list(infile)
 
-    def _load(self):
-        is_header = lambda line: not line.startswith('<')
-        parser = OFXParser(self, accounts_only=True)
-        for line in dropwhile(is_header, self.lines):
-            parser.feed(line)
-        parser.close()
-        parser = OFXParser(self)
-        for line in dropwhile(is_header, self.lines):
-            parser.feed(line)
+    def _feed(self, parser):
+        # The file is read again, in chunks, rather than kept in memory after _parse().
+        with open(self.filename, 'rt', encoding=self.FILE_ENCODING, errors='ignore') as infile:
+            # Skip the SGML header
+            for line in infile:
+                if line.startswith('<'):
+                    parser.feed(line)
+                    break
+            for chunk in iter(lambda: infile.read(CHUNK_SIZE), ''):
+                parser.feed(chunk)
         parser.close()
 
+    def _load(self):
+        # Accounts are created in a first pass so that their currency is known when we load
+        # transactions in the second one.
+        self._feed(OFXParser(self, accounts_only=True))
+        self._feed(OFXParser(self))
+        self.transactions.add_many(self._loaded_txns)
+        self._loaded_txns = []
+
     def start_account(self):
         self.flush_account() # Implicit
 
@@ -197,8 +253,7 @@ class Loader(base.Loader):
         if info.account is None and self.account_info and self.account_info.name:
             info.account = self.account_info.name
         if info.is_valid():
-            transaction = info.load(self.accounts)
-            self.transactions.add(transaction)
+            self._loaded_txns.append(info.load(self.accounts))
         self.transaction_info = base.TransactionInfo()
 
 class AccountInfo:
@@ -6,12 +6,11 @@
 
 import logging
 import re
+from bisect import bisect_right
 from collections import namedtuple, defaultdict
-from itertools import groupby, combinations
+from itertools import chain, groupby, islice
 from operator import attrgetter
 
-from core.util import first, stripfalse
-
 from ..const import AccountType
 from ..exception import FileFormatError
 from . import base
@@ -39,6 +38,27 @@ re_not_amount = re.compile(r'[^\d.,\-]+')
 
 ENTRY_HEADERS = {'Type:Bank', 'Type:Invst', 'Type:Cash', 'Type:Oth A', 'Type:CCard', 'Type:Oth L'}
 
+# Number of entry dates we guess the date format from.
+DATE_SAMPLE_SIZE = 1000
+
+def remove_brackets(name):
+    if name.startswith('[') and name.endswith(']'):
+        return name[1:-1].strip()
+    else:
+        return name
+
+def parse_account_lines(lines):
+    name = type = None
+    for header, data in lines:
+        if header == 'N':
+            name = data.strip()
+        if header == 'T' and data in ('Oth L', 'CCard'):
+            type = AccountType.Liability
+    return name, type
+
+class DateSampleMismatch(Exception):
+    """An entry's date doesn't fit the date format we guessed from a sample of the dates."""
+
 class BlockType:
     Account = 1
     Entry = 2
@@ -50,9 +70,15 @@ class Block:
     def __init__(self):
         self.type = BlockType.Other
         self.lines = []
+        # header -> first line with that header
+        self._first_lines = {}
+
+    def add_line(self, line):
+        self.lines.append(line)
+        self._first_lines.setdefault(line.header, line)
 
     def get_line(self, line_header):
-        return first(line for line in self.lines if line.header == line_header)
+        return self._first_lines.get(line_header)
 
 
 class Loader(base.Loader):
@@ -60,16 +86,22 @@ class Loader(base.Loader):
     EXTRA_DATE_FORMATS = ['%m/%d/%Y'] # Also try the YYYY version of the date format in priority
 
 
-    def _parse(self, infile):
-        content = infile.read()
-        lines = stripfalse(content.split('\n'))
-        blocks = []
-        autoswitch_blocks = [] # blocks in the middle of an AutoSwitch option
+    @staticmethod
+    def _iter_lines(infile):
+        for line in infile:
+            line = line.rstrip('\n')
+            if line:
+                yield Line(line[0], line[1:].strip())
+
+    @staticmethod
+    def _iter_blocks(lines, autoswitch_blocks):
+        # Yields the blocks of `lines`. Blocks in the middle of an AutoSwitch option go to
+        # `autoswitch_blocks` instead.
         block = Block()
         current_block_type = BlockType.Entry
         autoswitch_mode = False
         for line in lines:
-            header, data = line[0], line[1:].strip()
+            header, data = line
             if header == '!':
                 if data == 'Account':
                     current_block_type = BlockType.Account
@@ -79,7 +111,7 @@ class Loader(base.Loader):
                         # We have a buggy qif that doesn't clear its autoswitch flag. The last block
                         # we added to autoswitch actually belonged to normal blocks. move it.
                         if autoswitch_blocks:
-                            blocks.append(autoswitch_blocks.pop())
+                            yield autoswitch_blocks.pop()
                         autoswitch_mode = False
                 elif data.startswith('Type:'): # if it doesn't, just ignore it
                     current_block_type = BlockType.Other
@@ -99,48 +131,49 @@ class Loader(base.Loader):
                     if autoswitch_mode:
                         autoswitch_blocks.append(block)
                     else:
-                        blocks.append(block)
+                        yield block
                 block = Block()
                 if current_block_type == BlockType.Account and not autoswitch_mode:
                     current_block_type = BlockType.Entry
             if header != '^':
-                block.lines.append(Line(header, data))
-        del block
-        if not blocks:
-            raise FileFormatError()
-        logging.debug('This is a QIF file. {0} blocks'.format(len(blocks)))
-        entry_blocks = [block for block in blocks if block.type == BlockType.Entry]
+                block.add_line(line)
+
+    @staticmethod
+    def _skip_empty_accounts(blocks, empty_account_blocks):
+        # Account blocks that aren't followed by entries go to `empty_account_blocks`.
+        block = next(blocks, None)
+        while block is not None:
+            nextblock = next(blocks, None)
+            if block.type == BlockType.Account and (nextblock is None or nextblock.type != BlockType.Entry):
+                empty_account_blocks.append(block)
+            else:
+                yield block
+            block = nextblock
+
+    def _open(self):
+        return open(self.filename, 'rt', encoding=self.FILE_ENCODING, errors='ignore')
+
+    def _parse(self, infile):
+        # We only go through the file until we have enough dates to guess its date format. It's
+        # read again, block by block, in _load().
+        blocks = self._iter_blocks(self._iter_lines(infile), [])
+        entry_blocks = (block for block in blocks if block.type == BlockType.Entry)
         date_lines = (block.get_line('D') for block in entry_blocks)
-        str_dates = [line.data for line in date_lines if line]
+        str_dates = [line.data for line in islice(date_lines, DATE_SAMPLE_SIZE + 1)]
+        # If we've seen all dates, there's no other date that could contradict our guess.
+        self._date_format_from_sample = len(str_dates) > DATE_SAMPLE_SIZE
+        del str_dates[DATE_SAMPLE_SIZE:]
+        # No dates also means no blocks, and then, this isn't a QIF file.
         self.parsing_date_format = self.guess_date_format(str_dates)
         if self.parsing_date_format is None:
             raise FileFormatError()
-        self.blocks = blocks
-        self.autoswitch_blocks = autoswitch_blocks
-
-    def _load(self):
-        def remove_brackets(name):
-            if name.startswith('[') and name.endswith(']'):
-                return name[1:-1].strip()
-            else:
-                return name
+        logging.debug('This is a QIF file.')
 
-        def parse_account_lines(lines):
-            name = type = None
-            for header, data in lines:
-                if header == 'N':
-                    name = data.strip()
-                if header == 'T' and data in ('Oth L', 'CCard'):
-                    type = AccountType.Liability
-            return name, type
-
-        self.seen_account_names = set()
-        # Send "empty" accounts to the autoswitch_blocks list
-        for block, nextblock in zip(self.blocks[:], self.blocks[1:]+[None]):
-            if block.type == BlockType.Account and (nextblock is None or nextblock.type != BlockType.Entry):
-                self.autoswitch_blocks.append(block)
-                self.blocks.remove(block)
-        for block in self.blocks:
+    def _iter_transactions(self, blocks):
+        # Yields the transactions loaded from entry blocks. Account blocks set the account of the
+        # entries that follow them.
+        current_account = None
+        for block in blocks:
             block_type = block.type
             lines = block.lines
             if block_type == BlockType.Account:
@@ -189,7 +222,13 @@ class Loader(base.Loader):
                         try:
                             info.date = base.parse_date_str(data, self.parsing_date_format)
                         except ValueError:
-                            pass
+                            if info.date is not None:
+                                # extra date line, we already have our date
+                                continue
+                            if not self._date_format_from_sample:
+                                logging.warning("Skipping QIF entry with invalid date %r", data)
+                                continue
+                            raise DateSampleMismatch()
                     elif header == 'M':
                         info.description = data
                     elif header == 'P':
@@ -209,12 +248,44 @@ class Loader(base.Loader):
                 if info.is_valid():
                     if info.transfer and (len(info.splits) < 2):
                         info.add_split(info.transfer, info.amount, None)
-                    txn = info.load(self.accounts)
-                    self.transactions.add(txn)
-                del info
+                    yield info.load(self.accounts)
+
+    def _guess_date_format_from_all_dates(self):
+        with self._open() as infile:
+            blocks = self._iter_blocks(self._iter_lines(infile), [])
+            str_dates = [
+                block.get_line('D').data for block in blocks if block.type == BlockType.Entry
+            ]
+        return self.guess_date_format(str_dates)
+
+    def _load_transactions(self, autoswitch_blocks, empty_account_blocks):
+        self.seen_account_names = set()
+        with self._open() as infile:
+            blocks = self._iter_blocks(self._iter_lines(infile), autoswitch_blocks)
+            blocks = self._skip_empty_accounts(blocks, empty_account_blocks)
+            return list(self._iter_transactions(blocks))
+
+    def _load(self):
+        autoswitch_blocks = []
+        # "Empty" accounts are handled like autoswitch blocks.
+        empty_account_blocks = []
+        try:
+            txns = self._load_transactions(autoswitch_blocks, empty_account_blocks)
+        except DateSampleMismatch:
+            # Our date format was guessed from a sample of the file's dates and one of the others
+            # doesn't fit it. Guess again from all of them and start over. If no format fits all of
+            # them, we keep the one we had and skip the entries it can't parse.
+            self._date_format_from_sample = False
+            date_format = self._guess_date_format_from_all_dates()
+            if date_format is not None:
+                self.parsing_date_format = date_format
+            del autoswitch_blocks[:]
+            del empty_account_blocks[:]
+            txns = self._load_transactions(autoswitch_blocks, empty_account_blocks)
+        self.transactions.add_many(txns)
         # For accounts that haven't been added in normal blocks, we complete the list with autoswitch
         # blocks (so that we can have correct types for income/expense accounts)
-        for block in self.autoswitch_blocks:
+        for block in chain(autoswitch_blocks, empty_account_blocks):
             if block.type == BlockType.Account:
                 name, type = parse_account_lines(block.lines)
                 if name not in self.seen_account_names:
@@ -240,7 +311,7 @@ class Loader(base.Loader):
             transfer_splits = [s for s in txn.splits if s.account_name in self.seen_account_names]
             return len(transfer_splits) >= 2
 
-        txn2matches = defaultdict(list)
+        txn2matches = {}
         # Only process txns which are transfer txns. Others are irrelevant to duplicate matching.
         transfer_txns = [txn for txn in self.transactions if is_transfer_transaction(txn)]
         for _, txns in groupby(transfer_txns, key=attrgetter('date')):
@@ -249,27 +320,48 @@ class Loader(base.Loader):
             # 3-splits txn can be matched to an incomplete 2-splits txn.
             # See test_quicken_split_duplicate.
             txns = sorted(txns, key=lambda txn: len(txn.splits), reverse=True)
-            for txn1, txn2 in combinations(txns, 2):
-                splits1 = {(s.account_name, s.amount) for s in txn1.splits}
-                splits2 = {(s.account_name, s.amount) for s in txn2.splits}
-                # If any of the splits' account *and* amount are the same, we have a match
-                if splits1 & splits2:
-                    matches = txn2matches[txn1]
-                    matches.append(txn2)
+            # If any of the splits' account *and* amount are the same, we have a match. Rather than
+            # comparing each pair of txns, we index txns by these (account, amount) fingerprints.
+            # Indexes are added in increasing order, so these lists are sorted.
+            fingerprint2indexes = defaultdict(list)
+            txn_fingerprints = []
+            for index, txn in enumerate(txns):
+                fingerprints = {(s.account_name, s.amount) for s in txn.splits}
+                txn_fingerprints.append(fingerprints)
+                for fingerprint in fingerprints:
+                    fingerprint2indexes[fingerprint].append(index)
+            for index, fingerprints in enumerate(txn_fingerprints):
+                # A txn is only matched with the ones that come after it
+                matching = set()
+                for fingerprint in fingerprints:
+                    indexes = fingerprint2indexes[fingerprint]
+                    matching.update(indexes[bisect_right(indexes, index):])
+                if matching:
+                    txn2matches[txns[index]] = [txns[i] for i in sorted(matching)]
         toremove = set()
         # Here, we sort by match length to make sure that description matching (the
-        # ``match.sort()`` line a few lines below) has all the opportunities it needs to actually
+        # description priority a few lines below) has all the opportunities it needs to actually
         # do that matching. Also, if we don't do that, there's actually a chance that we falsely
         # remove matching pairs from our transactions.
         matchpairs = sorted(txn2matches.items(), key=lambda pair: len(pair[1]), reverse=True)
         for txn, matches in matchpairs:
             if txn in toremove:
                 continue
-            matches = [t for t in matches if t not in toremove]
             # Priorize matches with the same description. Although it's possible to have duplicates
             # with a different description, we still want to do the right thing when we actually
-            # have a description match.
-            matches.sort(key=lambda t: t.description == txn.description, reverse=True)
-            toremove |= set(matches[:len(txn.splits)-1])
+            # have a description match. We stop looking once we have enough of those.
+            wanted = len(txn.splits) - 1
+            same_description = []
+            other_description = []
+            for match in matches:
+                if match in toremove:
+                    continue
+                if match.description == txn.description:
+                    same_description.append(match)
+                    if len(same_description) >= wanted:
+                        break
+                else:
+                    other_description.append(match)
+            toremove.update((same_description + other_description)[:wanted])
         for txn in toremove:
             self.transactions.remove(txn)
@@ -123,12 +123,17 @@ class RatesDB:
             try:
                 rates, currency, fetch_start, fetch_end = self._fetched_values.get_nowait()
                 logging.debug("Saving %d rates for the currency %s", len(rates), currency)
+                values = []
                 for rate_date, rate in rates:
                     if not rate:
                         logging.debug("Empty rate for %s. Skipping", rate_date)
                         continue
-                    logging.debug("Saving rate %2.2f for %s", rate, rate_date)
-                    self.set_CAD_value(rate_date, currency, rate)
+                    values.append((rate_date, rate))
+                try:
+                    self.set_CAD_values(currency, values)
+                except IOError:
+                    logging.warning("Couldn't save fetched rates for currency %s", currency)
+                    continue
                 logging.debug("Finished saving rates for currency %s", currency)
             except Empty:
                 break
@@ -170,6 +175,14 @@ class RatesDB:
         self.clear_cache()
         _ccore.currency_set_CAD_value(date, currency_code, value)
 
+    def set_CAD_values(self, currency_code, values):
+        """Sets daily values in CAD for currency from a list of ``(date, value)``.
+
+        All values are written in a single DB transaction.
+        """
+        self.clear_cache()
+        _ccore.currency_set_CAD_values(currency_code, values)
+
     def register_rate_provider(self, rate_provider):
         """Adds `rate_provider` to the list of providers supported by this DB.
 
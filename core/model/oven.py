@@ -28,6 +28,11 @@ class Oven:
         #: schedule :class:`.Spawn` instances (in date/position order).
         self.transactions = []
 
+    @property
+    def cooked_until(self):
+        """Date up to which we last cooked."""
+        return self._cooked_until
+
     def continue_cooking(self, until_date):
         """Cooks from where we stop last time until ``until_date``.
 
@@ -39,7 +44,7 @@ class Oven:
         if until_date > self._cooked_until:
             self.cook(self._cooked_until, until_date)
 
-    def cook(self, from_date=None, until_date=None):
+    def cook(self, from_date=None, until_date=None, accounts=None, balances=None):
         """Cooks raw data into :attr:`transactions`.
 
         :param from_date: when set, saves calculation time by re-using existing cooked transactions.
@@ -48,6 +53,15 @@ class Oven:
                            cooking. If we don't, we might end up in an infinite loop. If not set,
                            will be the date of the transaction with the highest date.
         :type until_date: ``datetime.date``
+        :param accounts: when set, only the entries of those accounts are re-created. Entries of
+                         other accounts are left untouched. Ignored if ``until_date`` isn't the
+                         same as last time because then, every account's entries change.
+        :type accounts: set of :class:`.Account`
+        :param balances: when set, entry balances from an earlier cook of the same data until the
+                         same date, mapping accounts to ``EntryList.balances()``. Balances that
+                         still apply are restored rather than computed. Only used when cooking
+                         from the start.
+        :type balances: dict
         """
         # Determine from/until dates
         if from_date is None:
@@ -67,18 +81,32 @@ class Oven:
                     rdate = split.reconciliation_date
                     if rdate is not None and rdate >= from_date:
                         from_date = min(from_date, txn.date)
-        self._transactions.sort() # needed in case until_date is None
+        # Puts back in place txns that were modified in place since our last cook.
+        self._transactions.sort()
         if until_date is None:
             until_date = self._transactions.last().date if self._transactions else from_date
         # Clear old cooked data
         if from_date == date.min:
-            self.transactions = []
+            kept = []
         else:
-            self.transactions = [t for t in self.transactions if t.date < from_date]
-        # Cook
+            kept = [t for t in self.transactions if t.date < from_date]
+            balances = None
+        if accounts is not None:
+            if until_date != self._cooked_until:
+                accounts = None
+            else:
+                # Old spawns are about to be replaced by new instances and entries referring to
+                # them have to go as well.
+                accounts = set(accounts)
+                for txn in self.transactions:
+                    if txn.is_spawn and txn.date >= from_date:
+                        accounts |= txn.affected_accounts()
+                accounts = list(accounts)
+        # Cook. Old cooked spawns have to stay alive until cooking is done because entries we're
+        # about to clear still refer to them.
         cooked = oven_cook_txns(
             self._accounts, self._transactions, self._scheduled or [],
-            from_date, until_date)
-        self.transactions += cooked
+            from_date, until_date, accounts, balances)
+        self.transactions = kept + cooked
         self._cooked_until = until_date
 
@@ -84,6 +84,8 @@ class Undoer:
         self._scheduled = scheduled
         self._index = -1
         self._save_point = None
+        #: :class:`.Journal` to notify of recorded, undone and redone actions. Optional.
+        self.journal = None
 
     # --- Private
     def _do_adds(self, schedules):
@@ -94,6 +96,16 @@ class Undoer:
         for schedule in schedules:
             self._scheduled.remove(schedule)
 
+    def _dirty(self, dirty, schedules):
+        # Adds the spawns of added or removed ``schedules`` to the ``dirty`` range returned by our
+        # undo step.
+        from_date, accounts = dirty
+        for schedule in schedules:
+            if from_date is not None:
+                from_date = min(from_date, schedule.min_date)
+            accounts |= schedule.affected_accounts()
+        return from_date, accounts
+
     # --- Public
     def can_redo(self):
         """Whether we can redo.
@@ -155,6 +167,8 @@ class Undoer:
             self._actions = self._actions[:self._index + 1]
         self._actions.append(action)
         self._index = -1
+        if self.journal is not None:
+            self.journal.track(action)
 
     def undo(self):
         """Undo the next action to be undone.
@@ -164,14 +178,21 @@ class Undoer:
         action and decrease our pointer to the previous action.
 
         Make sure you can call this with :meth:`can_undo` first.
+
+        Returns a ``(from_date, accounts)`` tuple telling what has to be recooked: entries of
+        ``accounts`` from ``from_date``. ``from_date`` is ``None`` when everything has to be
+        recooked.
         """
         assert self.can_undo()
         action = self._actions[self._index]
-        action.undostep.undo(self._accounts, self._transactions)
+        dirty = action.undostep.undo(self._accounts, self._transactions)
         self._do_adds(action.deleted_schedules)
         self._do_deletes(action.added_schedules)
         self._transactions.clear_cache()
         self._index -= 1
+        if self.journal is not None:
+            self.journal.track(action)
+        return self._dirty(dirty, action.added_schedules | action.deleted_schedules)
 
     def redo(self):
         """Redo the next action to be redone.
@@ -180,14 +201,19 @@ class Undoer:
         increase our pointer to the next action.
 
         Make sure you can call this with :meth:`can_redo` first.
+
+        Returns the same kind of tuple as :meth:`undo`.
         """
         assert self.can_redo()
         action = self._actions[self._index + 1]
-        action.undostep.redo(self._accounts, self._transactions)
+        dirty = action.undostep.redo(self._accounts, self._transactions)
         self._do_adds(action.added_schedules)
         self._do_deletes(action.deleted_schedules)
         self._transactions.clear_cache()
         self._index += 1
+        if self.journal is not None:
+            self.journal.track(action)
+        return self._dirty(dirty, action.added_schedules | action.deleted_schedules)
 
     # --- Properties
     @property
@@ -0,0 +1,104 @@
+# Copyright 2019 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import logging
+import os
+import os.path as op
+import threading
+import time
+
+AUTOSAVE_BUFFER_COUNT = 10 # Number of autosave files that will be kept in the cache.
+
+class Autosaver:
+    """Writes autosave files in the background.
+
+    :meth:`save` receives a snapshot of the document (as produced by
+    :func:`core.saver.native.dump`) and returns immediately. Writing the file, syncing it and
+    rotating old autosave files happens in a worker thread. If snapshots come in while we're still
+    writing a previous one, only the newest one is kept for the next write.
+
+    :param async_: If false, :meth:`save` writes synchronously (for tests).
+    """
+    def __init__(self, async_=True):
+        self.async_ = async_
+        self._lock = threading.Lock()
+        self._pending = None # (folder, data) of the newest snapshot waiting to be written
+        self._thread = None
+
+    @staticmethod
+    def _autosave_names(folder):
+        names = [
+            name for name in os.listdir(folder)
+            if name.startswith('autosave') and name.endswith('.moneyguru')]
+        names.sort()
+        return names
+
+    def _write(self, folder, data):
+        existing_names = self._autosave_names(folder)
+        timestamp = int(time.time())
+        # Names have to sort after existing ones, or rotation would remove the newest file. When
+        # we autosave more than once a second, timestamps of names get ahead of the clock.
+        if existing_names:
+            try:
+                last_timestamp = int(existing_names[-1][len('autosave'):-len('.moneyguru')])
+            except ValueError:
+                pass
+            else:
+                timestamp = max(timestamp, last_timestamp + 1)
+        autosave_name = 'autosave{0}.moneyguru'.format(timestamp)
+        # We write in a temporary file so that an interrupted write never leaves a truncated
+        # autosave file behind. The temporary name neither starts with "autosave" nor ends with
+        # ".moneyguru", so a leftover from a crash is never taken for an autosave file.
+        path = op.join(folder, autosave_name)
+        tmppath = op.join(folder, '.' + autosave_name + '.tmp')
+        with open(tmppath, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmppath, path)
+        # We rotate once the new file is there.
+        names = self._autosave_names(folder)
+        for name in names[:max(len(names) - AUTOSAVE_BUFFER_COUNT, 0)]:
+            os.remove(op.join(folder, name))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                pending = self._pending
+                if pending is None:
+                    self._thread = None
+                    return
+                self._pending = None
+            try:
+                self._write(*pending)
+            except OSError:
+                logging.warning("Autosave failed", exc_info=True)
+
+    # --- Public
+    def save(self, folder, data):
+        """Writes ``data`` in a new autosave file in ``folder``.
+
+        If a previous autosave is still being written, ``data`` replaces any snapshot that was
+        waiting for it.
+        """
+        if not self.async_:
+            self._write(folder, data)
+            return
+        with self._lock:
+            # Older snapshots are superseded by this one, no need to write them.
+            self._pending = (folder, data)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.start()
+
+    def wait(self):
+        """Blocks until all pending autosaves are written."""
+        while True:
+            with self._lock:
+                thread = self._thread
+            if thread is None:
+                return
+            thread.join()
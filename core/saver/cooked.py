@@ -0,0 +1,107 @@
+# Copyright 2019 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+"""Cache of cooked entry balances.
+
+Cooking a document from scratch computes the running balances of every entry of every account.
+When a document is opened again without having changed, these balances are the same, so we keep
+them in a cache file named after the document's ID. The cache file is only used if the content
+hash it was written with is still the hash of the document. Balances of documents using more than
+one currency also depend on exchange rates, so this hash covers the rates we have.
+"""
+
+import datetime
+import hashlib
+import os
+import os.path as op
+import struct
+
+from ..model.currency import Currencies
+from . import journal
+
+COOKED_CACHE_FOLDER = 'cooked'
+COOKED_CACHE_VERSION = 1
+_MAGIC = b'MGCK'
+# magic, version, content hash, ordinal of the date we cooked until
+_HEADER = struct.Struct('<4sI20sI')
+# length of the account name, length of its balances
+_RECORD = struct.Struct('<II')
+
+def cache_file(cache_path, document_id):
+    """Returns the path of the cooked cache of document ``document_id``."""
+    return op.join(cache_path, COOKED_CACHE_FOLDER, document_id + '.cooked')
+
+def content_hash(filename, currencies=()):
+    """Returns the hash of the document at ``filename``, as bytes.
+
+    The document's journal, if any, is part of the hash. ``currencies`` are the ones the document
+    uses. If there's more than one, amounts are converted when cooking, so the date range of the
+    rates we have for each of them is part of the hash too: fetching rates invalidates the cache.
+    """
+    hasher = hashlib.sha1()
+    for path in (filename, journal.journal_path(filename)):
+        try:
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(1 << 16), b''):
+                    hasher.update(chunk)
+        except FileNotFoundError:
+            pass
+    if len(currencies) > 1:
+        ratesdb = Currencies.get_rates_db()
+        for code in sorted(currencies):
+            hasher.update(repr((code, ratesdb.date_range(code))).encode('utf-8'))
+    return hasher.digest()
+
+def save(path, key, until_date, accounts):
+    """Writes the balances of the entries of ``accounts`` to ``path``.
+
+    ``key`` is the :func:`content_hash` of the document these entries come from and
+    ``until_date`` is the date they were cooked until.
+    """
+    chunks = [_HEADER.pack(_MAGIC, COOKED_CACHE_VERSION, key, until_date.toordinal())]
+    for account in accounts:
+        name = account.name.encode('utf-8')
+        balances = accounts.entries_for_account(account).balances()
+        chunks += [_RECORD.pack(len(name), len(balances)), name, balances]
+    os.makedirs(op.dirname(path), exist_ok=True)
+    tmppath = path + '.tmp'
+    with open(tmppath, 'wb') as fp:
+        fp.write(b''.join(chunks))
+    os.replace(tmppath, path)
+
+def read(path, key, accounts):
+    """Reads the cooked cache at ``path``.
+
+    Returns ``None`` if there's no cache or if it wasn't written for a document with the
+    :func:`content_hash` ``key``. Otherwise, returns ``(until_date, balances)`` with
+    ``balances`` mapping each account of ``accounts`` to the balances of its entries.
+    """
+    try:
+        with open(path, 'rb') as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    try:
+        magic, version, cached_key, until = _HEADER.unpack_from(data)
+    except struct.error:
+        return None
+    if (magic, version, cached_key) != (_MAGIC, COOKED_CACHE_VERSION, key):
+        return None
+    balances = {}
+    offset = _HEADER.size
+    while offset < len(data):
+        try:
+            namelen, size = _RECORD.unpack_from(data, offset)
+        except struct.error:
+            return None
+        offset += _RECORD.size
+        name = data[offset:offset+namelen].decode('utf-8')
+        offset += namelen
+        account = accounts.find(name)
+        if account is not None:
+            balances[account] = data[offset:offset+size]
+        offset += size
+    return datetime.date.fromordinal(until), balances
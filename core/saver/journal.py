@@ -0,0 +1,296 @@
+# Copyright 2019 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import os
+import os.path as op
+import xml.etree.cElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from ..model._ccore import dump_native_elements
+
+JOURNAL_SUFFIX = '-journal'
+# When the records of the journal grow bigger than this ratio of the document's size, and bigger
+# than JOURNAL_COMPACTION_MIN_SIZE, saving rewrites the document instead of committing the journal.
+JOURNAL_COMPACTION_RATIO = 0.5
+JOURNAL_COMPACTION_MIN_SIZE = 64 * 1024
+COMMIT_MARKER = b'<commit/>\n'
+ACTION_END = b'</action>\n'
+
+def journal_path(filename):
+    """Returns the path of the journal of the document at ``filename``."""
+    return str(filename) + JOURNAL_SUFFIX
+
+def _base_stat(filename):
+    st = os.stat(filename)
+    return str(st.st_size), str(st.st_mtime_ns)
+
+def discard(filename):
+    """Removes the journal of the document at ``filename``, if there's one."""
+    try:
+        os.remove(journal_path(filename))
+    except FileNotFoundError:
+        pass
+
+def read(filename):
+    """Reads the journal of the document at ``filename``.
+
+    Returns ``None`` if there's no journal, if it's unreadable or if it doesn't belong to the
+    document as it is on disk (for example, if the document was saved without it afterwards).
+    Otherwise, returns ``(header, actions, offset, end)``. ``header`` is the attributes of the
+    journal's header and ``actions`` is a list of ``action`` elements. ``offset`` is the size of the
+    committed part of the journal and ``end`` is the size of its complete records. Actions between
+    ``offset`` and ``end`` were logged by a session that didn't save them, most likely because it
+    crashed. A record that was cut short is ignored.
+    """
+    try:
+        with open(journal_path(filename), 'rb') as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    index = data.rfind(COMMIT_MARKER)
+    offset = index + len(COMMIT_MARKER) if index >= 0 else data.find(b'\n') + 1
+    index = data.rfind(ACTION_END)
+    end = max(offset, index + len(ACTION_END)) if index >= 0 else offset
+    try:
+        root = ET.fromstring(b'<journal>' + data[:end] + b'</journal>')
+    except ET.ParseError:
+        return None
+    if not len(root) or root[0].tag != 'header':
+        return None
+    header = root[0].attrib
+    try:
+        if (header.get('size'), header.get('mtime')) != _base_stat(filename):
+            return None
+    except OSError:
+        return None
+    actions = [element for element in root if element.tag == 'action']
+    return header, actions, offset, end
+
+class Journal:
+    """Append-only log of the changes made to a document since it was last written in full.
+
+    The journal lives next to the document in a sidecar file (see :func:`journal_path`) made of a
+    header followed by ``action`` records. Each record holds the new state of what changed: the
+    ``properties``, the ``account`` elements of new or changed accounts, the ``transaction`` elements
+    of new or changed transactions, the names of removed accounts, the ids of removed transactions
+    and, if any schedule changed, all ``recurrence`` elements. Elements are the same as in a native
+    document. :meth:`track` notes what actions touch and :meth:`flush` logs it, which the document
+    does whenever it changes. Only what was tracked is dumped. :meth:`commit` makes records durable
+    and marks them as saved. Loading a document replays its committed records and recovers the ones
+    that follow, which a crash kept from being either committed or discarded with
+    :meth:`rollback`.
+
+    Transactions have no identity of their own, so we give them ids: transactions of the document
+    on disk are numbered in the order they're written in it, and new transactions get the next
+    numbers. Same-date transactions are ordered by their ``position``, which is saved with them.
+    The header holds the positions of the document's transactions so that replays get the same
+    order we have.
+
+    Use :meth:`create` after the document was written in full and :meth:`resume` after it was
+    loaded along with its journal.
+    """
+    def __init__(
+            self, filename, properties, accounts, transactions, schedules, ids, next_id,
+            committed_size=None):
+        self.path = journal_path(filename)
+        self._filename = filename
+        self._properties = properties
+        self._accounts = accounts
+        self._transactions = transactions
+        self._schedules = schedules
+        self._ids = ids
+        self._next_id = next_id
+        self._pending = set()
+        # account -> whether it was changed, rather than only used by a changed transaction. Its
+        # order is the one in which new accounts are logged.
+        self._pending_accounts = {}
+        self._schedules_changed = False
+        self._logged_properties = dict(properties)
+        # account -> name it was last logged (or loaded) with
+        self._account_names = {a: a.name for a in accounts}
+        with open(self.path, 'rb') as fp:
+            self._header_size = len(fp.readline())
+            size = fp.seek(0, os.SEEK_END)
+        self._committed_size = size if committed_size is None else committed_size
+
+    # --- Private
+    def _track_accounts(self, accounts, changed=True):
+        for account in accounts:
+            if account is not None:
+                self._pending_accounts[account] = self._pending_accounts.get(account) or changed
+
+    def _track_transaction_accounts(self, transactions):
+        # Accounts are also created and removed along with the transactions that use them (see
+        # AccountList.find() and AccountList.clean_empty_categories()).
+        for txn in transactions:
+            self._track_accounts((split.account for split in txn.splits), changed=False)
+
+    def _is_present(self, account):
+        found = self._accounts.find(account.name)
+        if found is None:
+            return False
+        # find() also matches account numbers, so another account can shadow this one.
+        return found == account or any(a == account for a in self._accounts)
+
+    def _properties_record(self):
+        if self._properties == self._logged_properties:
+            return []
+        self._logged_properties = dict(self._properties)
+        attrib = {k: str(v) for k, v in self._properties.items()}
+        return [ET.tostring(ET.Element('properties', attrib)) + b'\n']
+
+    def _accounts_records(self):
+        if not self._pending_accounts:
+            return []
+        records = []
+        pending = self._pending_accounts
+        self._pending_accounts = {}
+        present, removed = [], []
+        for account, changed in pending.items():
+            logged = account in self._account_names
+            if self._is_present(account):
+                if changed or not logged:
+                    present.append(account)
+            elif logged:
+                removed.append(account)
+        for account, element in zip(present, dump_native_elements(present, [], [])):
+            oldname = self._account_names.get(account)
+            if oldname is None:
+                records.append(b'<set-account>' + element + b'</set-account>\n')
+            else:
+                records.append(
+                    b'<set-account name=' + quoteattr(oldname).encode('utf-8') + b'>'
+                    + element + b'</set-account>\n')
+            self._account_names[account] = account.name
+        for account in removed:
+            name = self._account_names.pop(account)
+            records.append(b'<remove-account name=' + quoteattr(name).encode('utf-8') + b'/>\n')
+        return records
+
+    def _transactions_records(self):
+        if not self._pending:
+            return []
+        records = []
+        present, removed = set(), []
+        for txn in self._pending:
+            # Imported transactions are copied into the list. We log the copy.
+            instance = self._transactions.instance(txn)
+            if instance is None:
+                removed.append(txn)
+            else:
+                present.add(instance)
+        self._pending = set()
+        self._track_transaction_accounts(present)
+        present = sorted(present, key=lambda t: (t.date, t.position))
+        for txn, element in zip(present, dump_native_elements([], present, [])):
+            txn_id = self._ids.get(txn)
+            if txn_id is None:
+                txn_id = self._ids[txn] = self._next_id
+                self._next_id += 1
+            records.append(
+                b'<set-transaction id="%d" position="%d">' % (txn_id, txn.position)
+                + element + b'</set-transaction>\n')
+        for txn in removed:
+            txn_id = self._ids.pop(txn, None)
+            if txn_id is not None:
+                records.append(b'<remove-transaction id="%d"/>\n' % txn_id)
+        return records
+
+    def _schedules_records(self):
+        if not self._schedules_changed:
+            return []
+        self._schedules_changed = False
+        self._track_transaction_accounts(schedule.ref for schedule in self._schedules)
+        element = b''.join(dump_native_elements([], [], self._schedules))
+        return [b'<schedules>' + element + b'</schedules>\n']
+
+    # --- Public
+    @classmethod
+    def create(cls, filename, properties, accounts, transactions, schedules):
+        """Starts a new, empty journal for the document at ``filename``.
+
+        ``filename`` must have just been written in full from the other arguments (or loaded from
+        them).
+        """
+        txns = list(transactions)
+        size, mtime = _base_stat(filename)
+        positions = ' '.join(str(t.position) for t in txns)
+        header = ET.Element('header', size=size, mtime=mtime, positions=positions)
+        with open(journal_path(filename), 'wb') as fp:
+            fp.write(ET.tostring(header) + b'\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+        ids = {txn: i for i, txn in enumerate(txns)}
+        return cls(filename, properties, accounts, transactions, schedules, ids, len(txns))
+
+    @classmethod
+    def resume(
+            cls, filename, properties, accounts, transactions, schedules, ids, next_id, offset,
+            end):
+        """Continues the journal the document at ``filename`` was loaded with.
+
+        ``ids``, ``next_id``, ``offset`` and ``end`` come from the replay (see :func:`read`).
+        Recovered records are kept, but not committed.
+        """
+        with open(journal_path(filename), 'r+b') as fp:
+            fp.truncate(end)
+        return cls(
+            filename, properties, accounts, transactions, schedules, ids, next_id,
+            committed_size=offset)
+
+    def track(self, action):
+        """Notes what ``action`` touches. It's logged on the next :meth:`flush`."""
+        txns = action.added_transactions | action.changed_transactions | action.deleted_transactions
+        self._pending |= txns
+        self._track_transaction_accounts(txns)
+        self._track_accounts(action.added_accounts)
+        self._track_accounts(action.changed_accounts)
+        self._track_accounts(action.deleted_accounts)
+        if action.added_schedules or action.changed_schedules or action.deleted_schedules:
+            self._schedules_changed = True
+
+    def flush(self):
+        """Appends a record of what changed since the last flush, if anything did."""
+        # Transactions and schedules go first because they add the accounts they use to the ones
+        # we log. Replays remove accounts first: by then, their transactions have been logged as
+        # changed or removed.
+        txn_records = self._transactions_records()
+        schedule_records = self._schedules_records()
+        records = self._properties_record() + self._accounts_records()
+        records += txn_records + schedule_records
+        if not records:
+            return
+        with open(self.path, 'ab') as fp:
+            fp.write(b'<action>\n' + b''.join(records) + ACTION_END)
+
+    def commit(self):
+        """Makes all flushed records durable and marks them as saved."""
+        self.flush()
+        with open(self.path, 'ab') as fp:
+            fp.write(COMMIT_MARKER)
+            fp.flush()
+            os.fsync(fp.fileno())
+            self._committed_size = fp.tell()
+
+    def rollback(self):
+        """Drops the records that weren't committed.
+
+        Call it when the document is closed without saving: they aren't part of it.
+        """
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(self._committed_size)
+
+    def needs_compaction(self):
+        """Whether the journal got big enough for the document to be rewritten instead.
+
+        Only records count: the header's size depends on the document's, not on its changes.
+        """
+        try:
+            records_size = op.getsize(self.path) - self._header_size
+            threshold = op.getsize(self._filename) * JOURNAL_COMPACTION_RATIO
+        except OSError:
+            return True
+        return records_size > max(threshold, JOURNAL_COMPACTION_MIN_SIZE)
@@ -6,12 +6,25 @@
 
 import os.path as op
 
-from ..model._ccore import save_native
+from ..model._ccore import dump_native, save_binary, save_native
 from core.util import ensure_folder
 
-def save(filename, document_id, properties, accounts, transactions, schedules):
+def save(filename, document_id, properties, accounts, transactions, schedules, binary=False):
+    """Writes the document to ``filename``.
+
+    If ``binary`` is true, the document is written in our compact binary format rather than in
+    XML. :class:`core.loader.native.Loader` reads both.
+    """
     ensure_folder(op.dirname(filename))
-    return save_native(
+    save_func = save_binary if binary else save_native
+    return save_func(
         filename, document_id, accounts, transactions, schedules,
         properties['default_currency'], properties['first_weekday'],
         properties['ahead_months'], properties['year_start_month'])
+
+def dump(document_id, properties, accounts, transactions, schedules):
+    """Returns the document as ``bytes``, in the same format as :func:`save`."""
+    return dump_native(
+        document_id, accounts, transactions, schedules,
+        properties['default_currency'], properties['first_weekday'],
+        properties['ahead_months'], properties['year_start_month'])
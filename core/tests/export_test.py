@@ -43,7 +43,8 @@ def test_export_only_current_date_range(app):
     expath = perform_export(app, options)
     loader = QIFLoader('USD')
     loader.parse(expath)
-    eq_(len(loader.blocks), 2) # 1 account + 1 entry
+    loader.load()
+    eq_(len(loader.transactions), 1)
 
 # ---
 def app_transaction_with_payee_and_checkno():
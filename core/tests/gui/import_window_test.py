@@ -85,6 +85,29 @@ def test_match_entries_by_date_and_amount(app):
     eq_(iwin.import_table[1].description, 'two')
     eq_(iwin.import_table[1].description_import, 'itwo')
 
+@with_app(TestApp)
+def test_match_entries_by_date_and_amount_picks_first_ref(app):
+    # When more than one ref is close enough to an imported entry, we bind the first one. Other
+    # imported entries can still be bound to the remaining refs.
+    app.add_account()
+    app.show_account()
+    app.add_entry(date='08/01/2019', description='one', increase='1')
+    app.add_entry(date='10/01/2019', description='two', increase='1')
+    TXNS = [
+        {'date': '09/01/2019', 'description': 'ione', 'amount': '1'},
+        {'date': '11/01/2019', 'description': 'itwo', 'amount': '1'},
+    ]
+    iwin = app.fake_import('foo', TXNS)
+    iwin.selected_target_account_index = 1
+    iwin.match_entries_by_date_and_amount(1)
+    eq_(len(iwin.import_table), 2)
+    eq_(iwin.import_table[0].description, 'one')
+    eq_(iwin.import_table[0].description_import, 'ione')
+    eq_(iwin.import_table[1].description, 'two')
+    eq_(iwin.import_table[1].description_import, 'itwo')
+    iwin.import_table.unbind(0)
+    eq_(len(iwin.import_table), 3)
+
 # ---
 def app_import_checkbook_qif():
     app = TestApp()
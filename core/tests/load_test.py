@@ -4,12 +4,14 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import os
 from datetime import date
 
 from .testutil import eq_, with_app
 
 from ..document import ScheduleScope
 from ..const import AccountType
+from ..loader import native
 from ..model.date import MonthRange
 from .base import compare_apps, TestApp, testdata
 
@@ -25,6 +27,19 @@ def test_dont_save_invalid_xml_characters(tmpdir):
     app.mw.load_from_xml(filepath) # no exception
     eq_(app.ttable[0].description, "foo bar")
 
+def test_save_replaces_file_without_leaving_temporary_file(tmpdir):
+    # Documents are written to a temporary file that then replaces the old document.
+    app = TestApp()
+    app.add_txn(description='foo')
+    filepath = str(tmpdir.join('foo.xml'))
+    app.doc.save_to_xml(filepath)
+    app.add_txn(description='bar')
+    app.doc.save_to_xml(filepath)
+    eq_(os.listdir(str(tmpdir)), ['foo.xml'])
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filepath)
+    eq_(len(list(newapp.doc.transactions)), 2)
+
 # ---
 class TestLoadFile:
     # Loads 'simple.moneyguru', a file with 2 accounts and 2 entries in each. Select the first entry.
@@ -447,6 +462,44 @@ def test_save_load(tmpdir, monkeypatch):
     app = app_account_and_group()
     check(app)
 
+def test_save_load_binary(tmpdir, monkeypatch):
+    # Documents in the binary format are loaded as they were saved and stay binary.
+    def check(app):
+        filepath = str(tmpdir.join('foo.moneyguru'))
+        app.doc.binary_format = True
+        app.doc.save_to_xml(filepath)
+        app.mw.close()
+        newapp = TestApp()
+        newapp.mw.load_from_xml(filepath)
+        assert newapp.doc.binary_format
+        newapp.drsel.set_date_range(app.doc.date_range)
+        newapp.doc._cook()
+        compare_apps(app.doc, newapp.doc)
+
+    check(app_transaction_with_payee_and_checkno())
+    check(app_transaction_with_memos())
+    check(app_account_with_apanel_attrs())
+    check(app_schedule_with_global_change(monkeypatch))
+    check(app_schedule_with_local_deletion(monkeypatch))
+
+def test_convert_binary_document_to_xml(tmpdir):
+    app = app_transaction_with_memos()
+    binpath = str(tmpdir.join('foo.moneyguru'))
+    xmlpath = str(tmpdir.join('foo.xml'))
+    app.doc.binary_format = True
+    app.doc.save_to_xml(binpath)
+    newapp = TestApp()
+    newapp.doc.load_from_xml(binpath)
+    newapp.doc.binary_format = False
+    newapp.doc.save_to_xml(xmlpath)
+    assert not native.is_binary(xmlpath)
+    assert os.path.getsize(binpath) < os.path.getsize(xmlpath)
+    newapp = TestApp()
+    newapp.mw.load_from_xml(xmlpath)
+    newapp.drsel.set_date_range(app.doc.date_range)
+    newapp.doc._cook()
+    compare_apps(app.doc, newapp.doc)
+
 def test_save_load_qif(tmpdir):
     def check(app):
         filepath = str(tmpdir.join('foo.qif'))
@@ -0,0 +1,44 @@
+# Copyright 2019 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import datetime
+
+from pytest import raises
+from ..testutil import eq_
+
+from ...loader.base import DATE_FORMATS, compile_date_format, guess_date_format, parse_date_str
+
+def test_compiled_format_parses_like_strptime():
+    samples = [
+        '01/02/07', '1/2/2007', '31/12/1999', '13/02/07', '2007/02/31', '04 Jan 2019', '4-jan-19',
+        '1.2.2007', '20070102', "01/02'07", ' 1/02/07', '01/02/07 ', '', 'foo',
+    ]
+    for date_format in DATE_FORMATS:
+        parse = compile_date_format(date_format)
+        for sample in samples:
+            try:
+                expected = datetime.datetime.strptime(sample, date_format).date()
+            except ValueError:
+                with raises(ValueError):
+                    parse(sample)
+            else:
+                eq_(parse(sample), expected)
+
+def test_compiled_format_falls_back_on_strptime():
+    # Directives we don't compile are left to strptime()
+    parse = compile_date_format('%Y-%m-%d %H:%M')
+    eq_(parse('2019-01-04 12:30'), datetime.date(2019, 1, 4))
+    with raises(ValueError):
+        parse('2019-01-04')
+
+def test_guess_date_format():
+    eq_(guess_date_format(['01/02/07', '02/28/07'], DATE_FORMATS), '%m/%d/%y')
+    eq_(guess_date_format(['01/02/07', '28/02/07'], DATE_FORMATS), '%d/%m/%y')
+    eq_(guess_date_format(['01/02/07', 'foo'], DATE_FORMATS), None)
+    eq_(guess_date_format([], DATE_FORMATS), None)
+
+def test_parse_date_str_fixes_typos_in_years():
+    eq_(parse_date_str('01/02/0207', '%m/%d/%Y'), datetime.date(2007, 1, 2))
@@ -8,6 +8,7 @@ from datetime import date
 
 from ..testutil import eq_
 
+from ...loader import csv as csv_loader
 from ...loader.csv import Loader, CsvField
 from ..base import testdata, Amount
 
@@ -91,3 +92,24 @@ def test_quoted_sep():
     loader = Loader('USD')
     loader.parse(testdata.filepath('csv/quoted_sep.csv'))
     eq_(len(loader.lines), 4)
+
+def test_lines_after_preview_are_loaded(tmpdir, monkeypatch):
+    # Only the first lines of big files are kept in `lines`. The rest is read when loading.
+    monkeypatch.setattr(csv_loader, 'PREVIEW_LINE_COUNT', 3)
+    filepath = str(tmpdir.join('big.csv'))
+    with open(filepath, 'wt') as fp:
+        fp.write('date;description;amount\n')
+        for day in range(1, 11):
+            fp.write('2018/01/{:02d};txn {};{}.00\n'.format(day, day, day))
+        fp.write('not a date;;\n')
+    loader = Loader('USD')
+    loader.parse(filepath)
+    eq_(len(loader.lines), 3)
+    assert loader.has_more_lines
+    loader.columns = [CsvField.Date, CsvField.Description, CsvField.Amount]
+    loader.lines = loader.lines[1:]
+    loader.load()
+    transactions = loader.transactions
+    eq_(len(transactions), 10)
+    eq_(transactions.last().date, date(2018, 1, 10))
+    eq_(transactions.last().description, 'txn 10')
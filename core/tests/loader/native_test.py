@@ -121,3 +121,130 @@ def test_unsupported_currency(loader):
     with raises(FileFormatError):
         loader.load()
 
+
+def test_elements_are_loaded_as_they_are_parsed(loader):
+    # The file is read incrementally: accounts, transactions and schedules are created while
+    # parsing. Transactions that are part of a recurrence aren't regular transactions.
+    content = b'''<moneyguru-file document_id="foo">
+    <account name="bar" currency="USD" type="asset" />
+    <transaction date="2008-01-01"><split account="bar" amount="42 USD" /></transaction>
+    <recurrence type="daily" every="1">
+    <transaction date="2008-01-02"><split account="bar" amount="12 USD" /></transaction>
+    </recurrence>
+    </moneyguru-file>'''
+    loader._parse(BytesIO(content))
+    eq_(loader.document_id, 'foo')
+    eq_([a.name for a in loader.accounts], ['bar'])
+    eq_(len(loader.transactions), 1)
+    eq_(len(loader.schedules), 1)
+    eq_(loader.schedules[0].ref.date, date(2008, 1, 2))
+
+def test_parse_truncated_file(loader):
+    content = b'<moneyguru-file><account name="bar" currency="USD" type="asset" />'
+    with raises(FileFormatError):
+        loader._parse(BytesIO(content))
+
+def test_parse_falls_back_on_python_loader(loader, tmpdir):
+    # When load_native() can't load a file, the python loader takes over and reports the error.
+    filepath = str(tmpdir.join('foo.moneyguru'))
+    with open(filepath, 'wb') as fp:
+        fp.write(b'<moneyguru-file><account name="bar" currency="USD" type="asset" />')
+    with raises(FileFormatError):
+        loader.parse(filepath)
+    eq_(len(loader.accounts), 0)
+
+def test_load_transaction_with_many_splits(loader, tmpdir):
+    # All splits of a transaction are loaded, not only the first one.
+    filepath = str(tmpdir.join('foo.moneyguru'))
+    with open(filepath, 'wb') as fp:
+        fp.write(b'''<moneyguru-file document_id="foo">
+        <account name="a" currency="USD" type="asset" />
+        <account name="b" currency="USD" type="expense" />
+        <account name="c" currency="USD" type="expense" />
+        <transaction date="2008-01-01">
+        <split account="a" amount="-42 USD" />
+        <split account="b" amount="30 USD" />
+        <split account="c" amount="12 USD" />
+        </transaction>
+        </moneyguru-file>''')
+    loader.parse(filepath)
+    loader.load()
+    [txn] = list(loader.transactions)
+    eq_([s.account.name for s in txn.splits], ['a', 'b', 'c'])
+    eq_([s.amount for s in txn.splits], [Amount(-42, 'USD'), Amount(30, 'USD'), Amount(12, 'USD')])
+
+def test_load_schedules(loader, tmpdir):
+    # Schedules, with their exceptions and global changes, are loaded by load_native() like the
+    # python loader does.
+    filepath = str(tmpdir.join('foo.moneyguru'))
+    with open(filepath, 'wb') as fp:
+        fp.write(b'''<moneyguru-file document_id="foo">
+        <account name="a" currency="USD" type="asset" />
+        <recurrence type="weekly" every="2" stop_date="2008-06-01">
+        <transaction date="2008-01-01" description="ref" payee="someone">
+        <split account="a" amount="42 USD" />
+        </transaction>
+        <exception date="2008-01-15" />
+        <change date="2008-01-29">
+        <transaction date="2008-01-30" description="changed">
+        <split account="a" amount="12 USD" />
+        </transaction>
+        </change>
+        </recurrence>
+        <recurrence type="daily" every="1">
+        <transaction date="2008-02-01"><split account="a" amount="1 USD" /></transaction>
+        </recurrence>
+        </moneyguru-file>''')
+    loader.parse(filepath)
+    loader.load()
+    pyloader = native.Loader('USD')
+    with open(filepath, 'rb') as fp:
+        pyloader._parse(fp)
+    pyloader.load()
+    eq_(len(loader.schedules), 2)
+    eq_(loader.schedules[0].ref.description, 'ref')
+    eq_(loader.schedules[0].stop_date, date(2008, 6, 1))
+    for s1, s2 in zip(loader.schedules, pyloader.schedules):
+        assert s1.check_eq(s2)
+
+@pytest.mark.parametrize('filename', [
+    'account_in_group.moneyguru',
+    'invalid_account_type.moneyguru',
+    'multi_currency.moneyguru',
+    'multiple_transfer_references.moneyguru',
+    'no_balance_account.moneyguru',
+    'off_currency_reconciliations.moneyguru',
+    'payee_description.moneyguru',
+    'simple.moneyguru',
+    'with_references1.moneyguru',
+    'with_references2.moneyguru',
+    'with_references3.moneyguru',
+])
+def test_load_native_same_as_python_loader(filename):
+    # The C loader and the python loader load documents identically.
+    Currencies.register('PLN', 'PLN')
+    filepath = testdata.filepath('moneyguru', filename)
+    cloader = native.Loader('USD')
+    cloader.parse(filepath)
+    cloader.load()
+    pyloader = native.Loader('USD')
+    with open(filepath, 'rb') as fp:
+        pyloader._parse(fp)
+    pyloader.load()
+    eq_(cloader.document_id, pyloader.document_id)
+    eq_(cloader.properties, pyloader.properties)
+    attrs = ('name', 'currency', 'type', 'groupname', 'reference', 'account_number', 'inactive', 'notes')
+    for a1, a2 in zip(cloader.accounts, pyloader.accounts):
+        eq_([getattr(a1, attr) for attr in attrs], [getattr(a2, attr) for attr in attrs])
+    eq_(len(cloader.accounts), len(pyloader.accounts))
+    eq_(len(cloader.transactions), len(pyloader.transactions))
+    for t1, t2 in zip(cloader.transactions, pyloader.transactions):
+        assert t1.check_eq(t2)
+        eq_((t1.notes, t1.mtime, t1.position), (t2.notes, t2.mtime, t2.position))
+        for s1, s2 in zip(t1.splits, t2.splits):
+            eq_(
+                (s1.memo, s1.reference, s1.reconciliation_date),
+                (s2.memo, s2.reference, s2.reconciliation_date))
+    eq_(len(cloader.schedules), len(pyloader.schedules))
+    for s1, s2 in zip(cloader.schedules, pyloader.schedules):
+        assert s1.check_eq(s2)
@@ -154,3 +154,31 @@ def test_ccstmtrs():
     eq_(account.name, '4XXXXXXXXXXXXXX9')
     entries = loader.accounts.entries_for_account(account)
     eq_(len(entries), 3)
+
+# ---
+def test_tags_split_across_chunks(tmpdir, monkeypatch):
+    # The file is fed to the parser in chunks that can end anywhere, even in the middle of a tag.
+    # Character entities are decoded.
+    monkeypatch.setattr(ofx, 'CHUNK_SIZE', 5)
+    filepath = str(tmpdir.join('chunks.ofx'))
+    with open(filepath, 'wt') as fp:
+        fp.write(
+            '<?OFX OFXHEADER="200" VERSION="211"?>\n'
+            '<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>CAD</CURDEF>\n'
+            '<BANKACCTFROM><BANKID>42</BANKID><ACCTID>12345</ACCTID></BANKACCTFROM>\n'
+            '<BANKTRANLIST><!-- first transaction -->\n'
+            '<STMTTRN><DTPOSTED>20190102</DTPOSTED><TRNAMT>-12.34</TRNAMT>'
+            '<FITID>ref1</FITID><NAME>AT&amp;T Wireless</NAME></STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+    loader = ofx.Loader('USD')
+    loader.parse(filepath)
+    loader.load()
+    [account] = loader.accounts
+    eq_(account.name, '12345')
+    eq_(account.currency, 'CAD')
+    [txn] = list(loader.transactions)
+    eq_(txn.date, date(2019, 1, 2))
+    eq_(txn.description, 'AT&T Wireless')
+    eq_(txn.splits[0].reference, 'ref1')
+    eq_(txn.splits[0].amount, Amount(-12.34, 'CAD'))
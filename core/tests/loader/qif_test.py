@@ -9,6 +9,7 @@ from datetime import date
 from ..testutil import eq_
 
 from ..base import TestApp, testdata, Amount
+from ...loader import qif
 from ...loader.qif import Loader
 from ...const import AccountType
 
@@ -92,6 +93,30 @@ def test_checkbook_values():
     assert transaction.splits[1].account is None
     eq_(transaction.splits[1].amount, Amount(80.00, 'USD'))
 
+def test_date_format_guessed_from_sample(monkeypatch):
+    # The date format is guessed from the first entries only, but all entries are loaded.
+    monkeypatch.setattr(qif, 'DATE_SAMPLE_SIZE', 1)
+    loader = Loader('USD')
+    loader.parse(testdata.filepath('qif', 'checkbook.qif'))
+    eq_(loader.parsing_date_format, '%m/%d/%y')
+    loader.load()
+    eq_(len(loader.transactions), 8)
+
+def test_date_format_guessed_again_when_sample_is_wrong(monkeypatch):
+    # When an entry's date doesn't fit the format guessed from the sample, we guess again from all
+    # dates rather than dropping the entry.
+    monkeypatch.setattr(qif, 'DATE_SAMPLE_SIZE', 1)
+    loader = Loader('USD')
+    loader.parse(testdata.filepath('qif', 'ddmmyy_ambiguous_first.qif'))
+    eq_(loader.parsing_date_format, '%m/%d/%y')
+    loader.load()
+    eq_(loader.parsing_date_format, '%d/%m/%y')
+    transactions = list(loader.transactions)
+    eq_(len(transactions), 2)
+    eq_(transactions[0].date, date(2007, 1, 22))
+    eq_(transactions[1].date, date(2007, 2, 1))
+    eq_(len(loader.accounts), 1)
+
 def test_missing_values():
     loader = Loader('USD')
     loader.parse(testdata.filepath('qif', 'missing_fields.qif'))
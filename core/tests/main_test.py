@@ -13,11 +13,14 @@ from .testutil import eq_, with_app
 
 from .base import ApplicationGUI, TestApp, testdata
 from ..app import Application
-from ..document import Document, AUTOSAVE_BUFFER_COUNT
+from ..document import Document
+from ..saver.autosave import AUTOSAVE_BUFFER_COUNT
+from ..saver import journal
 from ..exception import FileFormatError
 from ..gui.entry_table import EntryTable
 from ..loader import base, native
 from ..const import AccountType
+from ..model.currency import Currencies
 from ..model.date import MonthRange, QuarterRange, YearRange
 
 # --- No Setup
@@ -102,7 +105,7 @@ def test_load_empty(monkeypatch):
     # When loading an empty file (we mock it here), make sure no exception occur.
     app = TestApp()
     monkeypatch.setattr(base.Loader, 'parse', lambda self, filename: None)
-    monkeypatch.setattr(native.Loader, 'load', lambda self: None)
+    monkeypatch.setattr(native.Loader, 'load', lambda self, **kw: None)
     app.mw.load_from_xml('filename does not matter here')
 
 def test_modified_flag():
@@ -178,17 +181,124 @@ def test_autosave(app, tmpdir):
     app.app.autosave_interval = 2
     app.doc.step = 0
     app.add_entry() # no autosave
+    app.doc._autosaver.wait()
     eq_(len(os.listdir(cache_path)), 0)
     app.add_entry() # autosave!
+    app.doc._autosaver.wait()
     eq_(len(os.listdir(cache_path)), 1)
     assert app.doc.is_dirty
     app.app.autosave_interval = 1
     # test that the autosave file rotation works
     for i in range(AUTOSAVE_BUFFER_COUNT):
         app.add_entry() # triggers autosave
+        app.doc._autosaver.wait()
     # The extra autosave file has been deleted
     eq_(len(os.listdir(cache_path)), AUTOSAVE_BUFFER_COUNT)
 
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_file_can_be_loaded(app, tmpdir):
+    # The snapshot written in the background is a complete document.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.app.autosave_interval = 1
+    app.add_entry(description='foo')
+    app.doc._autosaver.wait()
+    name = sorted(os.listdir(cache_path))[-1]
+    newapp = TestApp()
+    newapp.doc.load_from_xml(os.path.join(cache_path, name))
+    [txn] = list(newapp.doc.transactions)
+    eq_(txn.description, 'foo')
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_journal_saves_are_replayed_on_load(app, tmpdir):
+    # With the journal on, saving after edits appends to the journal and loading replays it.
+    app.app.use_journal = True
+    filename = str(tmpdir.join('foo.moneyguru'))
+    app.add_entry(description='foo')
+    app.doc.save_to_xml(filename)
+    base_size = os.path.getsize(filename)
+    app.add_entry(description='bar')
+    app.add_account('baz')
+    app.doc.save_to_xml(filename)
+    eq_(os.path.getsize(filename), base_size)
+    assert os.path.exists(journal.journal_path(filename))
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filename)
+    eq_(sorted(t.description for t in newapp.doc.transactions), ['bar', 'foo'])
+    assert newapp.doc.accounts.find('baz') is not None
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_journal_recovers_unsaved_changes(app, tmpdir):
+    # Changes are logged as they're made. If the document isn't closed (it crashed), reopening it
+    # recovers the changes that weren't saved.
+    app.app.use_journal = True
+    filename = str(tmpdir.join('foo.moneyguru'))
+    app.add_entry(description='foo')
+    app.doc.save_to_xml(filename)
+    app.add_entry(description='bar')
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filename)
+    eq_(sorted(t.description for t in newapp.doc.transactions), ['bar', 'foo'])
+    assert newapp.doc.is_dirty()
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_journal_drops_unsaved_changes_on_close(app, tmpdir):
+    # Closing a document without saving it discards its unsaved changes from the journal.
+    app.app.use_journal = True
+    filename = str(tmpdir.join('foo.moneyguru'))
+    app.add_entry(description='foo')
+    app.doc.save_to_xml(filename)
+    app.add_entry(description='bar')
+    app.doc.close()
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filename)
+    eq_([t.description for t in newapp.doc.transactions], ['foo'])
+    assert not newapp.doc.is_dirty()
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_cooked_cache_restores_balances(app, tmpdir):
+    # Reopening a saved document restores its balances from the cooked cache.
+    app.app.cache_path = str(tmpdir.join('cache'))
+    app.app.use_cooked_cache = True
+    filename = str(tmpdir.join('foo.moneyguru'))
+    app.add_entry('1/10/2007', increase='42')
+    app.add_entry('2/10/2007', decrease='12')
+    app.doc.save_to_xml(filename)
+    newapp = TestApp(app=app.app)
+    newapp.doc.date_range = app.doc.date_range
+    newapp.doc.load_from_xml(filename)
+    def balances(doc):
+        entries = doc.accounts.entries_for_account(doc.accounts.find('Checking'))
+        return [e.balance for e in entries]
+
+    eq_(len(balances(newapp.doc)), 2)
+    eq_(balances(newapp.doc), balances(app.doc))
+    assert os.listdir(str(tmpdir.join('cache', 'cooked')))
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_cooked_cache_invalidated_by_new_rates(app, tmpdir):
+    # Converted balances depend on exchange rates. When we get new rates, the cached balances are
+    # cooked again.
+    app.app.cache_path = str(tmpdir.join('cache'))
+    app.app.use_cooked_cache = True
+    filename = str(tmpdir.join('foo.moneyguru'))
+    app.add_entry('1/10/2007', increase='42 USD')
+    app.doc.save_to_xml(filename)
+
+    def balance(doc):
+        [entry] = doc.accounts.entries_for_account(doc.accounts.find('Checking'))
+        return entry.balance
+
+    cached_balance = balance(app.doc)
+    Currencies.get_rates_db().set_CAD_value(date(2007, 10, 1), 'USD', 42)
+    newapp = TestApp(app=app.app)
+    newapp.doc.date_range = app.doc.date_range
+    newapp.doc.load_from_xml(filename)
+    newbalance = balance(newapp.doc)
+    assert newbalance != cached_balance
+    newapp.doc._cook()
+    eq_(balance(newapp.doc), newbalance)
+
 @with_app(app_one_empty_account_range_on_october_2007)
 def test_balance_recursion_limit(app):
     # Balance calculation don't cause recursion errors when there's a lot of them.
@@ -6,6 +6,8 @@
 
 from datetime import date
 
+from pytest import raises
+
 from ..testutil import eq_
 
 from ...const import AccountType
@@ -58,6 +60,33 @@ class TestOneAccount:
         # requested.
         eq_(entries.balance(date(2007, 12, 31), 'CAD'), Amount(20 * 1.1, 'CAD'))
 
+    def test_balance_series(self):
+        # balance_series() gives the same results as balance() for each date.
+        entries = self.accounts.entries_for_account(self.account)
+        dates = [date(2007, 12, 30), date(2007, 12, 31), date(2008, 1, 2), date(2008, 2, 1)]
+        for currency in ['USD', 'CAD']:
+            expected = [float(entries.balance(d, currency)) for d in dates]
+            eq_(list(entries.balance_series(dates, currency)), expected)
+
+    def test_balance_series_unsorted_dates(self):
+        entries = self.accounts.entries_for_account(self.account)
+        with raises(ValueError):
+            entries.balance_series([date(2008, 1, 2), date(2008, 1, 1)], 'USD')
+
+    def test_sum_balance_series(self):
+        other = self.accounts.create('Other', 'CAD', AccountType.Asset)
+        txn = Transaction(date(2008, 1, 2), account=other, amount=Amount(10, 'CAD'))
+        self.oven._transactions.add(txn)
+        self.oven.cook(date.min, date.max)
+        dates = [date(2007, 12, 31), date(2008, 1, 2)]
+        accounts = [self.account, other]
+        expected = [
+            float(sum(self.accounts.entries_for_account(a).balance(d, 'CAD') for a in accounts))
+            for d in dates
+        ]
+        eq_(list(self.accounts.sum_balance_series(accounts, dates, 'CAD')), expected)
+        eq_(list(self.accounts.sum_balance_series([], dates, 'CAD')), [0, 0])
+
     def test_cash_flow(self):
         entries = self.accounts.entries_for_account(self.account)
         range = MonthRange(date(2008, 1, 1))
@@ -66,6 +95,22 @@ class TestOneAccount:
         # Each entry is converted using the entry's day rate.
         eq_(entries.cash_flow(range, 'CAD'), Amount(201.40, 'CAD'))
 
+    def test_cash_flow_after_rates_change(self):
+        # Converted sums are cached, but changing rates invalidates them.
+        entries = self.accounts.entries_for_account(self.account)
+        range = MonthRange(date(2008, 1, 1))
+        eq_(entries.cash_flow(range, 'CAD'), Amount(201.40, 'CAD'))
+        Currencies.get_rates_db().set_CAD_value(date(2008, 1, 2), 'USD', 0.6)
+        eq_(entries.cash_flow(range, 'CAD'), Amount(191.40, 'CAD'))
+
+    def test_cash_flow_partial_ranges(self):
+        entries = self.accounts.entries_for_account(self.account)
+        # Only the 2007-12-31 entry
+        eq_(entries.cash_flow(MonthRange(date(2007, 12, 1)), 'USD'), Amount(20, 'USD'))
+        # No entry in range
+        eq_(entries.cash_flow(MonthRange(date(2008, 2, 1)), 'USD'), Amount(0, 'USD'))
+        eq_(entries.cash_flow(MonthRange(date(2007, 11, 1)), 'CAD'), Amount(0, 'CAD'))
+
 def test_accountlist_contains():
     # AccountList membership is based on account name, not Account instances.
     # Account name tests are exact though, so it's not the exact same thing
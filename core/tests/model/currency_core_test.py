@@ -107,6 +107,14 @@ def test_set_rate_after_get_the_day_after():
     rate = Currencies.get_rates_db().get_rate(date(2008, 4, 21), 'CAD', 'USD')
     assert_almost_equal(rate, 42, places=2)
 
+def test_new_db_forgets_rates_of_previous_one():
+    # Rates that were looked up in a previous DB don't leak into a new one.
+    setup_daily_rate()
+    Currencies.get_rates_db().get_rate(date(2008, 4, 20), 'CAD', 'USD')
+    Currencies.set_rates_db(RatesDB())
+    rate = Currencies.get_rates_db().get_rate(date(2008, 4, 20), 'CAD', 'USD')
+    assert_almost_equal(rate, 1 / 1.0128, places=6)
+
 # --- Two daily rates
 def setup_two_daily_rate():
     # Don't change the set order, it's important for the tests
@@ -144,6 +152,19 @@ def test_seek_rate_before():
     rate = Currencies.get_rates_db().get_rate(date(2008, 4, 19), 'USD', 'CAD')
     assert_almost_equal(rate, 1 / 0.996115, places=6)
 
+def test_set_rates_in_batch():
+    # set_CAD_values() writes a whole batch of rates at once.
+    setup_two_daily_rate()
+    Currencies.get_rates_db().get_rate(date(2008, 4, 22), 'USD', 'CAD') # fill the rates cache
+    Currencies.get_rates_db().set_CAD_values('USD', [
+        (date(2008, 4, 21), 1/42),
+        (date(2008, 4, 30), 1/43),
+    ])
+    rate = Currencies.get_rates_db().get_rate(date(2008, 4, 22), 'CAD', 'USD')
+    assert_almost_equal(rate, 42, places=2)
+    dr = Currencies.get_rates_db().date_range('USD')
+    eq_(dr, (date(2008, 4, 20), date(2008, 4, 30)))
+
 # --- Rates of multiple currencies
 def setup_rates_of_multiple_currencies():
     Currencies.get_rates_db().set_CAD_value(date(2008, 4, 20), 'USD', 1/0.996115)
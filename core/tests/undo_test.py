@@ -14,7 +14,9 @@ from .testutil import eq_, with_app
 
 from ..const import PaneType
 from ..document import ScheduleScope
+from ..model import oven
 from ..model.date import MonthRange
+from ..model.undo import Action
 from .base import compare_apps, testdata, TestApp
 
 class bag: pass
@@ -705,3 +707,86 @@ def test_reconcile_spawn_by_toggling(app, checkstate):
     app.aview.toggle_reconciliation_mode()
     app.etable[0].toggle_reconciled()
     checkstate()
+
+@with_app(TestApp)
+def test_undo_recooks_from_earliest_affected_date(app):
+    # Undoing a change recooks only from the earliest date it affects, which yields correct running
+    # balances in the affected account.
+    app.add_account('checking')
+    app.show_account()
+    app.add_entry('01/01/2008', transfer='foo', increase='10')
+    app.add_entry('02/01/2008', transfer='foo', increase='20')
+    app.add_entry('03/01/2008', transfer='foo', increase='40')
+    app.etable.select([1])
+    app.etable[1].increase = '30'
+    app.etable.save_edits()
+    eq_(app.balances(), ['10.00', '40.00', '80.00', '+80.00'])
+    from_date, accounts = app.doc._undoer.undo()
+    eq_(from_date, date(2008, 1, 2))
+    eq_({a.name for a in accounts}, {'checking', 'foo'})
+    app.doc._undoer.redo()
+    app.mw.undo()
+    eq_(app.balances(), ['10.00', '30.00', '70.00', '+70.00'])
+    app.mw.redo()
+    eq_(app.balances(), ['10.00', '40.00', '80.00', '+80.00'])
+
+@with_app(TestApp)
+def test_undo_recooks_only_affected_accounts(app, monkeypatch):
+    # Undoing a change leaves the entries of accounts it doesn't touch alone. Accounts receiving
+    # schedule spawns are always recooked because those spawns are re-created.
+    app.add_account('checking')
+    app.show_account()
+    app.add_entry('01/01/2008', transfer='foo', increase='10')
+    app.add_entry('02/01/2008', transfer='foo', increase='20')
+    app.add_account('savings')
+    app.show_account()
+    app.add_entry('01/01/2008', transfer='bar', increase='100')
+    app.add_entry('03/01/2008', transfer='bar', increase='200')
+    app.show_account('checking')
+    app.etable.select([1])
+    app.etable[1].increase = '30'
+    app.etable.save_edits()
+    cooked_accounts = []
+    oven_cook_txns = oven.oven_cook_txns
+
+    def spy(*args):
+        cooked_accounts.append(args[5])
+        return oven_cook_txns(*args)
+
+    monkeypatch.setattr(oven, 'oven_cook_txns', spy)
+    app.mw.undo()
+    eq_({a.name for a in cooked_accounts[-1]}, {'checking', 'foo'})
+    eq_(app.balances(), ['10.00', '30.00', '+30.00'])
+    app.add_schedule(start_date='02/01/2008', account='savings', amount='1', repeat_every=7)
+    app.show_account('checking')
+    app.etable.select([1])
+    app.etable[1].increase = '30'
+    app.etable.save_edits()
+    app.mw.undo()
+    eq_({a.name for a in cooked_accounts[-1]}, {'checking', 'foo', 'savings'})
+    eq_(app.balances(), ['10.00', '30.00', '+30.00'])
+    app.show_account('savings')
+    eq_(app.balances()[:4], ['100.00', '101.00', '301.00', '302.00'])
+
+@with_app(TestApp)
+def test_undo_schedule_deletion_dirty_from_global_change(app, monkeypatch):
+    # The dirty range of a removed schedule starts at its earliest global change when that change
+    # was moved before the schedule's start date.
+    monkeypatch.patch_today(2008, 9, 30)
+    app.add_account('checking')
+    app.show_account()
+    app.add_entry('20/09/2008', transfer='foo', increase='10')
+    app.add_schedule(start_date='13/09/2008', account='checking', amount='1', repeat_every=3)
+    app.show_tview()
+    app.ttable.select([1])
+    app.ttable[1].date = '05/09/2008'
+    app.doc_gui.query_for_schedule_scope_result = ScheduleScope.Global
+    app.ttable.save_edits()
+    schedule = app.doc.schedules[0]
+    action = Action('')
+    action.change_transactions(list(app.doc.transactions), app.doc.schedules)
+    action.deleted_schedules.add(schedule)
+    app.doc._undoer.record(action)
+    app.doc.schedules.remove(schedule)
+    from_date, accounts = app.doc._undoer.undo()
+    eq_(from_date, date(2008, 9, 5))